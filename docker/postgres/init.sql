@@ -1,6 +1,5 @@
 CREATE DATABASE auth_db;
 CREATE DATABASE catalog_db;
 CREATE DATABASE order_db;
+CREATE DATABASE order_db_1;
 CREATE DATABASE analytics_db;
-
-
@@ -0,0 +1,174 @@
+"""Сквозной замер цепочки заказ → резервирование склада → статус заказа → аналитика без RabbitMQ.
+
+Consumer-ы catalog-, order- и analytics-service запускаются в одном процессе
+на общем брокере в памяти (MESSAGE_TRANSPORT=memory), поэтому замер
+показывает стоимость кода сервисов и их БД, а не брокера. Нужен PostgreSQL с
+применёнными миграциями трёх сервисов; скрипт создаёт книги, склад и заказы
+benchmark-прогона, поэтому запускайте его на отдельных БД:
+
+    python scripts/pipeline_benchmark.py --orders 5000 --concurrency 2
+
+БД берутся из CATALOG_DB_URL, ORDER_DB_URL и ANALYTICS_DB_URL (как в env.example).
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import importlib
+import logging
+import os
+import random
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Sequence
+
+ROOT = Path(__file__).resolve().parents[1]
+SERVICES = ("catalog_service", "order_service", "analytics_service")
+
+
+def load_services(database_urls: Dict[str, str]) -> Dict[str, SimpleNamespace]:
+    """Импортировать сервисы по очереди: каждый кэширует настройки со своей DATABASE_URL."""
+
+    os.environ["MESSAGE_TRANSPORT"] = "memory"
+    services = {}
+    for name in SERVICES:
+        sys.path.insert(0, str(ROOT / "services" / name / "src"))
+        os.environ["DATABASE_URL"] = database_urls[name]
+        services[name] = SimpleNamespace(
+            **{module: importlib.import_module(f"{name}.{module}") for module in ("db", "models", "message_bus")},
+            config=importlib.import_module(f"{name}.config"),
+            logging=importlib.import_module(f"{name}.core.logging"),
+            transport=importlib.import_module(f"{name}.core.transport"),
+        )
+    # У каждого сервиса своя копия core.transport — подключаем их к одному брокеру
+    broker = services["catalog_service"].transport.get_memory_broker()
+    for service in services.values():
+        service.transport.set_memory_broker(broker)
+    return services
+
+
+async def seed_books(catalog: SimpleNamespace, count: int, quantity: int) -> List[int]:
+    async with catalog.db.AsyncSessionLocal() as session:
+        books = [catalog.models.Book(title=f"benchmark-{index}", price=10) for index in range(count)]
+        session.add_all(books)
+        await session.flush()
+        session.add_all([catalog.models.Stock(book_id=book.id, quantity=quantity) for book in books])
+        await session.commit()
+        return [book.id for book in books]
+
+
+async def seed_orders(order: SimpleNamespace, count: int, users: int, book_ids: Sequence[int]) -> List[Dict[str, Any]]:
+    """Заказы в БД order-service и payload их событий — тот же, что публикует POST /orders."""
+
+    rng = random.Random(0)
+    payloads = []
+    for index in range(count):
+        user_id = 1_000_000 + index % users
+        items = [
+            {"book_id": book_id, "quantity": rng.randint(1, 3), "price": 10.0}
+            for book_id in rng.sample(list(book_ids), k=min(2, len(book_ids)))
+        ]
+        total_amount = sum(item["quantity"] * item["price"] for item in items)
+        async with order.db.session_for_user(user_id) as session:
+            record = order.models.Order(
+                user_id=user_id,
+                total_amount=total_amount,
+                status=order.models.OrderStatus.CREATED.value,
+            )
+            session.add(record)
+            await session.flush()
+            payloads.append(
+                {
+                    "order_id": record.id,
+                    "user_id": user_id,
+                    "total_amount": total_amount,
+                    "created_at": record.created_at.isoformat(),
+                    "items": items,
+                }
+            )
+            await session.commit()
+    return payloads
+
+
+def publish_orders(order: SimpleNamespace, payloads: Sequence[Dict[str, Any]]) -> None:
+    client = order.message_bus.get_rabbitmq_client()
+    for payload in payloads:
+        client.publish_event("order.created", payload)
+        client.publish_event("stock.reserve.request", payload)
+
+
+async def run(args: argparse.Namespace, services: Dict[str, SimpleNamespace]) -> int:
+    catalog, order, analytics = (services[name] for name in SERVICES)
+    book_ids = await seed_books(catalog, args.books, quantity=args.orders * 3)
+    payloads = await seed_orders(order, args.orders, args.users, book_ids)
+
+    loop = asyncio.get_running_loop()
+    consumers = [
+        consumer(loop)
+        for consumer in (
+            catalog.message_bus.StockReserveConsumer,
+            order.message_bus.OrderStatusConsumer,
+            analytics.message_bus.AnalyticsConsumer,
+        )
+        for _ in range(args.concurrency)
+    ]
+    for consumer in consumers:
+        consumer.start()
+    while any(consumer.stats.depth_checked_at is None for consumer in consumers):
+        await asyncio.sleep(0.01)
+
+    broker = catalog.transport.get_memory_broker()
+    started = time.perf_counter()
+    await asyncio.to_thread(publish_orders, order, payloads)
+    idle = await asyncio.to_thread(broker.wait_idle, args.timeout)
+    elapsed = time.perf_counter() - started
+
+    counters = broker.counters
+    print(
+        f"{len(payloads)} orders in {elapsed:.2f}s: {len(payloads) / elapsed:.0f} orders/s, "
+        f"{counters['delivered'] / elapsed:.0f} deliveries/s "
+        f"(delivered {counters['delivered']}, redelivered {counters['redelivered']}, "
+        f"dead-lettered {counters['dead_lettered']})"
+    )
+    channel = broker.connect().channel()
+    for consumer in consumers[:: args.concurrency]:
+        depths = consumer.queue.depth(channel)
+        print(f"  {consumer.queue.name}: parked {depths[consumer.queue.parking_queue][0]}")
+    if not idle:
+        print(f"pipeline did not drain in {args.timeout}s: {broker.pending()} messages pending")
+        return 1
+    return 0
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Сквозной замер цепочки событий на брокере в памяти")
+    parser.add_argument("--orders", type=int, default=1000)
+    parser.add_argument("--books", type=int, default=50)
+    parser.add_argument("--users", type=int, default=100, help="разных покупателей")
+    parser.add_argument("--concurrency", type=int, default=1, help="consumer-ов каждой очереди")
+    parser.add_argument("--timeout", type=float, default=300.0, help="секунд на обработку всех сообщений")
+    parser.add_argument("--catalog-db", default=os.environ.get("CATALOG_DB_URL"))
+    parser.add_argument("--order-db", default=os.environ.get("ORDER_DB_URL"))
+    parser.add_argument("--analytics-db", default=os.environ.get("ANALYTICS_DB_URL"))
+    parser.add_argument("--log-level", default="WARNING", help="журнал сервисов; INFO пишет строку на сообщение")
+    args = parser.parse_args(argv)
+    database_urls = {
+        "catalog_service": args.catalog_db,
+        "order_service": args.order_db,
+        "analytics_service": args.analytics_db,
+    }
+    missing = [name for name, url in database_urls.items() if not url]
+    if missing:
+        parser.error(f"database URL is not set for: {', '.join(missing)}")
+
+    services = load_services(database_urls)
+    services["catalog_service"].logging.setup_logging()
+    logging.getLogger().setLevel(args.log_level)
+    raise SystemExit(asyncio.run(run(args, services)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+from alembic import op
+
+
+revision = "0002_events_unique_idempotency"
+down_revision = "0001_init"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Убираем дубликаты, накопившиеся от повторных доставок, оставляя первую запись
+    op.execute(
+        """
+        DELETE FROM events e
+        USING events d
+        WHERE e.routing_key = d.routing_key
+          AND e.idempotency_key = d.idempotency_key
+          AND e.id > d.id
+        """
+    )
+    op.create_unique_constraint(
+        "uq_events_routing_key_idempotency_key",
+        "events",
+        ["routing_key", "idempotency_key"],
+    )
+    # Уникальный индекс начинается с routing_key и заменяет отдельный индекс
+    op.drop_index("ix_events_routing_key", table_name="events")
+
+
+def downgrade() -> None:
+    op.create_index("ix_events_routing_key", "events", ["routing_key"])
+    op.drop_constraint("uq_events_routing_key_idempotency_key", "events", type_="unique")
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0003_sales_rollups"
+down_revision = "0002_events_unique_idempotency"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "order_rollups",
+        sa.Column("granularity", sa.String(length=8), primary_key=True),
+        sa.Column("bucket_start", sa.DateTime(timezone=True), primary_key=True),
+        sa.Column("orders", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("revenue", sa.Numeric(14, 2), nullable=False, server_default="0"),
+        sa.Column("units", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("reserve_succeeded", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("reserve_failed", sa.Integer, nullable=False, server_default="0"),
+    )
+    op.create_table(
+        "book_sales_rollups",
+        sa.Column("granularity", sa.String(length=8), primary_key=True),
+        sa.Column("bucket_start", sa.DateTime(timezone=True), primary_key=True),
+        sa.Column("book_id", sa.Integer, primary_key=True),
+        sa.Column("orders", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("units", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("revenue", sa.Numeric(14, 2), nullable=False, server_default="0"),
+    )
+
+    # Роллапы по уже накопленным событиям
+    for granularity in ("hour", "day"):
+        op.execute(
+            f"""
+            INSERT INTO order_rollups (granularity, bucket_start, orders, revenue, units, reserve_succeeded, reserve_failed)
+            SELECT '{granularity}', date_trunc('{granularity}', occurred_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+                   count(*) FILTER (WHERE routing_key = 'order.created'),
+                   coalesce(sum((payload::jsonb ->> 'total_amount')::numeric) FILTER (WHERE routing_key = 'order.created'), 0),
+                   coalesce(sum((
+                       SELECT sum((item ->> 'quantity')::int)
+                       FROM jsonb_array_elements(coalesce(payload::jsonb -> 'items', '[]'::jsonb)) AS item
+                   )) FILTER (WHERE routing_key = 'order.created'), 0),
+                   count(*) FILTER (WHERE routing_key = 'stock.reserve.succeeded'),
+                   count(*) FILTER (WHERE routing_key = 'stock.reserve.failed')
+            FROM events
+            WHERE routing_key IN ('order.created', 'stock.reserve.succeeded', 'stock.reserve.failed')
+            GROUP BY 2
+            """
+        )
+        op.execute(
+            f"""
+            INSERT INTO book_sales_rollups (granularity, bucket_start, book_id, orders, units, revenue)
+            SELECT '{granularity}', date_trunc('{granularity}', e.occurred_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+                   (item ->> 'book_id')::int,
+                   count(*),
+                   coalesce(sum((item ->> 'quantity')::int), 0),
+                   coalesce(sum((item ->> 'quantity')::int * (item ->> 'price')::numeric), 0)
+            FROM events e, jsonb_array_elements(coalesce(e.payload::jsonb -> 'items', '[]'::jsonb)) AS item
+            WHERE e.routing_key = 'order.created' AND item ->> 'book_id' IS NOT NULL
+            GROUP BY 2, 3
+            """
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("book_sales_rollups")
+    op.drop_table("order_rollups")
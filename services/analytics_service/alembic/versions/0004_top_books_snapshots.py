@@ -0,0 +1,23 @@
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0004_top_books_snapshots"
+down_revision = "0003_sales_rollups"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "top_books_snapshots",
+        sa.Column("window_name", sa.String(length=8), primary_key=True),
+        sa.Column("taken_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("state", sa.JSON, nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("top_books_snapshots")
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+from alembic import op
+
+
+revision = "0005_partition_events"
+down_revision = "0004_top_books_snapshots"
+branch_labels = None
+depends_on = None
+
+
+# Суточные партиции создаются от первого события (но не раньше срока хранения
+# по умолчанию — 90 дней) до сегодняшнего дня + запас; более старые события
+# попадают в events_default и удаляются политикой хранения. Дальнейшие
+# партиции досоздаёт analytics_service.partitions.
+CREATE_DAY_PARTITIONS = """
+DO $$
+DECLARE
+    first_day date := greatest(
+        coalesce((SELECT min(occurred_at) FROM events_legacy), now()) AT TIME ZONE 'UTC',
+        now() AT TIME ZONE 'UTC' - interval '90 days'
+    )::date;
+    last_day date := (now() AT TIME ZONE 'UTC' + interval '7 days')::date;
+    d date := first_day;
+BEGIN
+    WHILE d <= last_day LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF events FOR VALUES FROM (%L) TO (%L)',
+            'events_p' || to_char(d, 'YYYY_MM_DD'),
+            d::timestamp AT TIME ZONE 'UTC',
+            (d + 1)::timestamp AT TIME ZONE 'UTC'
+        );
+        d := d + 1;
+    END LOOP;
+END $$;
+"""
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE events RENAME TO events_legacy")
+    op.execute("ALTER TABLE events_legacy RENAME CONSTRAINT events_pkey TO events_legacy_pkey")
+    op.execute(
+        "ALTER TABLE events_legacy RENAME CONSTRAINT uq_events_routing_key_idempotency_key "
+        "TO uq_events_legacy_routing_key_idempotency_key"
+    )
+    # Последовательность id переживает удаление старой таблицы
+    op.execute("ALTER SEQUENCE events_id_seq OWNED BY NONE")
+    op.execute("ALTER SEQUENCE events_id_seq AS bigint")
+
+    op.execute(
+        """
+        CREATE TABLE events (
+            id bigint NOT NULL DEFAULT nextval('events_id_seq'),
+            routing_key varchar(128) NOT NULL,
+            idempotency_key varchar(64) NOT NULL,
+            occurred_at timestamptz NOT NULL,
+            payload json NOT NULL,
+            CONSTRAINT events_pkey PRIMARY KEY (id, occurred_at),
+            CONSTRAINT uq_events_routing_key_idempotency_key UNIQUE (routing_key, idempotency_key, occurred_at)
+        ) PARTITION BY RANGE (occurred_at)
+        """
+    )
+    # BRIN по времени: события пишутся почти по порядку, индекс занимает килобайты
+    op.execute("CREATE INDEX ix_events_occurred_at_brin ON events USING brin (occurred_at)")
+    op.execute("CREATE TABLE events_default PARTITION OF events DEFAULT")
+
+    op.execute(CREATE_DAY_PARTITIONS)
+
+    op.execute(
+        """
+        INSERT INTO events (id, routing_key, idempotency_key, occurred_at, payload)
+        SELECT id, routing_key, idempotency_key, occurred_at, payload FROM events_legacy
+        """
+    )
+
+    op.execute("DROP TABLE events_legacy")
+    op.execute("ALTER SEQUENCE events_id_seq OWNED BY events.id")
+
+
+def downgrade() -> None:
+    op.execute("ALTER SEQUENCE events_id_seq OWNED BY NONE")
+    op.execute("ALTER TABLE events RENAME TO events_partitioned")
+    op.execute("ALTER TABLE events_partitioned RENAME CONSTRAINT events_pkey TO events_partitioned_pkey")
+    op.execute(
+        "ALTER TABLE events_partitioned RENAME CONSTRAINT uq_events_routing_key_idempotency_key "
+        "TO uq_events_partitioned_routing_key_idempotency_key"
+    )
+
+    op.execute(
+        """
+        CREATE TABLE events (
+            id integer NOT NULL DEFAULT nextval('events_id_seq') PRIMARY KEY,
+            routing_key varchar(128) NOT NULL,
+            idempotency_key varchar(64) NOT NULL,
+            occurred_at timestamptz NOT NULL,
+            payload json NOT NULL,
+            CONSTRAINT uq_events_routing_key_idempotency_key UNIQUE (routing_key, idempotency_key)
+        )
+        """
+    )
+    op.execute("CREATE INDEX ix_events_idempotency_key ON events (idempotency_key)")
+    # Одно и то же событие могло сохраниться с разным occurred_at только при
+    # повторной публикации с новым timestamp — оставляем первую запись
+    op.execute(
+        """
+        INSERT INTO events (id, routing_key, idempotency_key, occurred_at, payload)
+        SELECT DISTINCT ON (routing_key, idempotency_key) id, routing_key, idempotency_key, occurred_at, payload
+        FROM events_partitioned
+        ORDER BY routing_key, idempotency_key, id
+        """
+    )
+    op.execute("DROP TABLE events_partitioned")
+    op.execute("ALTER SEQUENCE events_id_seq AS integer")
+    op.execute("ALTER SEQUENCE events_id_seq OWNED BY events.id")
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+from alembic import op
+
+
+revision = "0006_events_jsonb_indexed_fields"
+down_revision = "0005_partition_events"
+branch_labels = None
+depends_on = None
+
+
+def _int_field(name: str) -> str:
+    # Берём поле с верхнего уровня или из original (stock.reserve.*); нечисловые значения — NULL
+    value = f"coalesce(payload ->> '{name}', payload -> 'original' ->> '{name}')"
+    return f"CASE WHEN {value} ~ '^-?[0-9]{{1,9}}$' THEN ({value})::integer END"
+
+
+def upgrade() -> None:
+    # ALTER на партиционированной таблице применяется ко всем партициям
+    op.execute("ALTER TABLE events ALTER COLUMN payload TYPE jsonb USING payload::jsonb")
+    op.execute("ALTER TABLE events ADD COLUMN order_id integer")
+    op.execute("ALTER TABLE events ADD COLUMN user_id integer")
+    op.execute("ALTER TABLE events ADD COLUMN total_amount numeric(10, 2)")
+
+    amount = "coalesce(payload ->> 'total_amount', payload -> 'original' ->> 'total_amount')"
+    op.execute(
+        f"""
+        UPDATE events SET
+            order_id = {_int_field('order_id')},
+            user_id = {_int_field('user_id')},
+            total_amount = CASE
+                WHEN {amount} ~ '^-?[0-9]{{1,8}}(\\.[0-9]+)?$' THEN round(({amount})::numeric, 2)
+            END
+        """
+    )
+
+    op.execute(
+        "CREATE INDEX ix_events_order_id_occurred_at ON events (order_id, occurred_at) WHERE order_id IS NOT NULL"
+    )
+    op.execute(
+        "CREATE INDEX ix_events_user_id_occurred_at ON events (user_id, occurred_at) WHERE user_id IS NOT NULL"
+    )
+    op.execute("CREATE INDEX ix_events_payload_gin ON events USING gin (payload jsonb_path_ops)")
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX ix_events_payload_gin")
+    op.execute("DROP INDEX ix_events_user_id_occurred_at")
+    op.execute("DROP INDEX ix_events_order_id_occurred_at")
+    op.execute("ALTER TABLE events DROP COLUMN total_amount")
+    op.execute("ALTER TABLE events DROP COLUMN user_id")
+    op.execute("ALTER TABLE events DROP COLUMN order_id")
+    op.execute("ALTER TABLE events ALTER COLUMN payload TYPE json USING payload::json")
@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from typing import Dict
+
+from alembic import op
+import sqlalchemy as sa
+
+from analytics_service.sketches import HyperLogLog
+
+
+revision = "0007_daily_unique_buyers"
+down_revision = "0006_events_jsonb_indexed_fields"
+branch_labels = None
+depends_on = None
+
+PRECISION = 14
+
+
+def upgrade() -> None:
+    table = op.create_table(
+        "daily_unique_buyers",
+        sa.Column("day", sa.Date, primary_key=True),
+        sa.Column("registers", sa.LargeBinary, nullable=False),
+    )
+
+    # Сводки по уже накопленным заказам: по одной паре (день, пользователь)
+    sketches: Dict[object, HyperLogLog] = defaultdict(lambda: HyperLogLog(PRECISION))
+    result = op.get_bind().execution_options(stream_results=True, yield_per=10000).execute(
+        sa.text(
+            """
+            SELECT DISTINCT (occurred_at AT TIME ZONE 'UTC')::date AS day, user_id
+            FROM events
+            WHERE routing_key = 'order.created' AND user_id IS NOT NULL
+            """
+        )
+    )
+    for day, user_id in result:
+        sketches[day].add(user_id)
+    if sketches:
+        op.bulk_insert(table, [{"day": day, "registers": sketch.to_bytes()} for day, sketch in sketches.items()])
+
+
+def downgrade() -> None:
+    op.drop_table("daily_unique_buyers")
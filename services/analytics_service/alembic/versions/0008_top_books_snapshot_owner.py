@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0008_top_books_snapshot_owner"
+down_revision = "0007_daily_unique_buyers"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Снапшот единственного до сих пор экземпляра остаётся как снапшот «чужого» процесса
+    op.add_column(
+        "top_books_snapshots",
+        sa.Column("owner", sa.String(length=128), nullable=False, server_default="legacy"),
+    )
+    op.alter_column("top_books_snapshots", "owner", server_default=None)
+    op.drop_constraint("top_books_snapshots_pkey", "top_books_snapshots", type_="primary")
+    op.create_primary_key("top_books_snapshots_pkey", "top_books_snapshots", ["owner", "window_name"])
+
+
+def downgrade() -> None:
+    # Снапшоты процессов не сводятся в один без потерь; топ накопится заново
+    op.execute("DELETE FROM top_books_snapshots")
+    op.drop_constraint("top_books_snapshots_pkey", "top_books_snapshots", type_="primary")
+    op.drop_column("top_books_snapshots", "owner")
+    op.create_primary_key("top_books_snapshots_pkey", "top_books_snapshots", ["window_name"])
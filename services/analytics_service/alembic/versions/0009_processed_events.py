@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0009_processed_events"
+down_revision = "0008_top_books_snapshot_owner"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "processed_events",
+        sa.Column("routing_key", sa.String(length=128), primary_key=True),
+        sa.Column("idempotency_key", sa.String(length=64), primary_key=True),
+        sa.Column("received_at", sa.DateTime(timezone=True), nullable=False),
+    )
+    op.create_index("ix_processed_events_received_at", "processed_events", ["received_at"])
+    # Ключи недавних событий, чтобы их повторная публикация сразу после обновления не учлась второй раз;
+    # более старые ключи всё равно удалила бы политика хранения (по умолчанию 14 дней)
+    op.execute(
+        """
+        INSERT INTO processed_events (routing_key, idempotency_key, received_at)
+        SELECT routing_key, idempotency_key, max(occurred_at)
+        FROM events
+        WHERE occurred_at >= now() - interval '14 days'
+        GROUP BY routing_key, idempotency_key
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_processed_events_received_at", table_name="processed_events")
+    op.drop_table("processed_events")
@@ -1,15 +1,47 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends
-from sqlalchemy import select
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Literal, Optional, Tuple
+
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, status
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from .columnar_export import export_file_names, export_range, list_exports, resolve_export
+from .config import get_settings
+from .core.logging import get_logger
 from .db import get_db
-from .models import Event
-from .schemas import EventList, EventRead
+from .dependencies import get_current_admin
+from .event_export import EventFilters, event_filters, iter_events_ndjson
+from .models import BookSalesRollup, Event, OrderRollup
+from .rollups import bucket_start
+from .schemas import (
+    BookSales,
+    BookSalesStats,
+    ColumnarExportFile,
+    ColumnarExportList,
+    ColumnarExportRequest,
+    EventList,
+    EventRead,
+    Granularity,
+    SalesBucket,
+    SalesStats,
+    TopBook,
+    TopBooksStats,
+    TopBooksWindow,
+    UniqueBuyersBucket,
+    UniqueBuyersStats,
+)
+from .sketches import HyperLogLog
+from .top_books import get_top_books
+from .unique_buyers import load_daily_sketches, week_start
 
 
+logger = get_logger(__name__)
+
 router = APIRouter(tags=["analytics"])
+admin_router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(get_current_admin)])
 
 
 @router.get(
@@ -18,14 +50,266 @@ router = APIRouter(tags=["analytics"])
     summary="Получить последние события из аналитики",
 )
 async def list_events(
-    limit: int = 50,
+    limit: int = Query(50, ge=1, le=500),
+    before_id: Optional[int] = Query(None, description="Курсор: события с id меньше указанного"),
+    filters: EventFilters = Depends(event_filters),
     db: AsyncSession = Depends(get_db),
 ) -> EventList:
-    """Вернуть последние N событий, обработанных analytics-service."""
+    """Вернуть страницу последних событий (по убыванию id) с фильтрами.
+
+    Следующая страница запрашивается с before_id = next_before_id: keyset-пагинация
+    по индексу, без OFFSET, стоимость не растёт с номером страницы.
+    """
 
-    result = await db.execute(select(Event).order_by(Event.id.desc()).limit(limit))
+    query = filters.apply(select(Event))
+    if before_id is not None:
+        query = query.where(Event.id < before_id)
+    result = await db.execute(query.order_by(Event.id.desc()).limit(limit))
     events = result.scalars().all()
     items = [EventRead.model_validate(e) for e in events]
-    return EventList(items=items)
+    next_before_id = items[-1].id if len(items) == limit else None
+    return EventList(items=items, next_before_id=next_before_id)
+
+
+@router.get(
+    "/events/export",
+    summary="Потоковая выгрузка событий в NDJSON",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"application/x-ndjson": {}, "application/gzip": {}}}},
+)
+async def export_events(
+    after_id: Optional[int] = Query(None, description="Продолжить выгрузку после этого id"),
+    gzip: bool = Query(False, description="Сжать выгрузку (events.ndjson.gz)"),
+    filters: EventFilters = Depends(event_filters),
+) -> StreamingResponse:
+    """Все события под фильтрами по возрастанию id, по строке JSON на событие.
+
+    Чтение идёт серверным курсором, ответ пишется по мере чтения — память
+    не зависит от размера выгрузки.
+    """
+
+    stream = iter_events_ndjson(
+        filters,
+        after_id=after_id,
+        chunk_size=get_settings().events_export_chunk_size,
+        compress=gzip,
+    )
+    if gzip:
+        return StreamingResponse(
+            stream,
+            media_type="application/gzip",
+            headers={"Content-Disposition": 'attachment; filename="events.ndjson.gz"'},
+        )
+    return StreamingResponse(stream, media_type="application/x-ndjson")
+
+
+DEFAULT_RANGE = {"hour": timedelta(hours=24), "day": timedelta(days=30)}
+
+
+def _stats_range(granularity: str, start: Optional[datetime], end: Optional[datetime]) -> Tuple[datetime, datetime]:
+    """Полуинтервал [start, end), выровненный по границам интервалов роллапа."""
+
+    end = end or datetime.now(timezone.utc)
+    start = start or end - DEFAULT_RANGE[granularity]
+    if start >= end:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="start must be before end")
+    return bucket_start(start, granularity), end
+
+
+def _success_rate(succeeded: int, failed: int) -> Optional[float]:
+    total = succeeded + failed
+    return round(succeeded / total, 4) if total else None
+
+
+@router.get(
+    "/stats/sales",
+    response_model=SalesStats,
+    summary="Заказы, выручка и резервирование по часам/дням",
+)
+async def sales_stats(
+    granularity: Granularity = Query("hour"),
+    start: Optional[datetime] = Query(None, description="Начало периода (по умолчанию сутки/30 дней назад)"),
+    end: Optional[datetime] = Query(None, description="Конец периода (по умолчанию сейчас)"),
+    db: AsyncSession = Depends(get_db),
+) -> SalesStats:
+    """Временной ряд из таблицы роллапов, без чтения сырых событий."""
+
+    start, end = _stats_range(granularity, start, end)
+    result = await db.execute(
+        select(OrderRollup)
+        .where(
+            OrderRollup.granularity == granularity,
+            OrderRollup.bucket_start >= start,
+            OrderRollup.bucket_start < end,
+        )
+        .order_by(OrderRollup.bucket_start)
+    )
+    buckets = [
+        SalesBucket(
+            bucket_start=row.bucket_start,
+            orders=row.orders,
+            revenue=float(row.revenue),
+            units=row.units,
+            reserve_succeeded=row.reserve_succeeded,
+            reserve_failed=row.reserve_failed,
+            reserve_success_rate=_success_rate(row.reserve_succeeded, row.reserve_failed),
+        )
+        for row in result.scalars().all()
+    ]
+    succeeded = sum(b.reserve_succeeded for b in buckets)
+    failed = sum(b.reserve_failed for b in buckets)
+    totals = SalesBucket(
+        bucket_start=start,
+        orders=sum(b.orders for b in buckets),
+        revenue=round(sum(b.revenue for b in buckets), 2),
+        units=sum(b.units for b in buckets),
+        reserve_succeeded=succeeded,
+        reserve_failed=failed,
+        reserve_success_rate=_success_rate(succeeded, failed),
+    )
+    return SalesStats(granularity=granularity, start=start, end=end, buckets=buckets, totals=totals)
+
+
+@router.get(
+    "/stats/books",
+    response_model=BookSalesStats,
+    summary="Самые продаваемые книги за период",
+)
+async def book_sales_stats(
+    granularity: Granularity = Query("day", description="Гранулярность роллапа, по которому считается период"),
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    limit: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+) -> BookSalesStats:
+    """Сумма продаж по книгам из роллапов за период, по убыванию проданных экземпляров."""
+
+    start, end = _stats_range(granularity, start, end)
+    units = func.sum(BookSalesRollup.units).label("units")
+    result = await db.execute(
+        select(
+            BookSalesRollup.book_id,
+            func.sum(BookSalesRollup.orders).label("orders"),
+            units,
+            func.sum(BookSalesRollup.revenue).label("revenue"),
+        )
+        .where(
+            BookSalesRollup.granularity == granularity,
+            BookSalesRollup.bucket_start >= start,
+            BookSalesRollup.bucket_start < end,
+        )
+        .group_by(BookSalesRollup.book_id)
+        .order_by(units.desc(), BookSalesRollup.book_id)
+        .limit(limit)
+    )
+    items = [
+        BookSales(book_id=row.book_id, orders=row.orders, units=row.units, revenue=float(row.revenue))
+        for row in result.all()
+    ]
+    return BookSalesStats(granularity=granularity, start=start, end=end, items=items)
+
+
+MAX_UNIQUE_BUYERS_RANGE = timedelta(days=366)
+
+
+@router.get(
+    "/stats/unique-buyers",
+    response_model=UniqueBuyersStats,
+    summary="Число различных покупателей по дням/неделям (приближённо)",
+)
+async def unique_buyers_stats(
+    group: Literal["day", "week"] = Query("day"),
+    start: Optional[date] = Query(None, description="Первый день (по умолчанию 7 дней назад)"),
+    end: Optional[date] = Query(None, description="День после последнего (по умолчанию завтра)"),
+    db: AsyncSession = Depends(get_db),
+) -> UniqueBuyersStats:
+    """Объединение дневных HyperLogLog за период: дни/недели и итог без двойного счёта."""
+
+    end = end or datetime.now(timezone.utc).date() + timedelta(days=1)
+    start = start or end - timedelta(days=7)
+    if start >= end:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="start must be before end")
+    if end - start > MAX_UNIQUE_BUYERS_RANGE:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Range is limited to 366 days")
+
+    daily = await load_daily_sketches(db, start, end)
+    # Неделя, частично попавшая в период, считается только по его дням
+    groups: Dict[date, HyperLogLog] = {}
+    total: Optional[HyperLogLog] = None
+    for day in sorted(daily):
+        key = day if group == "day" else week_start(day)
+        if key in groups:
+            groups[key].merge(daily[day])
+        else:
+            groups[key] = HyperLogLog.from_bytes(daily[day].to_bytes())
+        total = total.merge(daily[day]) if total is not None else HyperLogLog.from_bytes(daily[day].to_bytes())
+    precision = total.precision if total is not None else get_settings().unique_buyers_precision
+    return UniqueBuyersStats(
+        group=group,
+        start=start,
+        end=end,
+        buckets=[UniqueBuyersBucket(bucket_start=key, unique_buyers=groups[key].count()) for key in sorted(groups)],
+        total=total.count() if total is not None else 0,
+        relative_error=round(1.04 / 2 ** (precision / 2), 4),
+    )
+
+
+@router.get(
+    "/stats/top-books",
+    response_model=TopBooksStats,
+    summary="Топ продаваемых книг за последний час/сутки (приближённо)",
+)
+async def top_books_stats(
+    window: TopBooksWindow = Query("1h"),
+    limit: int = Query(10, ge=1, le=100),
+) -> TopBooksStats:
+    """Топ из скользящего окна в памяти (Space-Saving), без обращения к БД."""
+
+    total, top = get_top_books().top(window, limit)
+    return TopBooksStats(
+        window=window,
+        as_of=datetime.now(timezone.utc),
+        total_units=total,
+        items=[TopBook(book_id=book_id, units=units, error=error) for book_id, units, error in top],
+    )
 
 
+async def _run_columnar_export(payload: ColumnarExportRequest) -> None:
+    try:
+        await export_range(payload.start, payload.end, fmt=payload.format, include_rollups=payload.include_rollups)
+    except Exception:
+        logger.exception("columnar_export_failed", start=payload.start.isoformat(), end=payload.end.isoformat())
+
+
+@admin_router.post(
+    "/exports",
+    response_model=ColumnarExportList,
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Запустить выгрузку событий и роллапов в Parquet/Arrow (admin)",
+)
+async def create_columnar_export(payload: ColumnarExportRequest, background_tasks: BackgroundTasks) -> ColumnarExportList:
+    """Выгрузка выполняется в фоне; файлы появляются в GET /admin/exports по готовности."""
+
+    if payload.start >= payload.end:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="from must be before to")
+    background_tasks.add_task(_run_columnar_export, payload)
+    names = export_file_names(payload.start, payload.end, payload.format, payload.include_rollups)
+    return ColumnarExportList(items=[ColumnarExportFile(name=name) for name in names])
+
+
+@admin_router.get("/exports", response_model=ColumnarExportList, summary="Готовые выгрузки (admin)")
+async def list_columnar_exports() -> ColumnarExportList:
+    files = list_exports()
+    return ColumnarExportList(items=[ColumnarExportFile(name=f.name, size_bytes=f.size_bytes) for f in files])
+
+
+@admin_router.get(
+    "/exports/{name}",
+    response_class=FileResponse,
+    summary="Скачать файл выгрузки (admin)",
+)
+async def download_columnar_export(name: str) -> FileResponse:
+    path = resolve_export(name)
+    if path is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Export not found")
+    return FileResponse(path, media_type="application/octet-stream", filename=name)
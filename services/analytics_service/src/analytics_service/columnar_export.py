@@ -0,0 +1,325 @@
+"""Выгрузка событий и роллапов за период в колоночный формат (Parquet или Arrow IPC).
+
+Пример::
+
+    python -m analytics_service.columnar_export --from 2025-01-01 --to 2025-02-01
+    python -m analytics_service.columnar_export --from 2025-01-01 --to 2025-02-01 --format arrow --no-rollups
+
+Поля payload разворачиваются в типизированные колонки, файлы пишутся
+группами строк по COLUMNAR_ROW_GROUP_SIZE: при чтении (pyarrow/pandas/polars)
+группы читаются независимо, Arrow-файл можно открыть через memory map.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import re
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Literal, Mapping, Optional, Sequence
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import Select, select
+
+from .config import get_settings
+from .core.logging import get_logger, setup_logging
+from .db import AsyncSessionLocal, engine
+from .event_export import EVENT_COLUMNS, EventFilters
+from .models import BookSalesRollup, Event, OrderRollup
+
+
+logger = get_logger(__name__)
+
+ColumnarFormat = Literal["parquet", "arrow"]
+
+EXTENSIONS: Dict[str, str] = {"parquet": ".parquet", "arrow": ".arrow"}
+
+# Имя файла выгрузки: буквы, цифры, '_', '-' и расширение; без каталогов
+EXPORT_NAME_RE = re.compile(r"[A-Za-z0-9_-]+\.(parquet|arrow)")
+
+
+def export_base_name(start: datetime, end: datetime) -> str:
+    """Общая часть имён файлов выгрузки за период."""
+
+    return f"{start.astimezone(timezone.utc):%Y%m%dT%H%M%SZ}_{end.astimezone(timezone.utc):%Y%m%dT%H%M%SZ}"
+
+
+def export_file_names(start: datetime, end: datetime, fmt: ColumnarFormat, include_rollups: bool) -> List[str]:
+    """Имена файлов, которые создаст export_range: события, затем роллапы."""
+
+    base = export_base_name(start, end)
+    tables = ["events", "order_rollups", "book_sales_rollups"] if include_rollups else ["events"]
+    return [f"{table}_{base}{EXTENSIONS[fmt]}" for table in tables]
+
+
+def flatten_event(row: Mapping[str, Any]) -> Dict[str, Any]:
+    """Строка events с развёрнутыми полями payload."""
+
+    payload = row["payload"] if isinstance(row["payload"], dict) else {}
+    original = payload.get("original") if isinstance(payload.get("original"), dict) else {}
+    items = payload.get("items") or original.get("items") or []
+    items = [item for item in items if isinstance(item, dict)]
+    book_ids = [int(item["book_id"]) for item in items if isinstance(item.get("book_id"), int)]
+    units = sum(item["quantity"] for item in items if isinstance(item.get("quantity"), int))
+    total_amount = row["total_amount"]
+    return {
+        "id": row["id"],
+        "routing_key": row["routing_key"],
+        "idempotency_key": row["idempotency_key"],
+        "occurred_at": row["occurred_at"],
+        "order_id": row["order_id"],
+        "user_id": row["user_id"],
+        # float64 вместо decimal: pandas читает decimal как object, это в разы медленнее
+        "total_amount": float(total_amount) if total_amount is not None else None,
+        "status": payload.get("status") if isinstance(payload.get("status"), str) else None,
+        "reason": payload.get("reason") if isinstance(payload.get("reason"), str) else None,
+        "item_count": len(items),
+        "units": units,
+        "book_ids": book_ids,
+        "payload_json": json.dumps(payload, ensure_ascii=False, separators=(",", ":")),
+    }
+
+
+def event_schema() -> pa.Schema:
+    return pa.schema(
+        [
+            ("id", pa.int64()),
+            ("routing_key", pa.dictionary(pa.int32(), pa.string())),
+            ("idempotency_key", pa.string()),
+            ("occurred_at", pa.timestamp("us", tz="UTC")),
+            ("order_id", pa.int32()),
+            ("user_id", pa.int32()),
+            ("total_amount", pa.float64()),
+            ("status", pa.dictionary(pa.int32(), pa.string())),
+            ("reason", pa.dictionary(pa.int32(), pa.string())),
+            ("item_count", pa.int32()),
+            ("units", pa.int32()),
+            ("book_ids", pa.list_(pa.int32())),
+            ("payload_json", pa.string()),
+        ]
+    )
+
+
+def order_rollup_schema() -> pa.Schema:
+    return pa.schema(
+        [
+            ("granularity", pa.dictionary(pa.int32(), pa.string())),
+            ("bucket_start", pa.timestamp("us", tz="UTC")),
+            ("orders", pa.int32()),
+            ("revenue", pa.float64()),
+            ("units", pa.int32()),
+            ("reserve_succeeded", pa.int32()),
+            ("reserve_failed", pa.int32()),
+        ]
+    )
+
+
+def book_rollup_schema() -> pa.Schema:
+    return pa.schema(
+        [
+            ("granularity", pa.dictionary(pa.int32(), pa.string())),
+            ("bucket_start", pa.timestamp("us", tz="UTC")),
+            ("book_id", pa.int32()),
+            ("orders", pa.int32()),
+            ("units", pa.int32()),
+            ("revenue", pa.float64()),
+        ]
+    )
+
+
+class ColumnarWriter:
+    """Запись пачек строк в Parquet (zstd, группа строк на пачку) или Arrow IPC (zstd)."""
+
+    def __init__(self, path: Path, schema: pa.Schema, fmt: ColumnarFormat) -> None:
+        self.path = path
+        self.schema = schema
+        self.rows = 0
+        self._parquet = fmt == "parquet"
+        if self._parquet:
+            self._writer = pq.ParquetWriter(path, schema, compression="zstd")
+        else:
+            self._writer = pa.ipc.new_file(str(path), schema, options=pa.ipc.IpcWriteOptions(compression="zstd"))
+
+    def write_rows(self, rows: Sequence[Mapping[str, Any]]) -> None:
+        if not rows:
+            return
+        columns = {name: [row[name] for row in rows] for name in self.schema.names}
+        table = pa.Table.from_pydict(columns, schema=self.schema)
+        # Одна пачка — одна группа строк (Parquet) / один record batch (Arrow)
+        if self._parquet:
+            self._writer.write_table(table, row_group_size=len(rows))
+        else:
+            self._writer.write_table(table, max_chunksize=len(rows))
+        self.rows += len(rows)
+
+    def close(self) -> None:
+        self._writer.close()
+
+
+@dataclass
+class ExportedFile:
+    name: str
+    size_bytes: int
+    rows: Optional[int] = None
+
+
+async def _export_query(
+    query: Select,
+    path: Path,
+    schema: pa.Schema,
+    fmt: ColumnarFormat,
+    row_group_size: int,
+    convert: Callable[[Mapping[str, Any]], Dict[str, Any]] = dict,
+) -> ExportedFile:
+    """Прочитать выборку серверным курсором и записать её группами строк.
+
+    Файл пишется под временным именем и переименовывается по завершении, так
+    что в каталоге выгрузок видны только готовые файлы.
+    """
+
+    partial = path.with_name(path.name + ".part")
+    writer = await asyncio.to_thread(ColumnarWriter, partial, schema, fmt)
+    try:
+        async with AsyncSessionLocal() as session:
+            result = await session.stream(query.execution_options(yield_per=row_group_size))
+            async for rows in result.mappings().partitions():
+                converted = [convert(row) for row in rows]
+                # Сжатие группы строк занимает заметное время — не держим event loop
+                await asyncio.to_thread(writer.write_rows, converted)
+    except BaseException:
+        await asyncio.to_thread(writer.close)
+        partial.unlink(missing_ok=True)
+        raise
+    await asyncio.to_thread(writer.close)
+    os.replace(partial, path)
+    exported = ExportedFile(name=path.name, size_bytes=path.stat().st_size, rows=writer.rows)
+    logger.info("columnar_export_written", file=exported.name, rows=exported.rows, size_bytes=exported.size_bytes)
+    return exported
+
+
+async def export_range(
+    start: datetime,
+    end: datetime,
+    fmt: ColumnarFormat = "parquet",
+    include_rollups: bool = True,
+    out_dir: Optional[Path] = None,
+    row_group_size: Optional[int] = None,
+) -> List[ExportedFile]:
+    """Выгрузить события [start, end) и, по желанию, роллапы за тот же период."""
+
+    settings = get_settings()
+    out_dir = Path(out_dir or settings.columnar_export_dir)
+    row_group_size = row_group_size or settings.columnar_row_group_size
+    await asyncio.to_thread(out_dir.mkdir, parents=True, exist_ok=True)
+    names = export_file_names(start, end, fmt, include_rollups)
+
+    # Порядок по id: слияние индексов PK партиций вместо сортировки всего периода
+    events_query = EventFilters(from_=start, to=end).apply(select(*EVENT_COLUMNS)).order_by(Event.id)
+    exported = [
+        await _export_query(
+            events_query,
+            out_dir / names[0],
+            event_schema(),
+            fmt,
+            row_group_size,
+            convert=flatten_event,
+        )
+    ]
+    if include_rollups:
+        exported.append(
+            await _export_query(
+                select(OrderRollup.__table__)
+                .where(OrderRollup.bucket_start >= start, OrderRollup.bucket_start < end)
+                .order_by(OrderRollup.granularity, OrderRollup.bucket_start),
+                out_dir / names[1],
+                order_rollup_schema(),
+                fmt,
+                row_group_size,
+                convert=_rollup_row,
+            )
+        )
+        exported.append(
+            await _export_query(
+                select(BookSalesRollup.__table__)
+                .where(BookSalesRollup.bucket_start >= start, BookSalesRollup.bucket_start < end)
+                .order_by(BookSalesRollup.granularity, BookSalesRollup.bucket_start, BookSalesRollup.book_id),
+                out_dir / names[2],
+                book_rollup_schema(),
+                fmt,
+                row_group_size,
+                convert=_rollup_row,
+            )
+        )
+    return exported
+
+
+def _rollup_row(row: Mapping[str, Any]) -> Dict[str, Any]:
+    converted = dict(row)
+    converted["revenue"] = float(converted["revenue"])
+    return converted
+
+
+def list_exports(out_dir: Optional[Path] = None) -> List[ExportedFile]:
+    """Готовые файлы в каталоге выгрузок, новые первыми."""
+
+    out_dir = Path(out_dir or get_settings().columnar_export_dir)
+    if not out_dir.is_dir():
+        return []
+    files = [path for path in out_dir.iterdir() if path.is_file() and EXPORT_NAME_RE.fullmatch(path.name)]
+    files.sort(key=lambda path: path.stat().st_mtime, reverse=True)
+    return [ExportedFile(name=path.name, size_bytes=path.stat().st_size) for path in files]
+
+
+def resolve_export(name: str, out_dir: Optional[Path] = None) -> Optional[Path]:
+    """Путь к готовому файлу выгрузки; None — имя недопустимо или файла нет."""
+
+    if not EXPORT_NAME_RE.fullmatch(name):
+        return None
+    path = Path(out_dir or get_settings().columnar_export_dir) / name
+    return path if path.is_file() else None
+
+
+def _parse_datetime(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+async def _run(args: argparse.Namespace) -> List[ExportedFile]:
+    try:
+        return await export_range(
+            args.start,
+            args.end,
+            fmt=args.format,
+            include_rollups=args.rollups,
+            out_dir=args.out_dir,
+            row_group_size=args.row_group_size,
+        )
+    finally:
+        await engine.dispose()
+
+
+def main(argv: Optional[Iterable[str]] = None) -> None:
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Выгрузка событий и роллапов в Parquet/Arrow")
+    parser.add_argument("--from", dest="start", type=_parse_datetime, required=True)
+    parser.add_argument("--to", dest="end", type=_parse_datetime, required=True)
+    parser.add_argument("--format", choices=sorted(EXTENSIONS), default="parquet")
+    parser.add_argument("--out-dir", type=Path, default=Path(settings.columnar_export_dir))
+    parser.add_argument("--row-group-size", type=int, default=settings.columnar_row_group_size)
+    parser.add_argument("--no-rollups", dest="rollups", action="store_false")
+    args = parser.parse_args(list(argv) if argv is not None else None)
+    if args.start >= args.end:
+        parser.error("--from must be before --to")
+
+    setup_logging()
+    for exported in asyncio.run(_run(args)):
+        print(f"{exported.name}\t{exported.rows} rows\t{exported.size_bytes} bytes")
+
+
+if __name__ == "__main__":
+    main()
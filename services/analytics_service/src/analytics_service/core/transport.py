@@ -0,0 +1,593 @@
+from __future__ import annotations
+
+import copy
+import heapq
+import itertools
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+import pika
+from pika.exceptions import ChannelClosedByBroker
+from pika.frame import Method
+from pika.spec import Basic, Exchange, Queue
+
+
+RABBITMQ_TRANSPORT = "rabbitmq"
+MEMORY_TRANSPORT = "memory"
+
+
+def connect(transport: str, url: str) -> Any:
+    """Открыть блокирующее соединение с брокером транспорта MESSAGE_TRANSPORT.
+
+    rabbitmq — pika.BlockingConnection к url; memory — соединение с брокером в
+    памяти процесса с тем же интерфейсом (url не используется).
+    """
+
+    if transport == RABBITMQ_TRANSPORT:
+        return pika.BlockingConnection(pika.URLParameters(url))
+    if transport == MEMORY_TRANSPORT:
+        return get_memory_broker().connect()
+    raise ValueError(f"unknown message transport: {transport}")
+
+
+def topic_matches(pattern: str, routing_key: str) -> bool:
+    """Подходит ли routing key под ключ привязки topic-exchange (* — одно слово, # — ноль и более)."""
+
+    def match(pattern_words: List[str], words: List[str]) -> bool:
+        if not pattern_words:
+            return not words
+        head, rest = pattern_words[0], pattern_words[1:]
+        if head == "#":
+            return any(match(rest, words[index:]) for index in range(len(words) + 1))
+        return bool(words) and head in ("*", words[0]) and match(rest, words[1:])
+
+    return match(pattern.split("."), routing_key.split("."))
+
+
+@dataclass(eq=False)
+class _Message:
+    exchange: str
+    routing_key: str
+    body: bytes
+    properties: Any
+    redelivered: bool = False
+
+    def copy(self) -> "_Message":
+        return _Message(self.exchange, self.routing_key, self.body, self.properties, self.redelivered)
+
+
+@dataclass(eq=False)
+class _Consumer:
+    tag: str
+    queue: str
+    channel: "InMemoryChannel"
+    callback: Callable[..., None]
+    auto_ack: bool
+
+    def can_take(self) -> bool:
+        prefetch = self.channel.prefetch_count
+        return self.auto_ack or prefetch <= 0 or len(self.channel._unacked) < prefetch
+
+
+@dataclass(eq=False)
+class _Queue:
+    name: str
+    arguments: Dict[str, Any]
+    owner: Optional["InMemoryConnection"] = None
+    messages: Deque[_Message] = field(default_factory=deque)
+    consumers: List[_Consumer] = field(default_factory=list)
+    next_consumer: int = 0
+
+
+def _record_death(deaths: Any, queue: str, reason: str, message: _Message) -> List[Dict[str, Any]]:
+    """Заголовок x-death после dead-lettering: счётчик по (очередь, причина), свежая запись первой."""
+
+    records = [dict(death) for death in deaths or []]
+    for death in records:
+        if death.get("queue") == queue and death.get("reason") == reason:
+            death["count"] = int(death.get("count", 0)) + 1
+            death["time"] = datetime.now(timezone.utc)
+            records.remove(death)
+            return [death, *records]
+    death = {
+        "count": 1,
+        "reason": reason,
+        "queue": queue,
+        "time": datetime.now(timezone.utc),
+        "exchange": message.exchange,
+        "routing-keys": [message.routing_key],
+    }
+    return [death, *records]
+
+
+class InMemoryBroker:
+    """Брокер сообщений в памяти процесса с той частью семантики RabbitMQ, на которую опираются сервисы.
+
+    Topic-, fanout- и direct-exchange и default exchange, exclusive-очереди,
+    подтверждения (ack, reject, nack, multiple), prefetch, повторная доставка
+    с флагом redelivered (requeue и закрытие канала), dead-lettering с
+    заголовком x-death и x-message-ttl — этого достаточно для WorkQueue и
+    consumer-ов. Сообщения живут, пока жив процесс: транспорт для
+    нагрузочных тестов и CI без RabbitMQ, а не для эксплуатации.
+    """
+
+    def __init__(self) -> None:
+        self._condition = threading.Condition(threading.RLock())
+        self._exchanges: Dict[str, str] = {"": "direct"}
+        self._bindings: Dict[str, List[Tuple[str, str]]] = {"": []}
+        self._queues: Dict[str, _Queue] = {}
+        self._channels: Set["InMemoryChannel"] = set()
+        self._expiry: List[Tuple[float, int, str, _Message]] = []
+        self._expiry_thread: Optional[threading.Thread] = None
+        self._sequence = itertools.count()
+        self.counters: Dict[str, int] = {"published": 0, "delivered": 0, "redelivered": 0, "dead_lettered": 0}
+
+    def connect(self) -> "InMemoryConnection":
+        return InMemoryConnection(self)
+
+    def declare_exchange(self, name: str, exchange_type: str, passive: bool = False) -> None:
+        with self._condition:
+            if name in self._exchanges:
+                return
+            if passive:
+                raise ChannelClosedByBroker(404, f"NOT_FOUND - no exchange '{name}'")
+            self._exchanges[name] = exchange_type
+            self._bindings[name] = []
+
+    def declare_queue(
+        self,
+        name: str,
+        passive: bool = False,
+        arguments: Optional[Dict[str, Any]] = None,
+        owner: Optional["InMemoryConnection"] = None,
+    ) -> Tuple[str, int, int]:
+        """Объявить очередь; (имя, сообщений, подписчиков). Пустое имя — сгенерировать."""
+
+        with self._condition:
+            name = name or f"amq.gen-{uuid.uuid4().hex}"
+            queue = self._queues.get(name)
+            if queue is None:
+                if passive:
+                    raise ChannelClosedByBroker(404, f"NOT_FOUND - no queue '{name}'")
+                queue = self._queues[name] = _Queue(name, dict(arguments or {}), owner)
+            return name, len(queue.messages), len(queue.consumers)
+
+    def bind(self, queue: str, exchange: str, routing_key: str) -> None:
+        with self._condition:
+            if queue not in self._queues:
+                raise ChannelClosedByBroker(404, f"NOT_FOUND - no queue '{queue}'")
+            if exchange not in self._exchanges:
+                raise ChannelClosedByBroker(404, f"NOT_FOUND - no exchange '{exchange}'")
+            if (queue, routing_key) not in self._bindings[exchange]:
+                self._bindings[exchange].append((queue, routing_key))
+
+    def publish(self, exchange: str, routing_key: str, body: bytes, properties: Any = None) -> None:
+        with self._condition:
+            self.counters["published"] += 1
+            self._route(_Message(exchange, routing_key, body, properties))
+
+    def pending(self) -> int:
+        """Сообщения, которые ещё будут обработаны: в очередях с подписчиками или TTL и неподтверждённые."""
+
+        with self._condition:
+            queued = sum(
+                len(queue.messages)
+                for queue in self._queues.values()
+                if queue.consumers or "x-message-ttl" in queue.arguments
+            )
+            inflight = sum(
+                len(channel._unacked) + sum(1 for consumer, _, _ in channel._inbox if consumer.auto_ack)
+                for channel in self._channels
+            )
+            return queued + inflight
+
+    def wait_idle(self, timeout: float, poll_seconds: float = 0.05) -> bool:
+        """Дождаться, пока все сообщения будут обработаны; False — не дождались за timeout."""
+
+        deadline = time.monotonic() + timeout
+        while self.pending():
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(poll_seconds)
+        return True
+
+    # Методы ниже вызываются под self._condition
+
+    def _route(self, message: _Message) -> None:
+        exchange_type = self._exchanges.get(message.exchange)
+        if exchange_type is None:
+            raise ChannelClosedByBroker(404, f"NOT_FOUND - no exchange '{message.exchange}'")
+        if message.exchange == "":
+            targets = [message.routing_key] if message.routing_key in self._queues else []
+        else:
+            targets = [
+                queue
+                for queue, key in self._bindings[message.exchange]
+                if exchange_type == "fanout"
+                or key == message.routing_key
+                or (exchange_type == "topic" and topic_matches(key, message.routing_key))
+            ]
+        # Сообщение без подходящей привязки отбрасывается, как в RabbitMQ без mandatory
+        for name in dict.fromkeys(targets):
+            self._enqueue(self._queues[name], message.copy())
+
+    def _enqueue(self, queue: _Queue, message: _Message) -> None:
+        queue.messages.append(message)
+        ttl = queue.arguments.get("x-message-ttl")
+        if ttl is not None:
+            heapq.heappush(self._expiry, (time.monotonic() + ttl / 1000, next(self._sequence), queue.name, message))
+            self._start_expiry()
+            self._condition.notify_all()
+        self._dispatch(queue)
+
+    def _dispatch(self, queue: _Queue) -> None:
+        """Раздать сообщения очереди подписчикам по кругу с учётом prefetch."""
+
+        delivered = False
+        while queue.messages and queue.consumers:
+            consumer = self._next_consumer(queue)
+            if consumer is None:
+                break
+            message = queue.messages.popleft()
+            consumer.channel._deliver(consumer, queue, message)
+            self.counters["delivered"] += 1
+            if message.redelivered:
+                self.counters["redelivered"] += 1
+            delivered = True
+        if delivered:
+            self._condition.notify_all()
+
+    def _next_consumer(self, queue: _Queue) -> Optional[_Consumer]:
+        for _ in range(len(queue.consumers)):
+            consumer = queue.consumers[queue.next_consumer % len(queue.consumers)]
+            queue.next_consumer += 1
+            if consumer.can_take():
+                return consumer
+        return None
+
+    def _requeue(self, queue: _Queue, messages: List[_Message]) -> None:
+        """Вернуть сообщения в голову очереди в исходном порядке."""
+
+        for message in reversed(messages):
+            message.redelivered = True
+            queue.messages.appendleft(message)
+        self._dispatch(queue)
+
+    def _dead_letter(self, queue: _Queue, message: _Message, reason: str) -> None:
+        exchange = queue.arguments.get("x-dead-letter-exchange")
+        if exchange is None or exchange not in self._exchanges:
+            return
+        routing_key = queue.arguments.get("x-dead-letter-routing-key", message.routing_key)
+        properties = copy.copy(message.properties) if message.properties is not None else pika.BasicProperties()
+        headers = dict(getattr(properties, "headers", None) or {})
+        headers["x-death"] = _record_death(headers.get("x-death"), queue.name, reason, message)
+        properties.headers = headers
+        self.counters["dead_lettered"] += 1
+        self._route(_Message(exchange, routing_key, message.body, properties))
+
+    def _start_expiry(self) -> None:
+        if self._expiry_thread is None:
+            self._expiry_thread = threading.Thread(target=self._expire_loop, name="memory-broker-ttl", daemon=True)
+            self._expiry_thread.start()
+
+    def _expire_loop(self) -> None:
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                while self._expiry and self._expiry[0][0] <= now:
+                    _, _, name, message = heapq.heappop(self._expiry)
+                    queue = self._queues.get(name)
+                    if queue is None or message not in queue.messages:
+                        continue
+                    queue.messages.remove(message)
+                    self._dead_letter(queue, message, "expired")
+                self._condition.wait(self._expiry[0][0] - now if self._expiry else None)
+
+    def _drop_exclusive(self, owner: "InMemoryConnection") -> None:
+        for name in [name for name, queue in self._queues.items() if queue.owner is owner]:
+            del self._queues[name]
+            for exchange, bindings in self._bindings.items():
+                self._bindings[exchange] = [binding for binding in bindings if binding[0] != name]
+
+
+class InMemoryConnection:
+    """Соединение с InMemoryBroker с интерфейсом pika.BlockingConnection, которым пользуются сервисы.
+
+    Как и в pika, таймеры call_later и обработчики сообщений выполняются в
+    потоке, который крутит start_consuming или process_data_events.
+    """
+
+    def __init__(self, broker: InMemoryBroker) -> None:
+        self._broker = broker
+        self._channels: List["InMemoryChannel"] = []
+        self._timers: List[Tuple[float, int, Callable[[], None]]] = []
+        self.is_open = True
+
+    @property
+    def is_closed(self) -> bool:
+        return not self.is_open
+
+    def channel(self) -> "InMemoryChannel":
+        with self._broker._condition:
+            channel = InMemoryChannel(self, len(self._channels) + 1)
+            self._channels.append(channel)
+            self._broker._channels.add(channel)
+            return channel
+
+    def call_later(self, delay: float, callback: Callable[[], None]) -> int:
+        with self._broker._condition:
+            timer_id = next(self._broker._sequence)
+            heapq.heappush(self._timers, (time.monotonic() + delay, timer_id, callback))
+            self._broker._condition.notify_all()
+            return timer_id
+
+    def remove_timeout(self, timeout_id: int) -> None:
+        with self._broker._condition:
+            self._timers = [timer for timer in self._timers if timer[1] != timeout_id]
+            heapq.heapify(self._timers)
+
+    def process_data_events(self, time_limit: float = 0) -> None:
+        self._process(time_limit)
+
+    def close(self) -> None:
+        with self._broker._condition:
+            if not self.is_open:
+                return
+            for channel in self._channels:
+                channel._close()
+            self.is_open = False
+            self._broker._drop_exclusive(self)
+            self._broker._condition.notify_all()
+
+    def _process(self, timeout: Optional[float]) -> None:
+        """Выполнить наступившие таймеры и доставки; если их нет — ждать не дольше timeout (None — без ограничения)."""
+
+        condition = self._broker._condition
+        with condition:
+            work = self._take_work()
+            if not work and self.is_open:
+                wait = self._timers[0][0] - time.monotonic() if self._timers else None
+                if timeout is not None:
+                    wait = timeout if wait is None else min(wait, timeout)
+                condition.wait(max(wait, 0) if wait is not None else None)
+                work = self._take_work()
+        for item in work:
+            item()
+
+    def _take_work(self) -> List[Callable[[], None]]:
+        work: List[Callable[[], None]] = []
+        now = time.monotonic()
+        while self._timers and self._timers[0][0] <= now:
+            work.append(heapq.heappop(self._timers)[2])
+        for channel in self._channels:
+            while channel._inbox:
+                work.append(channel._invoker(*channel._inbox.popleft()))
+        return work
+
+
+class InMemoryChannel:
+    """Канал InMemoryConnection с методами pika BlockingChannel, которыми пользуются сервисы."""
+
+    def __init__(self, connection: InMemoryConnection, channel_number: int) -> None:
+        self.connection = connection
+        self.channel_number = channel_number
+        self.prefetch_count = 0
+        self.is_open = True
+        self._broker = connection._broker
+        self._consumers: Dict[str, _Consumer] = {}
+        self._unacked: "OrderedDict[int, Tuple[_Queue, _Message]]" = OrderedDict()
+        self._inbox: Deque[Tuple[_Consumer, int, _Message]] = deque()
+        self._delivery_tags = itertools.count(1)
+        self._consuming = False
+
+    @property
+    def is_closed(self) -> bool:
+        return not self.is_open
+
+    def exchange_declare(
+        self,
+        exchange: str,
+        exchange_type: str = "direct",
+        passive: bool = False,
+        durable: bool = False,
+        auto_delete: bool = False,
+        internal: bool = False,
+        arguments: Optional[Dict[str, Any]] = None,
+    ) -> Method:
+        self._broker.declare_exchange(exchange, exchange_type, passive)
+        return Method(self.channel_number, Exchange.DeclareOk())
+
+    def queue_declare(
+        self,
+        queue: str,
+        passive: bool = False,
+        durable: bool = False,
+        exclusive: bool = False,
+        auto_delete: bool = False,
+        arguments: Optional[Dict[str, Any]] = None,
+    ) -> Method:
+        owner = self.connection if exclusive else None
+        name, messages, consumers = self._broker.declare_queue(queue, passive, arguments, owner)
+        return Method(self.channel_number, Queue.DeclareOk(name, messages, consumers))
+
+    def queue_bind(
+        self,
+        queue: str,
+        exchange: str,
+        routing_key: Optional[str] = None,
+        arguments: Optional[Dict[str, Any]] = None,
+    ) -> Method:
+        self._broker.bind(queue, exchange, queue if routing_key is None else routing_key)
+        return Method(self.channel_number, Queue.BindOk())
+
+    def basic_qos(self, prefetch_size: int = 0, prefetch_count: int = 0, global_qos: bool = False) -> None:
+        self.prefetch_count = prefetch_count
+
+    def basic_publish(
+        self,
+        exchange: str,
+        routing_key: str,
+        body: bytes,
+        properties: Any = None,
+        mandatory: bool = False,
+    ) -> None:
+        self._broker.publish(exchange, routing_key, body, properties)
+
+    def basic_consume(
+        self,
+        queue: str,
+        on_message_callback: Callable[..., None],
+        auto_ack: bool = False,
+        exclusive: bool = False,
+        consumer_tag: Optional[str] = None,
+        arguments: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        with self._broker._condition:
+            target = self._broker._queues.get(queue)
+            if target is None:
+                raise ChannelClosedByBroker(404, f"NOT_FOUND - no queue '{queue}'")
+            consumer = _Consumer(consumer_tag or f"ctag-{uuid.uuid4().hex}", queue, self, on_message_callback, auto_ack)
+            self._consumers[consumer.tag] = consumer
+            target.consumers.append(consumer)
+            self._broker._dispatch(target)
+            return consumer.tag
+
+    def basic_cancel(self, consumer_tag: str) -> None:
+        with self._broker._condition:
+            consumer = self._consumers.pop(consumer_tag, None)
+            if consumer is None:
+                return
+            queue = self._broker._queues.get(consumer.queue)
+            if queue is not None:
+                queue.consumers.remove(consumer)
+            # Ещё не переданные обработчику сообщения возвращаются в очередь
+            pending = [(tag, message) for owner, tag, message in self._inbox if owner is consumer]
+            self._inbox = deque(item for item in self._inbox if item[0] is not consumer)
+            for tag, _ in pending:
+                self._unacked.pop(tag, None)
+            if queue is not None and pending:
+                self._broker._requeue(queue, [message for _, message in pending])
+
+    def basic_ack(self, delivery_tag: int = 0, multiple: bool = False) -> None:
+        self._settle(delivery_tag, multiple, None)
+
+    def basic_nack(self, delivery_tag: int = 0, multiple: bool = False, requeue: bool = True) -> None:
+        self._settle(delivery_tag, multiple, requeue)
+
+    def basic_reject(self, delivery_tag: int, requeue: bool = True) -> None:
+        self._settle(delivery_tag, False, requeue)
+
+    def start_consuming(self) -> None:
+        self._consuming = True
+        while self._consuming and self.is_open and self.connection.is_open:
+            self.connection._process(None)
+
+    def stop_consuming(self, consumer_tag: Optional[str] = None) -> None:
+        with self._broker._condition:
+            self._consuming = False
+            self._broker._condition.notify_all()
+
+    def close(self) -> None:
+        with self._broker._condition:
+            self._close()
+
+    def _invoker(self, consumer: _Consumer, delivery_tag: int, message: _Message) -> Callable[[], None]:
+        def invoke() -> None:
+            if not self.is_open:
+                return
+            method = Basic.Deliver(
+                consumer_tag=consumer.tag,
+                delivery_tag=delivery_tag,
+                redelivered=message.redelivered,
+                exchange=message.exchange,
+                routing_key=message.routing_key,
+            )
+            consumer.callback(self, method, message.properties or pika.BasicProperties(), message.body)
+
+        return invoke
+
+    # Методы ниже вызываются под условием брокера
+
+    def _deliver(self, consumer: _Consumer, queue: _Queue, message: _Message) -> None:
+        delivery_tag = next(self._delivery_tags)
+        if not consumer.auto_ack:
+            self._unacked[delivery_tag] = (queue, message)
+        self._inbox.append((consumer, delivery_tag, message))
+
+    def _settle(self, delivery_tag: int, multiple: bool, requeue: Optional[bool]) -> None:
+        """ack (requeue=None), reject/nack с возвратом в очередь или dead-lettering."""
+
+        with self._broker._condition:
+            if multiple and delivery_tag == 0:
+                tags = list(self._unacked)
+            elif delivery_tag in self._unacked:
+                tags = [tag for tag in self._unacked if tag <= delivery_tag] if multiple else [delivery_tag]
+            else:
+                # Как и RabbitMQ, повторное или чужое подтверждение закрывает канал
+                self._close()
+                raise ChannelClosedByBroker(406, f"PRECONDITION_FAILED - unknown delivery tag {delivery_tag}")
+
+            requeued: Dict[str, Tuple[_Queue, List[_Message]]] = {}
+            for tag in tags:
+                queue, message = self._unacked.pop(tag)
+                if requeue:
+                    requeued.setdefault(queue.name, (queue, []))[1].append(message)
+                elif requeue is not None:
+                    self._broker._dead_letter(queue, message, "rejected")
+            for queue, messages in requeued.values():
+                self._broker._requeue(queue, messages)
+            # Освободились места в prefetch
+            for consumer in self._consumers.values():
+                queue = self._broker._queues.get(consumer.queue)
+                if queue is not None:
+                    self._broker._dispatch(queue)
+
+    def _close(self) -> None:
+        if not self.is_open:
+            return
+        self.is_open = False
+        self._consuming = False
+        for consumer in self._consumers.values():
+            queue = self._broker._queues.get(consumer.queue)
+            if queue is not None:
+                queue.consumers.remove(consumer)
+        self._consumers.clear()
+        self._inbox.clear()
+        # Неподтверждённые сообщения возвращаются в очередь с redelivered=True
+        requeued: Dict[str, Tuple[_Queue, List[_Message]]] = {}
+        for queue, message in self._unacked.values():
+            requeued.setdefault(queue.name, (queue, []))[1].append(message)
+        self._unacked.clear()
+        for queue, messages in requeued.values():
+            if queue.name in self._broker._queues:
+                self._broker._requeue(queue, messages)
+        self._broker._channels.discard(self)
+        self._broker._condition.notify_all()
+
+
+_broker: InMemoryBroker | None = None
+_broker_lock = threading.Lock()
+
+
+def get_memory_broker() -> InMemoryBroker:
+    """Брокер в памяти процесса (singleton) для MESSAGE_TRANSPORT=memory."""
+
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = InMemoryBroker()
+    return _broker
+
+
+def set_memory_broker(broker: InMemoryBroker) -> None:
+    """Подключить процесс к заданному брокеру: так сервисы, запущенные в одном процессе, видят общие очереди."""
+
+    global _broker
+    with _broker_lock:
+        _broker = broker
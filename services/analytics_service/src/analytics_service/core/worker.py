@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import multiprocessing
+import signal
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing.connection import wait
+from typing import Callable, List
+
+from .consumer_stats import consumers_report
+from .logging import get_logger
+from .metrics import PROMETHEUS_CONTENT_TYPE, REGISTRY
+
+
+logger = get_logger(__name__)
+
+ConsumerFactory = Callable[[asyncio.AbstractEventLoop], threading.Thread]
+
+
+def start_metrics_server(port: int, stall_seconds: float) -> ThreadingHTTPServer:
+    """/metrics и /health/consumers процесса-воркера (у него нет FastAPI-приложения)."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:  # noqa: N802
+            if self.path == "/metrics":
+                status, content_type, body = 200, PROMETHEUS_CONTENT_TYPE, REGISTRY.render().encode("utf-8")
+            elif self.path == "/health/consumers":
+                healthy, consumers = consumers_report(stall_seconds)
+                status, content_type = (200 if healthy else 503), "application/json"
+                body = json.dumps({"status": "ok" if healthy else "stalled", "consumers": consumers}).encode("utf-8")
+            else:
+                status, content_type, body = 404, "text/plain", b"not found"
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: object) -> None:
+            return
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    threading.Thread(target=server.serve_forever, name="worker-metrics", daemon=True).start()
+    return server
+
+
+async def serve_consumers(factory: ConsumerFactory, concurrency: int, check_interval_seconds: float = 1.0) -> int:
+    """Запустить concurrency потоков-consumer-ов на event loop процесса и ждать SIGTERM/SIGINT.
+
+    Обработчики сообщений выполняются на этом event loop, а не на loop-е HTTP.
+    Код выхода: 0 — остановлен сигналом, 1 — завершился поток consumer-а
+    (процесс перезапустит супервизор, неподтверждённые сообщения вернутся в очередь).
+    """
+
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+
+    consumers = [factory(loop) for _ in range(max(concurrency, 1))]
+    for consumer in consumers:
+        consumer.start()
+    logger.info("worker_started", consumers=len(consumers))
+
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=check_interval_seconds)
+        except asyncio.TimeoutError:
+            pass
+        if any(not consumer.is_alive() for consumer in consumers):
+            logger.error("worker_consumer_stopped")
+            return 1
+    logger.info("worker_stopping")
+    return 0
+
+
+def _run_child(target: Callable[[int], int], index: int) -> None:
+    raise SystemExit(target(index))
+
+
+def run_worker_processes(target: Callable[[int], int], processes: int) -> int:
+    """Выполнить target(номер процесса) в processes процессах; при выходе одного останавливаются все.
+
+    target должен быть функцией уровня модуля (процессы стартуют через spawn).
+    """
+
+    if processes <= 1:
+        return target(0)
+
+    context = multiprocessing.get_context("spawn")
+    children: List[multiprocessing.process.BaseProcess] = [
+        context.Process(target=_run_child, args=(target, index), name=f"worker-{index}") for index in range(processes)
+    ]
+    for child in children:
+        child.start()
+
+    def terminate(signum: int, frame: object) -> None:
+        for child in children:
+            if child.is_alive():
+                child.terminate()
+
+    signal.signal(signal.SIGTERM, terminate)
+    signal.signal(signal.SIGINT, terminate)
+
+    wait([child.sentinel for child in children])
+    terminate(signal.SIGTERM, None)
+    for child in children:
+        child.join()
+    # Остановленные по SIGTERM до установки обработчика сигналов завершаются с -SIGTERM
+    failed = [child.exitcode for child in children if child.exitcode not in (0, -signal.SIGTERM)]
+    return 1 if failed else 0
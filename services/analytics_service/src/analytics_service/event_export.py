@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import json
+import zlib
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Mapping, Optional
+
+from fastapi import HTTPException, Query, status
+from sqlalchemy import Select, or_, select
+
+from .core.logging import get_logger
+from .db import AsyncSessionLocal
+from .models import Event
+
+
+logger = get_logger(__name__)
+
+EVENT_COLUMNS = (
+    Event.id,
+    Event.routing_key,
+    Event.idempotency_key,
+    Event.occurred_at,
+    Event.order_id,
+    Event.user_id,
+    Event.total_amount,
+    Event.payload,
+)
+
+
+@dataclass(frozen=True)
+class EventFilters:
+    """Фильтры выборки событий, общие для /events и выгрузок."""
+
+    order_id: Optional[int] = None
+    user_id: Optional[int] = None
+    book_id: Optional[int] = None
+    routing_key: Optional[str] = None
+    from_: Optional[datetime] = None
+    to: Optional[datetime] = None
+
+    def apply(self, query: Select) -> Select:
+        """Добавить условия к запросу по events.
+
+        order_id/user_id ищутся по индексам типизированных колонок, book_id — по
+        GIN-индексу payload, период ограничивает набор сканируемых партиций.
+        """
+
+        if self.order_id is not None:
+            query = query.where(Event.order_id == self.order_id)
+        if self.user_id is not None:
+            query = query.where(Event.user_id == self.user_id)
+        if self.book_id is not None:
+            item = {"items": [{"book_id": self.book_id}]}
+            # stock.reserve.* хранят позиции в исходном запросе
+            query = query.where(or_(Event.payload.contains(item), Event.payload.contains({"original": item})))
+        if self.routing_key is not None:
+            query = query.where(Event.routing_key == self.routing_key)
+        if self.from_ is not None:
+            query = query.where(Event.occurred_at >= self.from_)
+        if self.to is not None:
+            query = query.where(Event.occurred_at < self.to)
+        return query
+
+
+def event_filters(
+    order_id: Optional[int] = Query(None, description="События одного заказа"),
+    user_id: Optional[int] = Query(None, description="События заказов пользователя"),
+    book_id: Optional[int] = Query(None, description="События, в позициях которых есть книга"),
+    routing_key: Optional[str] = Query(None, max_length=128),
+    from_: Optional[datetime] = Query(None, alias="from", description="occurred_at не раньше"),
+    to: Optional[datetime] = Query(None, description="occurred_at раньше"),
+) -> EventFilters:
+    """FastAPI-зависимость: фильтры событий из query-параметров."""
+
+    if from_ is not None and to is not None and from_ >= to:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="from must be before to")
+    return EventFilters(
+        order_id=order_id,
+        user_id=user_id,
+        book_id=book_id,
+        routing_key=routing_key,
+        from_=from_,
+        to=to,
+    )
+
+
+def event_record(row: Mapping[str, Any]) -> Dict[str, Any]:
+    """Строка выборки EVENT_COLUMNS в JSON-совместимый словарь (без pydantic на каждую строку)."""
+
+    total_amount = row["total_amount"]
+    return {
+        "id": row["id"],
+        "routing_key": row["routing_key"],
+        "idempotency_key": row["idempotency_key"],
+        "occurred_at": row["occurred_at"].isoformat(),
+        "order_id": row["order_id"],
+        "user_id": row["user_id"],
+        "total_amount": float(total_amount) if total_amount is not None else None,
+        "payload": row["payload"],
+    }
+
+
+async def iter_events_ndjson(
+    filters: EventFilters,
+    after_id: Optional[int],
+    chunk_size: int,
+    compress: bool = False,
+) -> AsyncIterator[bytes]:
+    """Выгрузить события по возрастанию id в NDJSON, кусками по мере чтения.
+
+    Строки читаются серверным курсором по chunk_size штук, так что память не
+    зависит от объёма выгрузки. При обрыве выгрузку можно продолжить с
+    after_id = id последней полученной строки.
+    """
+
+    query = filters.apply(select(*EVENT_COLUMNS))
+    if after_id is not None:
+        query = query.where(Event.id > after_id)
+    query = query.order_by(Event.id).execution_options(yield_per=chunk_size)
+
+    # wbits=31 — формат gzip, а не «сырой» deflate
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    exported = 0
+    # Сессия зависимости закрывается до начала стриминга ответа — нужна своя
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(query)
+        async for rows in result.mappings().partitions():
+            chunk = "".join(json.dumps(event_record(row), ensure_ascii=False) + "\n" for row in rows).encode("utf-8")
+            exported += len(rows)
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+                if not chunk:
+                    continue
+            yield chunk
+    if compressor is not None:
+        yield compressor.flush()
+    logger.info("events_exported", rows=exported, compressed=compress)
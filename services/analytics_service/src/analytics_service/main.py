@@ -2,13 +2,19 @@ from __future__ import annotations
 
 import asyncio
 
-from fastapi import FastAPI
+from fastapi import FastAPI, status
+from fastapi.responses import JSONResponse, PlainTextResponse
 
-from .api import router as analytics_router
+from .api import admin_router, router as analytics_router
+from .core.consumer_stats import consumers_report
 from .core.errors import register_exception_handlers
 from .core.logging import get_logger, setup_logging
+from .core.metrics import PROMETHEUS_CONTENT_TYPE, REGISTRY
 from .core.middleware import CorrelationIdMiddleware
+from .config import get_settings
 from .message_bus import ensure_consumer_started
+from .partitions import maintenance_loop
+from .top_books import load_own_snapshot, load_peer_snapshots, save_snapshot, snapshot_loop
 
 
 setup_logging()
@@ -25,6 +31,7 @@ app.add_middleware(CorrelationIdMiddleware)
 register_exception_handlers(app)
 
 app.include_router(analytics_router)
+app.include_router(admin_router)
 
 
 @app.get("/health", summary="Healthcheck сервиса", tags=["health"])
@@ -34,19 +41,56 @@ async def healthcheck() -> dict[str, str]:
     return {"status": "ok"}
 
 
+@app.get("/metrics", summary="Метрики в формате Prometheus", tags=["health"], response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    """Текущие значения метрик сервиса в текстовом формате Prometheus."""
+
+    return PlainTextResponse(REGISTRY.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@app.get("/health/consumers", summary="Состояние consumer-ов RabbitMQ", tags=["health"])
+async def consumers_health() -> JSONResponse:
+    """Глубина очередей и пропускная способность consumer-ов; 503, если какой-то из них остановился."""
+
+    healthy, consumers = consumers_report(get_settings().consumer_stall_seconds)
+    return JSONResponse(
+        {"status": "ok" if healthy else "stalled", "consumers": consumers},
+        status_code=status.HTTP_200_OK if healthy else status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
+
+
+_background_tasks: list[asyncio.Task] = []
+
+
 @app.on_event("startup")
 async def on_startup() -> None:
-    """Логирование старта приложения и запуск consumer-а RabbitMQ."""
+    """Логирование старта, загрузка топа книг, обслуживание партиций и запуск consumer-а RabbitMQ."""
 
     logger.info("analytics_service_started")
-    loop = asyncio.get_running_loop()
-    ensure_consumer_started(loop)
+    try:
+        # Свой снапшот прошлого запуска — в локальные окна, остальных процессов — как peers
+        await load_own_snapshot()
+        await load_peer_snapshots()
+    except Exception:
+        logger.exception("top_books_snapshot_restore_failed")
+    settings = get_settings()
+    _background_tasks.append(asyncio.create_task(snapshot_loop(settings.top_books_snapshot_interval_seconds)))
+    # Партиции на ближайшие дни и удаление устаревших, сразу и затем по расписанию
+    _background_tasks.append(asyncio.create_task(maintenance_loop(settings.events_maintenance_interval_seconds)))
+    if settings.consumers_enabled:
+        ensure_consumer_started(asyncio.get_running_loop())
 
 
 @app.on_event("shutdown")
 async def on_shutdown() -> None:
-    """Логирование остановки приложения."""
-
+    """Финальный снапшот топа книг и логирование остановки приложения."""
+
+    for task in _background_tasks:
+        task.cancel()
+    try:
+        await save_snapshot()
+    except Exception:
+        logger.exception("top_books_snapshot_failed")
     logger.info("analytics_service_stopped")
 
 
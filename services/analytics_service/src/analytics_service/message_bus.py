@@ -1,98 +1,406 @@
 from __future__ import annotations
 
 import asyncio
+import hashlib
 import json
 import threading
-from datetime import datetime
-from typing import Any, Dict
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
-import pika
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
 from .config import get_settings
+from .core.consumer_stats import get_consumer_stats, poll_queue_depth
 from .core.logging import get_logger
+from .core.queues import WorkQueue
+from .core.transport import connect
+from .core.metrics import REGISTRY
 from .db import AsyncSessionLocal
-from .models import Event
+from .models import Event, ProcessedEvent
+from .rollups import aggregate, apply_rollups
+from .top_books import get_top_books
+from .unique_buyers import aggregate_buyers, apply_unique_buyers
 
 
 logger = get_logger(__name__)
 
+EVENT_ROUTING_KEYS = ["order.created", "stock.reserve.succeeded", "stock.reserve.failed"]
+
+IDEMPOTENCY_KEY_MAX_LENGTH = 64
+
+EVENTS_TOTAL = REGISTRY.counter(
+    "analytics_events_total",
+    "Сообщения consumer-а по результату: stored, duplicate_recent, duplicate_db, invalid, retried, parked",
+)
+
+EventKey = Tuple[str, str]
+# (method, properties, body, строка) — исходное сообщение нужно для повтора или отстойника
+Delivery = Tuple[Any, Any, bytes, Dict[str, Any]]
+
+
+def event_idempotency_key(idempotency_key: Any, body: bytes) -> str:
+    """Ключ идемпотентности события; без ключа от издателя — sha256 тела сообщения."""
+
+    if isinstance(idempotency_key, str) and 0 < len(idempotency_key) <= IDEMPOTENCY_KEY_MAX_LENGTH:
+        return idempotency_key
+    source = idempotency_key.encode("utf-8") if isinstance(idempotency_key, str) and idempotency_key else body
+    return hashlib.sha256(source).hexdigest()
+
+
+class RecentKeys:
+    """Ограниченный LRU недавно сохранённых ключей: большинство повторов отсекается до БД.
+
+    Фильтр лишь оптимизация — окончательную защиту даёт уникальный индекс.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self._max_size = max_size
+        self._keys: OrderedDict[EventKey, None] = OrderedDict()
+
+    def __contains__(self, key: EventKey) -> bool:
+        if key in self._keys:
+            self._keys.move_to_end(key)
+            return True
+        return False
+
+    def add_all(self, keys: Sequence[EventKey]) -> None:
+        if self._max_size <= 0:
+            return
+        for key in keys:
+            self._keys[key] = None
+            self._keys.move_to_end(key)
+        while len(self._keys) > self._max_size:
+            self._keys.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+def _as_int(value: Any) -> Optional[int]:
+    if isinstance(value, bool):
+        return None
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _as_amount(value: Any) -> Optional[Decimal]:
+    if isinstance(value, bool) or value is None:
+        return None
+    try:
+        amount = Decimal(str(value)).quantize(Decimal("0.01"))
+    except ArithmeticError:
+        return None
+    return amount if amount.is_finite() and abs(amount) < Decimal("1e8") else None
+
+
+def indexed_fields(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Поля payload, которые хранятся в отдельных индексируемых колонках events.
+
+    События stock.reserve.* несут исходный запрос в `original`, оттуда берутся
+    поля, которых нет на верхнем уровне.
+    """
+
+    original = payload.get("original")
+    sources = [payload, original] if isinstance(original, dict) else [payload]
+
+    def lookup(name: str) -> Any:
+        for source in sources:
+            if source.get(name) is not None:
+                return source[name]
+        return None
+
+    return {
+        "order_id": _as_int(lookup("order_id")),
+        "user_id": _as_int(lookup("user_id")),
+        "total_amount": _as_amount(lookup("total_amount")),
+    }
+
+
+def parse_event(routing_key: str, body: bytes) -> Optional[Dict[str, Any]]:
+    """Разобрать сообщение шины в строку таблицы events; None — сообщение некорректно."""
+
+    try:
+        envelope = json.loads(body.decode("utf-8"))
+        idempotency_key = envelope.get("idempotency_key")
+        occurred_at = envelope.get("timestamp")
+        payload: Dict[str, Any] = envelope.get("payload", {})
+    except Exception:
+        logger.warning("invalid_event_payload")
+        return None
+
+    if isinstance(occurred_at, str):
+        try:
+            occurred_at = datetime.fromisoformat(occurred_at.replace("Z", "+00:00"))
+        except ValueError:
+            logger.warning("invalid_event_timestamp", routing_key=routing_key)
+            return None
+
+    # Строка без обязательных полей уронила бы INSERT всей пачки
+    if not isinstance(occurred_at, datetime):
+        logger.warning("event_missing_timestamp", routing_key=routing_key)
+        return None
+    if occurred_at.tzinfo is None:
+        occurred_at = occurred_at.replace(tzinfo=timezone.utc)
+
+    # Часы издателя могут спешить. Событие из далёкого будущего легло бы в
+    # events_default и помешало бы потом создать партицию своего дня
+    now = datetime.now(timezone.utc)
+    if occurred_at > now + timedelta(seconds=get_settings().events_max_clock_skew_seconds):
+        logger.warning("event_timestamp_in_future", routing_key=routing_key, timestamp=occurred_at.isoformat())
+        occurred_at = now
+
+    if isinstance(payload, str):
+        try:
+            payload = json.loads(payload)
+        except json.JSONDecodeError:
+            logger.warning("invalid_event_payload_json", routing_key=routing_key)
+            return None
+
+    if not isinstance(payload, dict):
+        logger.warning("invalid_event_payload", routing_key=routing_key)
+        return None
+
+    return {
+        "routing_key": routing_key,
+        "idempotency_key": event_idempotency_key(idempotency_key, body),
+        "occurred_at": occurred_at,
+        "payload": payload,
+        **indexed_fields(payload),
+    }
+
+
+async def persist_events(rows: Sequence[Dict[str, Any]]) -> int:
+    """Сохранить пачку событий многострочными INSERT в одной транзакции.
+
+    Уже принятые события пропускаются: ключ (routing_key, idempotency_key)
+    сначала вставляется в processed_events через ON CONFLICT DO NOTHING — так
+    отсекается и повторная доставка, и повторная публикация с новым
+    timestamp. В той же транзакции роллапы и дневные HyperLogLog покупателей
+    обновляются только по реально вставленным событиям, после коммита они же
+    попадают в скользящий топ книг. Возвращается их число.
+    """
+
+    if not rows:
+        return 0
+    received_at = datetime.now(timezone.utc)
+    keys = {(row["routing_key"], row["idempotency_key"]): None for row in rows}
+    claim = (
+        pg_insert(ProcessedEvent)
+        .values(
+            [
+                {"routing_key": routing_key, "idempotency_key": idempotency_key, "received_at": received_at}
+                for routing_key, idempotency_key in keys
+            ]
+        )
+        .on_conflict_do_nothing(index_elements=[ProcessedEvent.routing_key, ProcessedEvent.idempotency_key])
+        .returning(ProcessedEvent.routing_key, ProcessedEvent.idempotency_key)
+    )
+    async with AsyncSessionLocal() as session:
+        claimed_keys = set((await session.execute(claim)).tuples().all())
+        claimed = [row for row in rows if (row["routing_key"], row["idempotency_key"]) in claimed_keys]
+        inserted_keys = set()
+        if claimed:
+            # Ключ мог уже выйти из processed_events, а событие — ещё лежать в events
+            stmt = (
+                pg_insert(Event)
+                .values(claimed)
+                .on_conflict_do_nothing(index_elements=[Event.routing_key, Event.idempotency_key, Event.occurred_at])
+                .returning(Event.routing_key, Event.idempotency_key)
+            )
+            inserted_keys = set((await session.execute(stmt)).tuples().all())
+        inserted = [row for row in claimed if (row["routing_key"], row["idempotency_key"]) in inserted_keys]
+        await apply_rollups(session, aggregate(inserted))
+        await apply_unique_buyers(session, aggregate_buyers(inserted, get_settings().unique_buyers_precision))
+        await session.commit()
+    get_top_books().record(inserted)
+    return len(inserted)
+
+
+@dataclass
+class EventBuffer:
+    """Накопленные, но ещё не подтверждённые сообщения.
+
+    Некорректные сообщения тоже попадают в буфер (без строки для вставки):
+    подтверждение идёт одним basic_ack(multiple=True) по последнему тегу,
+    поэтому отдельный ack посреди пачки подтвердил бы тег повторно. Если
+    пачку записать не удалось, сообщения со строками (deliveries) по одному
+    уходят на повтор, а остальные (settled_tags) подтверждаются.
+    """
+
+    max_size: int
+    rows: List[Dict[str, Any]] = field(default_factory=list)
+    keys: Dict[EventKey, None] = field(default_factory=dict)
+    deliveries: List[Delivery] = field(default_factory=list)
+    settled_tags: List[int] = field(default_factory=list)
+    last_tag: int | None = None
+    size: int = 0
+
+    def add(
+        self,
+        delivery_tag: int,
+        row: Optional[Dict[str, Any]],
+        message: Optional[Tuple[Any, Any, bytes]] = None,
+    ) -> None:
+        if row is not None:
+            self.rows.append(row)
+            self.keys[(row["routing_key"], row["idempotency_key"])] = None
+            if message is not None:
+                self.deliveries.append((*message, row))
+        else:
+            self.settled_tags.append(delivery_tag)
+        self.last_tag = delivery_tag
+        self.size += 1
+
+    def __contains__(self, key: EventKey) -> bool:
+        return key in self.keys
+
+    @property
+    def full(self) -> bool:
+        return self.size >= self.max_size
+
+    def drain(self) -> Tuple[int | None, List[Dict[str, Any]]]:
+        drained = (self.last_tag, self.rows)
+        self.rows = []
+        self.keys = {}
+        self.deliveries = []
+        self.settled_tags = []
+        self.last_tag = None
+        self.size = 0
+        return drained
+
 
 class AnalyticsConsumer(threading.Thread):
-    """Фоновый consumer RabbitMQ, пишущий события в БД analytics_service."""
+    """Фоновый consumer RabbitMQ, пишущий события в БД analytics_service пачками.
+
+    Реплики разбирают одну общую durable-очередь. Сообщения копятся до
+    analytics_batch_size штук или analytics_flush_interval_ms с момента первого
+    сообщения в пачке, затем вставляются одной транзакцией и подтверждаются
+    одним ack. При ошибке сообщения пачки уходят на отложенный повтор;
+    исчерпавшие попытки записываются по одному, и в отстойник попадают только
+    те, что не записываются и поодиночке. Гарантия at-least-once сохраняется.
+    """
 
     daemon = True
 
     def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
         super().__init__()
         settings = get_settings()
-        self._connection_params = pika.URLParameters(settings.rabbitmq_url)
+        self._transport = settings.message_transport
+        self._url = settings.rabbitmq_url
         self.exchange = settings.rabbitmq_exchange
         self._loop = loop
+        self._batch_size = max(settings.analytics_batch_size, 1)
+        self._flush_interval = settings.analytics_flush_interval_ms / 1000
+        # Меньший prefetch не даст накопить полную пачку
+        self._prefetch = max(settings.analytics_prefetch_count, self._batch_size)
+        self._recent = RecentKeys(max_size=settings.analytics_recent_keys_size)
+        self.queue = WorkQueue(
+            name=settings.analytics_queue,
+            routing_keys=tuple(EVENT_ROUTING_KEYS),
+            max_retries=settings.rabbitmq_max_retries,
+            retry_delay_ms=settings.rabbitmq_retry_delay_ms,
+        )
+        self._depth_poll_seconds = settings.consumer_depth_poll_seconds
+        self.stats = get_consumer_stats(self.queue.name)
+        self.stats.threads.append(self)
 
     def run(self) -> None:
-        connection = pika.BlockingConnection(self._connection_params)
+        connection = connect(self._transport, self._url)
         channel = connection.channel()
         channel.exchange_declare(exchange=self.exchange, exchange_type="topic", durable=True)
+        channel.basic_qos(prefetch_count=self._prefetch)
+        self.queue.declare(channel, self.exchange)
+        poll_queue_depth(connection, channel, self.queue, self.stats, self._depth_poll_seconds)
 
-        result = channel.queue_declare(queue="", exclusive=True)
-        queue_name = result.method.queue
-
-        # Подписываемся на ключи событий
-        for routing_key in ["order.created", "stock.reserve.succeeded", "stock.reserve.failed"]:
-            channel.queue_bind(exchange=self.exchange, queue=queue_name, routing_key=routing_key)
-
-        def callback(ch, method, properties, body) -> None:  # type: ignore[no-untyped-def]
+        buffer = EventBuffer(max_size=self._batch_size)
+        timer: List[object] = []
+
+        def persist(rows: Sequence[Dict[str, Any]]) -> int:
+            started = time.perf_counter()
             try:
-                envelope = json.loads(body.decode("utf-8"))
-                idempotency_key = envelope.get("idempotency_key")
-                occurred_at = envelope.get("timestamp")
-                payload: Dict[str, Any] = envelope.get("payload", {})
-            except Exception:
-                logger.warning("invalid_event_payload")
-                ch.basic_ack(delivery_tag=method.delivery_tag)
-                return
+                return asyncio.run_coroutine_threadsafe(persist_events(rows), self._loop).result(timeout=10)
+            finally:
+                self.stats.observe_handler(time.perf_counter() - started)
 
-            if isinstance(occurred_at, str):
+        def retry_failed_batch(deliveries: List[Delivery], settled_tags: List[int]) -> None:
+            for tag in settled_tags:
+                channel.basic_ack(delivery_tag=tag)
+            if settled_tags:
+                self.stats.settled("acked", len(settled_tags))
+            for method, properties, body, row in deliveries:
+                if self.queue.attempts(properties) < self.queue.max_retries:
+                    channel.basic_reject(delivery_tag=method.delivery_tag, requeue=False)
+                    EVENTS_TOTAL.inc(result="retried")
+                    self.stats.settled("retried")
+                    continue
+                # Попытки исчерпаны: пачку мог ронять соседний «ядовитый» элемент
                 try:
-                    occurred_at = datetime.fromisoformat(occurred_at.replace("Z", "+00:00"))
-                except ValueError:
-                    logger.warning("invalid_event_timestamp", routing_key=method.routing_key)
-                    ch.basic_ack(delivery_tag=method.delivery_tag)
-                    return
+                    EVENTS_TOTAL.inc(persist([row]), result="stored")
+                    result = "acked"
+                except Exception:
+                    self.queue.park(channel, method.routing_key, properties, body, "persist_failed")
+                    EVENTS_TOTAL.inc(result="parked")
+                    result = "parked"
+                channel.basic_ack(delivery_tag=method.delivery_tag)
+                self.stats.settled(result)
 
-            if isinstance(payload, str):
-                try:
-                    payload = json.loads(payload)
-                except json.JSONDecodeError:
-                    logger.warning("invalid_event_payload_json", routing_key=method.routing_key)
-                    ch.basic_ack(delivery_tag=method.delivery_tag)
-                    return
-
-            async def persist_event() -> None:
-                async with AsyncSessionLocal() as session:  # type: AsyncSession
-                    event = Event(
-                        routing_key=method.routing_key,
-                        idempotency_key=idempotency_key,
-                        occurred_at=occurred_at,
-                        payload=payload,
-                    )
-                    session.add(event)
-                    await session.commit()
-
-            future = asyncio.run_coroutine_threadsafe(persist_event(), self._loop)
+        def flush() -> None:
+            if timer:
+                connection.remove_timeout(timer.pop())
+            deliveries, settled_tags, size = buffer.deliveries, buffer.settled_tags, buffer.size
+            last_tag, rows = buffer.drain()
+            if last_tag is None:
+                return
             try:
-                future.result(timeout=10)
+                inserted = persist(rows)
             except Exception:
-                logger.exception("event_persist_failed", routing_key=method.routing_key)
-                ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+                logger.exception("event_batch_persist_failed", size=len(rows))
+                retry_failed_batch(deliveries, settled_tags)
                 return
+            channel.basic_ack(delivery_tag=last_tag, multiple=True)
+            self.stats.settled("acked", size)
+            # Ключи запоминаются только после успешной вставки, иначе повторная
+            # доставка неудачной пачки была бы отброшена как дубликат
+            self._recent.add_all([(row["routing_key"], row["idempotency_key"]) for row in rows])
+            EVENTS_TOTAL.inc(inserted, result="stored")
+            if len(rows) > inserted:
+                EVENTS_TOTAL.inc(len(rows) - inserted, result="duplicate_db")
+            logger.info("event_batch_stored", size=len(rows), inserted=inserted)
+
+        def on_timer() -> None:
+            timer.clear()
+            flush()
 
-            logger.info("event_stored", routing_key=method.routing_key)
-            ch.basic_ack(delivery_tag=method.delivery_tag)
+        def callback(ch, method, properties, body) -> None:  # type: ignore[no-untyped-def]
+            self.stats.received(redelivered=method.redelivered or self.queue.attempts(properties) > 0)
+            row = parse_event(method.routing_key, body)
+            if row is None:
+                EVENTS_TOTAL.inc(result="invalid")
+                self.queue.park(ch, method.routing_key, properties, body, "invalid_payload")
+            else:
+                key = (row["routing_key"], row["idempotency_key"])
+                if key in self._recent or key in buffer:
+                    EVENTS_TOTAL.inc(result="duplicate_recent")
+                    row = None
+            buffer.add(method.delivery_tag, row, (method, properties, body))
+            if buffer.full:
+                flush()
+            elif not timer:
+                timer.append(connection.call_later(self._flush_interval, on_timer))
 
-        channel.basic_consume(queue=queue_name, on_message_callback=callback, auto_ack=False)
-        logger.info("analytics_consumer_started")
+        channel.basic_consume(queue=self.queue.name, on_message_callback=callback, auto_ack=False)
+        logger.info(
+            "analytics_consumer_started",
+            queue=self.queue.name,
+            batch_size=self._batch_size,
+            prefetch=self._prefetch,
+        )
         channel.start_consuming()
 
 
@@ -1,22 +1,134 @@
 from __future__ import annotations
 
-from datetime import datetime
+from datetime import date, datetime
 
-from sqlalchemy import JSON, DateTime, Integer, String
+from decimal import Decimal
+
+from sqlalchemy import (
+    JSON,
+    BigInteger,
+    Date,
+    DateTime,
+    Index,
+    Integer,
+    LargeBinary,
+    Numeric,
+    String,
+    UniqueConstraint,
+    text,
+)
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, mapped_column
 
 from .db import Base
 
 
 class Event(Base):
-    """Сохранённое доменное событие из шины RabbitMQ."""
+    """Сохранённое доменное событие из шины RabbitMQ (таблица посуточно партиционирована по occurred_at)."""
 
     __tablename__ = "events"
+    __table_args__ = (
+        # Уникальный индекс партиционированной таблицы обязан включать ключ
+        # партиционирования, поэтому ловит только повторную доставку брокером
+        # (timestamp тот же). Повторная публикация того же события получает
+        # новый timestamp — её отсекает ProcessedEvent.
+        UniqueConstraint(
+            "routing_key",
+            "idempotency_key",
+            "occurred_at",
+            name="uq_events_routing_key_idempotency_key",
+        ),
+        Index("ix_events_occurred_at_brin", "occurred_at", postgresql_using="brin"),
+        # История заказа/пользователя — поиск по индексу, а не разбор JSON каждой строки
+        Index(
+            "ix_events_order_id_occurred_at",
+            "order_id",
+            "occurred_at",
+            postgresql_where=text("order_id IS NOT NULL"),
+        ),
+        Index(
+            "ix_events_user_id_occurred_at",
+            "user_id",
+            "occurred_at",
+            postgresql_where=text("user_id IS NOT NULL"),
+        ),
+        Index(
+            "ix_events_payload_gin",
+            "payload",
+            postgresql_using="gin",
+            postgresql_ops={"payload": "jsonb_path_ops"},
+        ),
+        {"postgresql_partition_by": "RANGE (occurred_at)"},
+    )
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    routing_key: Mapped[str] = mapped_column(String(128))
+    idempotency_key: Mapped[str] = mapped_column(String(64))
+    occurred_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    payload: Mapped[dict] = mapped_column(JSONB)
+    # Поля payload, по которым ищут события; заполняются при приёме
+    order_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    user_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    total_amount: Mapped[Decimal | None] = mapped_column(Numeric(10, 2), nullable=True)
+
+
+class ProcessedEvent(Base):
+    """Ключи принятых событий: одно событие попадает в events и роллапы один раз.
+
+    Таблица не партиционирована, поэтому уникальна сама пара (routing_key,
+    idempotency_key), без времени события. Ключи старше
+    processed_events_retention_days удаляются при обслуживании партиций.
+    """
+
+    __tablename__ = "processed_events"
+
+    routing_key: Mapped[str] = mapped_column(String(128), primary_key=True)
+    idempotency_key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    received_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, index=True)
+
+
+class OrderRollup(Base):
+    """Агрегаты заказов за час/день, обновляются инкрементально при приёме событий."""
+
+    __tablename__ = "order_rollups"
+
+    granularity: Mapped[str] = mapped_column(String(8), primary_key=True)
+    bucket_start: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    orders: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    revenue: Mapped[Decimal] = mapped_column(Numeric(14, 2), default=0, nullable=False)
+    units: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    reserve_succeeded: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    reserve_failed: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+
+class BookSalesRollup(Base):
+    """Продажи книги за час/день."""
+
+    __tablename__ = "book_sales_rollups"
+
+    granularity: Mapped[str] = mapped_column(String(8), primary_key=True)
+    bucket_start: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    book_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    orders: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    units: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    revenue: Mapped[Decimal] = mapped_column(Numeric(14, 2), default=0, nullable=False)
+
+
+class TopBooksSnapshot(Base):
+    """Последний снапшот скользящего топа книг процесса (owner) для окна (1h, 1d)."""
+
+    __tablename__ = "top_books_snapshots"
+
+    owner: Mapped[str] = mapped_column(String(128), primary_key=True)
+    window_name: Mapped[str] = mapped_column(String(8), primary_key=True)
+    taken_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    state: Mapped[dict] = mapped_column(JSON)
+
 
-    id: Mapped[int] = mapped_column(primary_key=True)
-    routing_key: Mapped[str] = mapped_column(String(128), index=True)
-    idempotency_key: Mapped[str] = mapped_column(String(64), index=True)
-    occurred_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
-    payload: Mapped[dict] = mapped_column(JSON)
+class DailyUniqueBuyers(Base):
+    """Регистры HyperLogLog покупателей за день (UTC), 2**precision байт."""
 
+    __tablename__ = "daily_unique_buyers"
 
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    registers: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
@@ -0,0 +1,249 @@
+"""Суточные партиции таблицы events и политика хранения.
+
+Сервис сам досоздаёт партиции и удаляет устаревшие (вместе с ключами
+processed_events старше PROCESSED_EVENTS_RETENTION_DAYS) раз в
+EVENTS_MAINTENANCE_INTERVAL_SECONDS; то же можно запустить по расписанию:
+
+    python -m analytics_service.partitions ensure
+    python -m analytics_service.partitions retain --retention-days 90
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import re
+from datetime import date, datetime, time, timedelta, timezone
+from typing import List, Sequence, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from .config import get_settings
+from .core.logging import get_logger, setup_logging
+from .db import engine
+
+
+logger = get_logger(__name__)
+
+TABLE = "events"
+DEFAULT_PARTITION = f"{TABLE}_default"
+
+# Несколько экземпляров сервиса не должны одновременно менять набор партиций
+_TRY_LOCK_SQL = text("SELECT pg_try_advisory_xact_lock(hashtext('analytics_service.partitions'))")
+
+_PARTITIONS_SQL = text(
+    """
+    SELECT child.relname
+    FROM pg_inherits
+    JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+    JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+    WHERE parent.relname = :table
+    """
+)
+
+
+def partition_name(day: date) -> str:
+    return f"{TABLE}_p{day:%Y_%m_%d}"
+
+
+def parse_partition_day(name: str) -> date | None:
+    match = re.fullmatch(rf"{TABLE}_p(\d{{4}})_(\d{{2}})_(\d{{2}})", name)
+    if not match:
+        return None
+    return date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+
+
+def _day_start(day: date) -> datetime:
+    return datetime.combine(day, time.min, tzinfo=timezone.utc)
+
+
+def _utc_midnight(day: date) -> str:
+    return _day_start(day).isoformat()
+
+
+def create_partition_sql(day: date) -> str:
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(day)} PARTITION OF {TABLE} "
+        f"FOR VALUES FROM ('{_utc_midnight(day)}') TO ('{_utc_midnight(day + timedelta(days=1))}')"
+    )
+
+
+def move_from_default_ddl(day: date) -> List[str]:
+    """DDL партиции дня, события которого уже лежат в events_default.
+
+    Пока в партиции по умолчанию есть строки её диапазона, PostgreSQL партицию
+    не создаст: default отсоединяется, строки переносятся в новую партицию,
+    default присоединяется обратно.
+    """
+
+    in_range = f"occurred_at >= '{_utc_midnight(day)}' AND occurred_at < '{_utc_midnight(day + timedelta(days=1))}'"
+    return [
+        f"ALTER TABLE {TABLE} DETACH PARTITION {DEFAULT_PARTITION}",
+        create_partition_sql(day),
+        f"INSERT INTO {partition_name(day)} SELECT * FROM {DEFAULT_PARTITION} WHERE {in_range}",
+        f"DELETE FROM {DEFAULT_PARTITION} WHERE {in_range}",
+        f"ALTER TABLE {TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT",
+    ]
+
+
+def future_partition_days(today: date, days_ahead: int) -> List[date]:
+    """Дни партиций: сегодня и days_ahead следующих."""
+
+    return [today + timedelta(days=offset) for offset in range(days_ahead + 1)]
+
+
+def expired_partitions(names: Sequence[str], today: date, retention_days: int) -> List[Tuple[date, str]]:
+    """Партиции, все события которых старше retention_days дней."""
+
+    cutoff = today - timedelta(days=retention_days)
+    expired = []
+    for name in names:
+        day = parse_partition_day(name)
+        if day is not None and day < cutoff:
+            expired.append((day, name))
+    return sorted(expired)
+
+
+async def _try_lock(conn: AsyncConnection) -> bool:
+    return bool((await conn.execute(_TRY_LOCK_SQL)).scalar())
+
+
+async def ensure_future_partitions(conn: AsyncConnection, days_ahead: int) -> bool:
+    """Досоздать партиции; False — обслуживание уже выполняет другой экземпляр."""
+
+    if not await _try_lock(conn):
+        return False
+    existing = set((await conn.execute(_PARTITIONS_SQL, {"table": TABLE})).scalars().all())
+    for day in future_partition_days(datetime.now(timezone.utc).date(), days_ahead):
+        if partition_name(day) not in existing:
+            await create_partition(conn, day)
+    logger.info("event_partitions_ensured", days_ahead=days_ahead)
+    return True
+
+
+async def create_partition(conn: AsyncConnection, day: date) -> bool:
+    """Создать партицию дня в своей точке сохранения; False — не удалось.
+
+    Ошибка одного дня не откатывает остальные и не останавливает политику
+    хранения. События дня, уже попавшие в events_default, переносятся в новую
+    партицию.
+    """
+
+    try:
+        async with conn.begin_nested():
+            misplaced = (
+                await conn.execute(
+                    text(
+                        f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} "
+                        "WHERE occurred_at >= :start AND occurred_at < :end)"
+                    ),
+                    {"start": _day_start(day), "end": _day_start(day + timedelta(days=1))},
+                )
+            ).scalar()
+            for statement in move_from_default_ddl(day) if misplaced else [create_partition_sql(day)]:
+                await conn.execute(text(statement))
+    except SQLAlchemyError:
+        logger.exception("event_partition_create_failed", partition=partition_name(day))
+        return False
+    if misplaced:
+        logger.info("event_partition_moved_from_default", partition=partition_name(day))
+    return True
+
+
+async def drop_expired_partitions(conn: AsyncConnection, retention_days: int, dry_run: bool = False) -> List[str]:
+    """Удалить партиции старше retention_days и устаревшие строки из партиции по умолчанию.
+
+    Роллупы (order_rollups, book_sales_rollups) пополняются при приёме событий,
+    поэтому удаляемые сырые события уже учтены в агрегатах и отдельная
+    компактация перед удалением не нужна.
+    """
+
+    if not await _try_lock(conn):
+        return []
+    today = datetime.now(timezone.utc).date()
+    names = (await conn.execute(_PARTITIONS_SQL, {"table": TABLE})).scalars().all()
+    expired = expired_partitions(names, today, retention_days)
+    if dry_run:
+        return [name for _, name in expired]
+    for _, name in expired:
+        await conn.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {name}"))
+        await conn.execute(text(f"DROP TABLE {name}"))
+        logger.info("event_partition_dropped", partition=name)
+    # Сюда попадают события с датой вне созданных партиций (сильно опоздавшие)
+    cutoff = datetime.combine(today - timedelta(days=retention_days), time.min, tzinfo=timezone.utc)
+    await conn.execute(text(f"DELETE FROM {DEFAULT_PARTITION} WHERE occurred_at < :cutoff"), {"cutoff": cutoff})
+    return [name for _, name in expired]
+
+
+async def purge_processed_events(conn: AsyncConnection, retention_days: int) -> int:
+    """Удалить ключи принятых событий старше retention_days; число удалённых."""
+
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    result = await conn.execute(text("DELETE FROM processed_events WHERE received_at < :cutoff"), {"cutoff": cutoff})
+    if result.rowcount:
+        logger.info("processed_events_purged", deleted=result.rowcount)
+    return result.rowcount
+
+
+async def run_maintenance() -> None:
+    """Досоздать будущие партиции и применить политику хранения."""
+
+    settings = get_settings()
+    async with engine.begin() as conn:
+        if not await ensure_future_partitions(conn, settings.events_partitions_days_ahead):
+            logger.info("event_partitions_maintenance_skipped")
+            return
+    async with engine.begin() as conn:
+        await drop_expired_partitions(conn, settings.events_retention_days)
+    async with engine.begin() as conn:
+        await purge_processed_events(conn, settings.processed_events_retention_days)
+
+
+async def maintenance_loop(interval_seconds: float) -> None:
+    """Периодическое обслуживание партиций; ошибки не останавливают цикл."""
+
+    while True:
+        try:
+            await run_maintenance()
+        except Exception:
+            logger.exception("event_partitions_maintenance_failed")
+        await asyncio.sleep(interval_seconds)
+
+
+async def _run_command(args: argparse.Namespace) -> None:
+    async with engine.begin() as conn:
+        if args.command == "ensure":
+            done = await ensure_future_partitions(conn, args.days_ahead)
+        else:
+            dropped = await drop_expired_partitions(conn, args.retention_days, dry_run=args.dry_run)
+            if not args.dry_run:
+                await purge_processed_events(conn, get_settings().processed_events_retention_days)
+            done = True
+            for name in dropped:
+                print(("would drop " if args.dry_run else "dropped ") + name)
+    if not done:
+        logger.warning("event_partitions_locked_by_another_instance")
+    await engine.dispose()
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Партиции events")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    ensure = sub.add_parser("ensure", help="создать партиции на ближайшие дни")
+    ensure.add_argument("--days-ahead", type=int, default=settings.events_partitions_days_ahead)
+
+    retain = sub.add_parser("retain", help="удалить партиции старше срока хранения")
+    retain.add_argument("--retention-days", type=int, default=settings.events_retention_days)
+    retain.add_argument("--dry-run", action="store_true", help="только показать партиции к удалению")
+
+    args = parser.parse_args(argv)
+    setup_logging()
+    asyncio.run(_run_command(args))
+
+
+if __name__ == "__main__":
+    main()
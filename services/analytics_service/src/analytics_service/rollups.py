@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Mapping, Tuple
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import BookSalesRollup, OrderRollup
+
+
+GRANULARITIES = ("hour", "day")
+
+RESERVE_SUCCEEDED = "stock.reserve.succeeded"
+RESERVE_FAILED = "stock.reserve.failed"
+ORDER_CREATED = "order.created"
+
+
+def bucket_start(ts: datetime, granularity: str) -> datetime:
+    """Начало часового/дневного интервала (UTC), в который попадает ts."""
+
+    ts = ts.astimezone(timezone.utc) if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+    if granularity == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Unknown granularity: {granularity}")
+
+
+def _decimal(value: Any) -> Decimal:
+    try:
+        return Decimal(str(value)) if value is not None else Decimal(0)
+    except ArithmeticError:
+        return Decimal(0)
+
+
+@dataclass
+class OrderTotals:
+    orders: int = 0
+    revenue: Decimal = Decimal(0)
+    units: int = 0
+    reserve_succeeded: int = 0
+    reserve_failed: int = 0
+
+    def merge(self, other: "OrderTotals") -> None:
+        self.orders += other.orders
+        self.revenue += other.revenue
+        self.units += other.units
+        self.reserve_succeeded += other.reserve_succeeded
+        self.reserve_failed += other.reserve_failed
+
+
+@dataclass
+class BookTotals:
+    orders: int = 0
+    units: int = 0
+    revenue: Decimal = Decimal(0)
+
+    def merge(self, other: "BookTotals") -> None:
+        self.orders += other.orders
+        self.units += other.units
+        self.revenue += other.revenue
+
+
+OrderKey = Tuple[str, datetime]
+BookKey = Tuple[str, datetime, int]
+
+
+@dataclass
+class RollupDelta:
+    """Приращения роллапов по пачке событий; дельты складываются через merge."""
+
+    orders: Dict[OrderKey, OrderTotals] = field(default_factory=dict)
+    books: Dict[BookKey, BookTotals] = field(default_factory=dict)
+
+    def merge(self, other: "RollupDelta") -> "RollupDelta":
+        for key, totals in other.orders.items():
+            self.orders.setdefault(key, OrderTotals()).merge(totals)
+        for key, totals in other.books.items():
+            self.books.setdefault(key, BookTotals()).merge(totals)
+        return self
+
+    def __bool__(self) -> bool:
+        return bool(self.orders or self.books)
+
+
+def _add_order(delta: RollupDelta, occurred_at: datetime, payload: Mapping[str, Any]) -> None:
+    items = [item for item in payload.get("items") or [] if isinstance(item, dict)]
+    units = sum(int(item.get("quantity") or 0) for item in items)
+    for granularity in GRANULARITIES:
+        bucket = bucket_start(occurred_at, granularity)
+        totals = delta.orders.setdefault((granularity, bucket), OrderTotals())
+        totals.orders += 1
+        totals.revenue += _decimal(payload.get("total_amount"))
+        totals.units += units
+        for item in items:
+            if item.get("book_id") is None:
+                continue
+            quantity = int(item.get("quantity") or 0)
+            book = delta.books.setdefault((granularity, bucket, int(item["book_id"])), BookTotals())
+            book.orders += 1
+            book.units += quantity
+            # Цена в событии появилась не сразу — у старых событий выручка по книге 0
+            book.revenue += _decimal(item.get("price")) * quantity
+
+
+def aggregate(rows: Iterable[Mapping[str, Any]]) -> RollupDelta:
+    """Посчитать приращения роллапов по строкам событий (routing_key, occurred_at, payload)."""
+
+    delta = RollupDelta()
+    for row in rows:
+        routing_key = row["routing_key"]
+        occurred_at: datetime = row["occurred_at"]
+        payload = row.get("payload") or {}
+        if routing_key == ORDER_CREATED:
+            _add_order(delta, occurred_at, payload)
+        elif routing_key in (RESERVE_SUCCEEDED, RESERVE_FAILED):
+            for granularity in GRANULARITIES:
+                totals = delta.orders.setdefault((granularity, bucket_start(occurred_at, granularity)), OrderTotals())
+                if routing_key == RESERVE_SUCCEEDED:
+                    totals.reserve_succeeded += 1
+                else:
+                    totals.reserve_failed += 1
+    return delta
+
+
+async def apply_rollups(session: AsyncSession, delta: RollupDelta) -> None:
+    """Прибавить дельту к таблицам роллапов (upsert) в текущей транзакции."""
+
+    if delta.orders:
+        stmt = pg_insert(OrderRollup).values(
+            [
+                {
+                    "granularity": granularity,
+                    "bucket_start": bucket,
+                    "orders": totals.orders,
+                    "revenue": totals.revenue,
+                    "units": totals.units,
+                    "reserve_succeeded": totals.reserve_succeeded,
+                    "reserve_failed": totals.reserve_failed,
+                }
+                for (granularity, bucket), totals in sorted(delta.orders.items())
+            ]
+        )
+        await session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[OrderRollup.granularity, OrderRollup.bucket_start],
+                set_={
+                    column: getattr(OrderRollup, column) + getattr(stmt.excluded, column)
+                    for column in ("orders", "revenue", "units", "reserve_succeeded", "reserve_failed")
+                },
+            )
+        )
+
+    if delta.books:
+        stmt = pg_insert(BookSalesRollup).values(
+            [
+                {
+                    "granularity": granularity,
+                    "bucket_start": bucket,
+                    "book_id": book_id,
+                    "orders": totals.orders,
+                    "units": totals.units,
+                    "revenue": totals.revenue,
+                }
+                for (granularity, bucket, book_id), totals in sorted(delta.books.items())
+            ]
+        )
+        await session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[BookSalesRollup.granularity, BookSalesRollup.bucket_start, BookSalesRollup.book_id],
+                set_={
+                    column: getattr(BookSalesRollup, column) + getattr(stmt.excluded, column)
+                    for column in ("orders", "units", "revenue")
+                },
+            )
+        )
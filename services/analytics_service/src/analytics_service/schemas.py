@@ -1,9 +1,9 @@
 from __future__ import annotations
 
-from datetime import datetime
-from typing import Any, Dict, List
+from datetime import date, datetime
+from typing import Any, Dict, List, Literal, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class ErrorResponse(BaseModel):
@@ -22,14 +22,125 @@ class EventRead(BaseModel):
     idempotency_key: str
     occurred_at: datetime
     payload: Dict[str, Any]
+    order_id: Optional[int] = None
+    user_id: Optional[int] = None
+    total_amount: Optional[float] = None
 
     class Config:
         from_attributes = True
 
 
 class EventList(BaseModel):
-    """Список последних событий."""
+    """Страница последних событий; next_before_id — курсор следующей страницы."""
 
     items: List[EventRead]
+    next_before_id: Optional[int] = None
 
 
+Granularity = Literal["hour", "day"]
+
+
+class SalesBucket(BaseModel):
+    """Агрегаты заказов за один час/день."""
+
+    bucket_start: datetime
+    orders: int
+    revenue: float
+    units: int
+    reserve_succeeded: int
+    reserve_failed: int
+    reserve_success_rate: Optional[float] = None
+
+
+class SalesStats(BaseModel):
+    """Временной ряд продаж и итоги за период."""
+
+    granularity: Granularity
+    start: datetime
+    end: datetime
+    buckets: List[SalesBucket]
+    totals: SalesBucket
+
+
+class BookSales(BaseModel):
+    """Продажи одной книги за период."""
+
+    book_id: int
+    orders: int
+    units: int
+    revenue: float
+
+
+class BookSalesStats(BaseModel):
+    """Книги с наибольшими продажами за период."""
+
+    granularity: Granularity
+    start: datetime
+    end: datetime
+    items: List[BookSales]
+
+
+class UniqueBuyersBucket(BaseModel):
+    """Оценка числа различных покупателей за день/неделю."""
+
+    bucket_start: date
+    unique_buyers: int
+
+
+class UniqueBuyersStats(BaseModel):
+    """Различные покупатели по дням/неделям и за весь период (HyperLogLog).
+
+    `relative_error` — стандартная относительная ошибка оценок.
+    """
+
+    group: Literal["day", "week"]
+    start: date
+    end: date
+    buckets: List[UniqueBuyersBucket]
+    total: int
+    relative_error: float
+
+
+TopBooksWindow = Literal["1h", "1d"]
+
+
+class TopBook(BaseModel):
+    """Оценка продаж книги в скользящем окне."""
+
+    book_id: int
+    units: int
+    error: int
+
+
+class TopBooksStats(BaseModel):
+    """Приближённый топ книг по скользящему окну.
+
+    `units` — оценка сверху, истинное значение не меньше `units - error`.
+    """
+
+    window: TopBooksWindow
+    as_of: datetime
+    total_units: int
+    items: List[TopBook]
+
+
+class ColumnarExportRequest(BaseModel):
+    """Запрос на выгрузку событий (и роллапов) за период в Parquet/Arrow."""
+
+    start: datetime = Field(alias="from")
+    end: datetime = Field(alias="to")
+    format: Literal["parquet", "arrow"] = "parquet"
+    include_rollups: bool = True
+
+
+class ColumnarExportFile(BaseModel):
+    """Файл выгрузки в каталоге COLUMNAR_EXPORT_DIR."""
+
+    name: str
+    size_bytes: Optional[int] = None
+
+
+class ColumnarExportList(BaseModel):
+    """Готовые файлы выгрузок, новые первыми."""
+
+    items: List[ColumnarExportFile]
@@ -0,0 +1,267 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from .config import get_settings
+from .core.logging import get_logger
+from .db import AsyncSessionLocal
+from .models import TopBooksSnapshot
+from .sketches import SpaceSaving
+
+
+logger = get_logger(__name__)
+
+# Окно -> (длина окна, шаг скольжения) в секундах
+WINDOWS: Dict[str, Tuple[int, int]] = {
+    "1h": (3600, 300),
+    "1d": (86400, 3600),
+}
+
+# Снапшоты пишет каждый процесс с consumer-ом под своим именем. Перезапущенный
+# контейнер сохраняет hostname и обычно получает те же PID, поэтому при старте
+# процесс сначала забирает свой прошлый снапшот (load_own_snapshot)
+SNAPSHOT_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class SlidingTopN:
+    """Скользящее окно из панелей фиксированной длины, по сводке Space-Saving на панель.
+
+    Запрос объединяет сводки панелей, попадающих в окно; устаревшие панели
+    выбрасываются целиком, поэтому память ограничена числом панелей × capacity.
+    """
+
+    def __init__(
+        self,
+        window_seconds: int,
+        pane_seconds: int,
+        capacity: int,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.window_seconds = window_seconds
+        self.pane_seconds = pane_seconds
+        self.capacity = capacity
+        self._clock = clock
+        self._panes: Dict[int, SpaceSaving] = {}
+
+    def _oldest_pane(self, now: float) -> int:
+        return int(now - self.window_seconds) // self.pane_seconds + 1
+
+    def _expire(self, now: float) -> None:
+        oldest = self._oldest_pane(now)
+        for pane in [pane for pane in self._panes if pane < oldest]:
+            del self._panes[pane]
+
+    def offer(self, occurred_at: float, item: int, weight: int) -> None:
+        now = self._clock()
+        # Часы издателя могут спешить: «будущие» события относим к текущей панели
+        pane = int(min(occurred_at, now)) // self.pane_seconds
+        if pane < self._oldest_pane(now):
+            return
+        sketch = self._panes.get(pane)
+        if sketch is None:
+            self._expire(now)
+            sketch = self._panes[pane] = SpaceSaving(self.capacity)
+        sketch.offer(item, weight)
+
+    def summary(self) -> SpaceSaving:
+        self._expire(self._clock())
+        merged = SpaceSaving(self.capacity)
+        for sketch in self._panes.values():
+            merged.merge(sketch)
+        return merged
+
+    def to_state(self) -> Dict[str, Any]:
+        return {str(pane): sketch.to_state() for pane, sketch in self._panes.items()}
+
+    def load_state(self, state: Mapping[str, Any]) -> None:
+        self._panes = {int(pane): SpaceSaving.from_state(self.capacity, data) for pane, data in state.items()}
+        self._expire(self._clock())
+
+    def merge_state(self, state: Mapping[str, Any]) -> None:
+        """Добавить панели другого экземпляра: сводки одной панели объединяются."""
+
+        for pane, data in state.items():
+            sketch = SpaceSaving.from_state(self.capacity, data)
+            existing = self._panes.get(int(pane))
+            self._panes[int(pane)] = existing.merge(sketch) if existing is not None else sketch
+        self._expire(self._clock())
+
+
+class TopBooks:
+    """Приближённый топ продаваемых книг по скользящим окнам (по экземплярам из order.created).
+
+    Обновляется из consumer-а после коммита пачки, читается обработчиками
+    запросов и задачей снапшотов, поэтому операции защищены блокировкой.
+    События делят между собой consumer-ы всех реплик и воркеров, поэтому
+    топ объединяет локальные окна с последними снапшотами остальных
+    процессов (peers): сводки Space-Saving складываются без потери гарантий.
+    """
+
+    def __init__(self, capacity: int, clock: Callable[[], float] = time.time) -> None:
+        self.capacity = capacity
+        self._clock = clock
+        self.windows = self._empty_windows()
+        self._peers: Dict[str, SlidingTopN] = {}
+        self._lock = threading.Lock()
+
+    def _empty_windows(self) -> Dict[str, SlidingTopN]:
+        return {
+            name: SlidingTopN(window, pane, self.capacity, clock=self._clock)
+            for name, (window, pane) in WINDOWS.items()
+        }
+
+    def record(self, rows: Iterable[Mapping[str, Any]]) -> None:
+        with self._lock:
+            for row in rows:
+                if row["routing_key"] != "order.created":
+                    continue
+                occurred_at = row["occurred_at"].timestamp()
+                for item in (row.get("payload") or {}).get("items") or []:
+                    if not isinstance(item, dict) or item.get("book_id") is None:
+                        continue
+                    quantity = int(item.get("quantity") or 0)
+                    for window in self.windows.values():
+                        window.offer(occurred_at, int(item["book_id"]), quantity)
+
+    def top(self, window: str, n: int) -> Tuple[int, List[Tuple[int, int, int]]]:
+        """Всего экземпляров в окне и n книг с наибольшей оценкой: (book_id, units, error)."""
+
+        with self._lock:
+            summary = self.windows[window].summary()
+            peers = self._peers.get(window)
+            if peers is not None:
+                summary.merge(peers.summary())
+        return summary.total, summary.top(n)  # type: ignore[return-value]
+
+    def to_state(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {name: window.to_state() for name, window in self.windows.items()}
+
+    def load_state(self, states: Mapping[str, Mapping[str, Any]]) -> None:
+        with self._lock:
+            for name, state in states.items():
+                if name in self.windows:
+                    self.windows[name].load_state(state)
+
+    def restore(self, states: Mapping[str, Mapping[str, Any]]) -> None:
+        """Добавить к локальным окнам снапшот прошлого запуска этого процесса.
+
+        Сводки складываются, а не заменяются: consumer мог успеть учесть
+        события до загрузки снапшота.
+        """
+
+        with self._lock:
+            for name, state in states.items():
+                if name in self.windows:
+                    self.windows[name].merge_state(state)
+
+    def load_peers(self, peer_states: Iterable[Mapping[str, Mapping[str, Any]]]) -> None:
+        """Заменить объединённое состояние других процессов их снапшотами."""
+
+        peers = self._empty_windows()
+        for states in peer_states:
+            for name, state in states.items():
+                if name in peers:
+                    peers[name].merge_state(state)
+        with self._lock:
+            self._peers = peers
+
+
+_top_books: TopBooks | None = None
+_top_books_lock = threading.Lock()
+
+
+def get_top_books() -> TopBooks:
+    """Получить singleton скользящего топа книг."""
+
+    global _top_books
+    if _top_books is None:
+        with _top_books_lock:
+            if _top_books is None:
+                _top_books = TopBooks(capacity=get_settings().top_books_capacity)
+    return _top_books
+
+
+async def save_snapshot() -> None:
+    """Сохранить состояние окон этого процесса (по строке на окно) и удалить снапшоты старше окон.
+
+    Процесс без consumer-а (CONSUMERS_ENABLED=false) ничего не считает и
+    снапшот не пишет. Снапшоты завершившихся процессов остаются в чужих топах,
+    пока их панели не выйдут из окна.
+    """
+
+    states = get_top_books().to_state()
+    now = datetime.now(timezone.utc)
+    oldest = now - timedelta(seconds=max(window for window, _ in WINDOWS.values()))
+    async with AsyncSessionLocal() as session:
+        await session.execute(delete(TopBooksSnapshot).where(TopBooksSnapshot.taken_at < oldest))
+        if any(states.values()):
+            stmt = pg_insert(TopBooksSnapshot).values(
+                [
+                    {"owner": SNAPSHOT_OWNER, "window_name": name, "taken_at": now, "state": state}
+                    for name, state in sorted(states.items())
+                ]
+            )
+            await session.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[TopBooksSnapshot.owner, TopBooksSnapshot.window_name],
+                    set_={"taken_at": stmt.excluded.taken_at, "state": stmt.excluded.state},
+                )
+            )
+        await session.commit()
+
+
+async def _load_snapshots(own: bool) -> Dict[str, Dict[str, Any]]:
+    """Снапшоты этого процесса (own) или остальных: owner -> окно -> состояние."""
+
+    if own:
+        condition = TopBooksSnapshot.owner == SNAPSHOT_OWNER
+    else:
+        condition = TopBooksSnapshot.owner != SNAPSHOT_OWNER
+    async with AsyncSessionLocal() as session:
+        snapshots = (await session.execute(select(TopBooksSnapshot).where(condition))).scalars().all()
+    by_owner: Dict[str, Dict[str, Any]] = {}
+    for snapshot in snapshots:
+        by_owner.setdefault(snapshot.owner, {})[snapshot.window_name] = snapshot.state
+    return by_owner
+
+
+async def load_own_snapshot() -> None:
+    """Вернуть в локальные окна снапшот прошлого процесса с тем же SNAPSHOT_OWNER.
+
+    Вызывается при старте до первого save_snapshot, иначе он перезаписал бы
+    историю окон пустым состоянием.
+    """
+
+    states = (await _load_snapshots(own=True)).get(SNAPSHOT_OWNER)
+    if states:
+        get_top_books().restore(states)
+        logger.info("top_books_snapshot_restored", owner=SNAPSHOT_OWNER)
+
+
+async def load_peer_snapshots() -> None:
+    """Загрузить снапшоты остальных процессов; панели старше окна отбрасываются."""
+
+    get_top_books().load_peers((await _load_snapshots(own=False)).values())
+
+
+async def snapshot_loop(interval_seconds: float, load_peers: bool = True) -> None:
+    """Периодически сохранять свой снапшот и подгружать чужие; ошибки БД не останавливают цикл."""
+
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await save_snapshot()
+            if load_peers:
+                await load_peer_snapshots()
+        except Exception:
+            logger.exception("top_books_snapshot_failed")
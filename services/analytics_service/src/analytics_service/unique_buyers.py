@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+from datetime import date, timedelta, timezone
+from typing import Any, Dict, Iterable, Mapping
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import DailyUniqueBuyers
+from .sketches import HyperLogLog
+
+
+def aggregate_buyers(rows: Iterable[Mapping[str, Any]], precision: int) -> Dict[date, HyperLogLog]:
+    """HyperLogLog покупателей по дням (UTC) из строк событий order.created с user_id."""
+
+    sketches: Dict[date, HyperLogLog] = {}
+    for row in rows:
+        if row["routing_key"] != "order.created" or row.get("user_id") is None:
+            continue
+        day = row["occurred_at"].astimezone(timezone.utc).date()
+        sketch = sketches.get(day)
+        if sketch is None:
+            sketch = sketches[day] = HyperLogLog(precision)
+        sketch.add(row["user_id"])
+    return sketches
+
+
+async def apply_unique_buyers(session: AsyncSession, sketches: Mapping[date, HyperLogLog]) -> None:
+    """Объединить дневные сводки с сохранёнными в текущей транзакции.
+
+    Побайтовый максимум регистров в SQL не выразить, поэтому строки дней
+    блокируются (FOR UPDATE, в порядке дат), объединяются в Python и
+    перезаписываются. Повторное добавление того же покупателя регистры не меняет.
+    """
+
+    if not sketches:
+        return
+    days = sorted(sketches)
+    precision = sketches[days[0]].precision
+    empty = bytes(1 << precision)
+    await session.execute(
+        pg_insert(DailyUniqueBuyers)
+        .values([{"day": day, "registers": empty} for day in days])
+        .on_conflict_do_nothing(index_elements=[DailyUniqueBuyers.day])
+    )
+    result = await session.execute(
+        select(DailyUniqueBuyers)
+        .where(DailyUniqueBuyers.day.in_(days))
+        .order_by(DailyUniqueBuyers.day)
+        .with_for_update()
+    )
+    for stored in result.scalars().all():
+        merged = HyperLogLog.from_bytes(stored.registers).merge(sketches[stored.day])
+        stored.registers = merged.to_bytes()
+
+
+async def load_daily_sketches(session: AsyncSession, start: date, end: date) -> Dict[date, HyperLogLog]:
+    """Сохранённые сводки за дни [start, end)."""
+
+    result = await session.execute(
+        select(DailyUniqueBuyers).where(DailyUniqueBuyers.day >= start, DailyUniqueBuyers.day < end)
+    )
+    return {row.day: HyperLogLog.from_bytes(row.registers) for row in result.scalars().all()}
+
+
+def week_start(day: date) -> date:
+    """Понедельник недели (ISO), в которую попадает день."""
+
+    return day - timedelta(days=day.weekday())
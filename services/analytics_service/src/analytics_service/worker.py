@@ -0,0 +1,71 @@
+"""Процесс-воркер аналитики: consumer-ы общей очереди событий без HTTP.
+
+HTTP-процессы запускаются с CONSUMERS_ENABLED=false, а очередь разбирают воркеры,
+которые масштабируются отдельно от API:
+
+    python -m analytics_service.worker --processes 2 --concurrency 1
+
+Топ книг воркер отдаёт HTTP-процессам через снапшоты top_books_snapshots.
+Метрики и /health/consumers процесса N — на порту WORKER_METRICS_PORT + N.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import functools
+from typing import Optional, Sequence
+
+from .config import get_settings
+from .core.logging import get_logger, setup_logging
+from .core.worker import run_worker_processes, serve_consumers, start_metrics_server
+from .db import engine
+from .message_bus import AnalyticsConsumer
+from .top_books import load_own_snapshot, save_snapshot, snapshot_loop
+
+
+logger = get_logger(__name__)
+
+
+async def _serve(concurrency: int) -> int:
+    settings = get_settings()
+    try:
+        await load_own_snapshot()
+    except Exception:
+        logger.exception("top_books_snapshot_restore_failed")
+    # Чужие снапшоты воркеру не нужны: топ читают HTTP-процессы
+    snapshots = asyncio.create_task(snapshot_loop(settings.top_books_snapshot_interval_seconds, load_peers=False))
+    try:
+        return await serve_consumers(AnalyticsConsumer, concurrency)
+    finally:
+        snapshots.cancel()
+        try:
+            await save_snapshot()
+        except Exception:
+            logger.exception("top_books_snapshot_failed")
+        await engine.dispose()
+
+
+def run(concurrency: int, metrics_port: int, index: int) -> int:
+    """Точка входа одного процесса-воркера."""
+
+    setup_logging()
+    settings = get_settings()
+    if metrics_port:
+        start_metrics_server(metrics_port + index, settings.consumer_stall_seconds)
+    return asyncio.run(_serve(concurrency))
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Воркер consumer-ов analytics-service")
+    parser.add_argument("--processes", type=int, default=settings.worker_processes)
+    parser.add_argument("--concurrency", type=int, default=settings.worker_concurrency, help="consumer-ов на процесс")
+    parser.add_argument("--metrics-port", type=int, default=settings.worker_metrics_port, help="0 — без /metrics")
+    args = parser.parse_args(argv)
+    target = functools.partial(run, args.concurrency, args.metrics_port)
+    raise SystemExit(run_worker_processes(target, args.processes))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import pytest
 from fastapi.testclient import TestClient
 
 from analytics_service.main import app
@@ -14,3 +15,564 @@ def test_events_endpoint_works():
     assert "items" in data
 
 
+
+
+def test_parse_event_and_buffer_batching():
+    import json
+
+    from analytics_service.message_bus import EventBuffer, parse_event
+
+    body = json.dumps(
+        {
+            "idempotency_key": "key-1",
+            "timestamp": "2025-01-01T12:00:00Z",
+            "payload": {"order_id": 10},
+        }
+    ).encode("utf-8")
+    row = parse_event("order.created", body)
+    assert row["idempotency_key"] == "key-1"
+    assert row["occurred_at"].tzinfo is not None
+    assert row["payload"] == {"order_id": 10}
+    assert parse_event("order.created", b"not json") is None
+    assert parse_event("order.created", b'{"idempotency_key": "k", "timestamp": "bad"}') is None
+    # Время из далёкого будущего (спешащие часы издателя) заменяется временем приёма
+    future = json.dumps({"timestamp": "2999-01-01T00:00:00Z", "payload": {}}).encode("utf-8")
+    assert parse_event("order.created", future)["occurred_at"].year < 2999
+
+    buffer = EventBuffer(max_size=3)
+    buffer.add(1, row)
+    buffer.add(2, None)
+    assert not buffer.full
+    buffer.add(3, row)
+    assert buffer.full
+
+    last_tag, rows = buffer.drain()
+    assert last_tag == 3 and len(rows) == 2
+    assert buffer.drain() == (None, [])
+
+
+def test_idempotency_key_fallback_and_recent_keys():
+    import hashlib
+
+    from analytics_service.message_bus import RecentKeys, event_idempotency_key
+
+    body = b'{"payload": {}}'
+    assert event_idempotency_key("key-1", body) == "key-1"
+    assert event_idempotency_key(None, body) == hashlib.sha256(body).hexdigest()
+    assert len(event_idempotency_key("x" * 100, body)) == 64
+
+    recent = RecentKeys(max_size=2)
+    recent.add_all([("order.created", "a"), ("order.created", "b")])
+    assert ("order.created", "a") in recent
+    recent.add_all([("order.created", "c")])
+    assert ("order.created", "b") not in recent
+    assert ("order.created", "a") in recent and len(recent) == 2
+
+
+def test_aggregate_builds_mergeable_rollups():
+    from datetime import datetime, timezone
+    from decimal import Decimal
+
+    from analytics_service.rollups import aggregate
+
+    at = datetime(2025, 1, 1, 12, 30, tzinfo=timezone.utc)
+    order = {
+        "routing_key": "order.created",
+        "occurred_at": at,
+        "payload": {
+            "total_amount": 31.5,
+            "items": [{"book_id": 1, "quantity": 2, "price": 10.5}, {"book_id": 5, "quantity": 1, "price": 10.5}],
+        },
+    }
+    failed = {"routing_key": "stock.reserve.failed", "occurred_at": at, "payload": {}}
+
+    delta = aggregate([order, failed])
+    hour = delta.orders[("hour", datetime(2025, 1, 1, 12, tzinfo=timezone.utc))]
+    assert (hour.orders, hour.units, hour.revenue, hour.reserve_failed) == (1, 3, Decimal("31.5"), 1)
+    day_book = delta.books[("day", datetime(2025, 1, 1, tzinfo=timezone.utc), 1)]
+    assert (day_book.units, day_book.revenue) == (2, Decimal("21.0"))
+
+    merged = delta.merge(aggregate([order]))
+    assert merged.orders[("day", datetime(2025, 1, 1, tzinfo=timezone.utc))].orders == 2
+    assert merged.books[("hour", datetime(2025, 1, 1, 12, tzinfo=timezone.utc), 5)].units == 2
+
+
+def test_stats_rejects_empty_range():
+    response = client.get(
+        "/stats/sales",
+        params={"start": "2025-01-02T00:00:00Z", "end": "2025-01-01T00:00:00Z"},
+    )
+    assert response.status_code == 400
+
+
+def test_space_saving_and_sliding_top_books():
+    from datetime import datetime, timezone
+
+    from analytics_service.sketches import SpaceSaving
+    from analytics_service.top_books import TopBooks
+
+    sketch = SpaceSaving(capacity=2)
+    for item, weight in [(1, 5), (2, 3), (3, 1), (1, 2)]:
+        sketch.offer(item, weight)
+    assert sketch.top(1) == [(1, 7, 0)]
+    # 3 вытеснил 2 и унаследовал его счётчик как погрешность
+    assert sketch.top(2)[1] == (3, 4, 3)
+    restored = SpaceSaving.from_state(2, sketch.to_state())
+    assert restored.top(2) == sketch.top(2) and restored.total == 11
+
+    now = [datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc).timestamp()]
+    top = TopBooks(capacity=10, clock=lambda: now[0])
+
+    def order(minute: int, book_id: int, quantity: int) -> dict:
+        return {
+            "routing_key": "order.created",
+            "occurred_at": datetime(2025, 1, 1, 11, minute, tzinfo=timezone.utc),
+            "payload": {"items": [{"book_id": book_id, "quantity": quantity}]},
+        }
+
+    top.record([order(10, 1, 2), order(50, 2, 5), order(55, 1, 1)])
+    assert top.top("1h", 2) == (8, [(2, 5, 0), (1, 3, 0)])
+
+    now[0] += 30 * 60
+    # Панель с 11:10 вышла из часового окна, но остаётся в суточном
+    assert top.top("1h", 2) == (6, [(2, 5, 0), (1, 1, 0)])
+    assert top.top("1d", 1)[1] == [(2, 5, 0)]
+
+    clone = TopBooks(capacity=10, clock=lambda: now[0])
+    clone.load_state(top.to_state())
+    assert clone.top("1d", 2) == top.top("1d", 2)
+
+    # События другого процесса-воркера приходят его снапшотом и складываются с локальными
+    worker = TopBooks(capacity=10, clock=lambda: now[0])
+    worker.record([order(50, 1, 4)])
+    top.load_peers([worker.to_state()])
+    assert top.top("1d", 2) == (12, [(1, 7, 0), (2, 5, 0)])
+    top.load_peers([])
+    assert top.top("1d", 1) == (8, [(2, 5, 0)])
+
+    # Снапшот прошлого запуска складывается с тем, что процесс уже успел учесть
+    restarted = TopBooks(capacity=10, clock=lambda: now[0])
+    restarted.record([order(50, 1, 4)])
+    restarted.restore(top.to_state())
+    assert restarted.top("1d", 2) == (12, [(1, 7, 0), (2, 5, 0)])
+
+
+def test_top_books_endpoint():
+    response = client.get("/stats/top-books", params={"window": "1h"})
+    assert response.status_code == 200
+    assert response.json()["window"] == "1h"
+    assert client.get("/stats/top-books", params={"window": "7d"}).status_code == 422
+
+
+def test_event_partition_names_and_retention():
+    from datetime import date
+
+    from analytics_service.partitions import (
+        create_partition_sql,
+        expired_partitions,
+        future_partition_days,
+        move_from_default_ddl,
+        parse_partition_day,
+        partition_name,
+    )
+
+    assert partition_name(date(2025, 1, 31)) == "events_p2025_01_31"
+    assert parse_partition_day("events_p2025_01_31") == date(2025, 1, 31)
+    assert parse_partition_day("events_default") is None
+    assert "TO ('2025-02-01T00:00:00+00:00')" in create_partition_sql(date(2025, 1, 31))
+    assert future_partition_days(date(2025, 1, 31), 7)[-1] == date(2025, 2, 7)
+    # Строки дня из events_default переносятся, пока default отсоединена
+    moved = move_from_default_ddl(date(2025, 1, 31))
+    assert moved[0] == "ALTER TABLE events DETACH PARTITION events_default"
+    assert moved[2].startswith("INSERT INTO events_p2025_01_31 SELECT * FROM events_default WHERE")
+    assert moved[-1] == "ALTER TABLE events ATTACH PARTITION events_default DEFAULT"
+
+    names = ["events_p2025_01_01", "events_p2025_01_02", "events_p2025_01_03", "events_default"]
+    assert expired_partitions(names, date(2025, 1, 4), retention_days=2) == [(date(2025, 1, 1), "events_p2025_01_01")]
+
+
+def test_parse_event_promotes_indexed_fields():
+    import json
+    from decimal import Decimal
+
+    from analytics_service.message_bus import parse_event
+
+    created = parse_event(
+        "order.created",
+        json.dumps(
+            {
+                "timestamp": "2025-01-01T12:00:00Z",
+                "payload": {"order_id": 10, "user_id": 1, "total_amount": 31.5},
+            }
+        ).encode("utf-8"),
+    )
+    assert (created["order_id"], created["user_id"], created["total_amount"]) == (10, 1, Decimal("31.50"))
+
+    failed = parse_event(
+        "stock.reserve.failed",
+        json.dumps(
+            {
+                "timestamp": "2025-01-01T12:00:01Z",
+                "payload": {"reason": "not_enough_stock", "original": {"order_id": 10, "user_id": "x"}},
+            }
+        ).encode("utf-8"),
+    )
+    assert (failed["order_id"], failed["user_id"], failed["total_amount"]) == (10, None, None)
+
+
+def test_events_filters_validation():
+    assert client.get("/events", params={"from": "not-a-date"}).status_code == 422
+    response = client.get("/events", params={"from": "2025-01-02T00:00:00Z", "to": "2025-01-01T00:00:00Z"})
+    assert response.status_code == 400
+
+
+def test_events_limit_is_bounded_and_export_record_is_json():
+    import json
+    from datetime import datetime, timezone
+    from decimal import Decimal
+
+    from analytics_service.event_export import event_record
+
+    assert client.get("/events", params={"limit": 100000}).status_code == 422
+    assert client.get("/events", params={"limit": 0}).status_code == 422
+
+    record = event_record(
+        {
+            "id": 7,
+            "routing_key": "order.created",
+            "idempotency_key": "k",
+            "occurred_at": datetime(2025, 1, 1, 12, tzinfo=timezone.utc),
+            "order_id": 10,
+            "user_id": 1,
+            "total_amount": Decimal("31.50"),
+            "payload": {"order_id": 10},
+        }
+    )
+    assert json.loads(json.dumps(record)) == {
+        "id": 7,
+        "routing_key": "order.created",
+        "idempotency_key": "k",
+        "occurred_at": "2025-01-01T12:00:00+00:00",
+        "order_id": 10,
+        "user_id": 1,
+        "total_amount": 31.5,
+        "payload": {"order_id": 10},
+    }
+
+
+def test_flatten_event_and_admin_exports_require_admin():
+    from datetime import datetime, timezone
+
+    from analytics_service.columnar_export import export_file_names, flatten_event, resolve_export
+
+    row = flatten_event(
+        {
+            "id": 1,
+            "routing_key": "stock.reserve.succeeded",
+            "idempotency_key": "k",
+            "occurred_at": datetime(2025, 1, 1, tzinfo=timezone.utc),
+            "order_id": 10,
+            "user_id": None,
+            "total_amount": None,
+            "payload": {"original": {"order_id": 10, "items": [{"book_id": 1, "quantity": 2}]}},
+        }
+    )
+    assert (row["book_ids"], row["units"], row["item_count"], row["status"]) == ([1], 2, 1, None)
+
+    names = export_file_names(
+        datetime(2025, 1, 1, tzinfo=timezone.utc), datetime(2025, 2, 1, tzinfo=timezone.utc), "parquet", True
+    )
+    assert names[0] == "events_20250101T000000Z_20250201T000000Z.parquet" and len(names) == 3
+    assert resolve_export("../etc/passwd") is None
+
+    assert client.get("/admin/exports").status_code in (401, 403)
+
+
+def test_columnar_writer_row_groups(tmp_path):
+    from datetime import datetime, timezone
+
+    import pyarrow.parquet as pq
+
+    from analytics_service.columnar_export import ColumnarWriter, event_schema, flatten_event
+
+    rows = [
+        flatten_event(
+            {
+                "id": i,
+                "routing_key": "order.created",
+                "idempotency_key": str(i),
+                "occurred_at": datetime(2025, 1, 1, tzinfo=timezone.utc),
+                "order_id": i,
+                "user_id": 1,
+                "total_amount": 10.5,
+                "payload": {"status": "created", "items": [{"book_id": 1, "quantity": 1}]},
+            }
+        )
+        for i in range(5)
+    ]
+    path = tmp_path / "events.parquet"
+    writer = ColumnarWriter(path, event_schema(), "parquet")
+    writer.write_rows(rows[:3])
+    writer.write_rows(rows[3:])
+    writer.close()
+
+    parquet = pq.ParquetFile(path)
+    assert parquet.metadata.num_row_groups == 2
+    table = parquet.read()
+    assert table.num_rows == 5 and table.column("total_amount").to_pylist()[0] == 10.5
+
+
+def test_hyperloglog_accuracy_and_daily_merge():
+    from datetime import date, datetime, timezone
+
+    from analytics_service.sketches import HyperLogLog
+    from analytics_service.unique_buyers import aggregate_buyers, week_start
+
+    first, second = HyperLogLog(12), HyperLogLog(12)
+    for user_id in range(20000):
+        first.add(user_id)
+    for user_id in range(10000, 30000):
+        second.add(user_id)
+    assert abs(first.count() - 20000) / 20000 < 0.05
+    merged = HyperLogLog.from_bytes(first.to_bytes()).merge(second)
+    assert abs(merged.count() - 30000) / 30000 < 0.05
+    assert HyperLogLog(12).count() == 0
+
+    def order(day: int, user_id: int) -> dict:
+        return {
+            "routing_key": "order.created",
+            "occurred_at": datetime(2025, 1, day, 12, tzinfo=timezone.utc),
+            "user_id": user_id,
+        }
+
+    sketches = aggregate_buyers([order(1, 1), order(1, 1), order(1, 2), order(2, 1)], precision=10)
+    assert sketches[date(2025, 1, 1)].count() == 2 and sketches[date(2025, 1, 2)].count() == 1
+    assert week_start(date(2025, 1, 5)) == date(2024, 12, 30)
+
+
+def test_unique_buyers_rejects_bad_range():
+    response = client.get("/stats/unique-buyers", params={"start": "2025-01-08", "end": "2025-01-01"})
+    assert response.status_code == 400
+    response = client.get("/stats/unique-buyers", params={"start": "2023-01-01", "end": "2025-01-01"})
+    assert response.status_code == 400
+
+
+def test_replay_slices_and_partial_aggregates_merge():
+    import json
+    from datetime import date, datetime, timezone
+
+    from analytics_service.replay import PartialAggregate, _envelopes, rebuild_range_error, time_slices
+
+    assert time_slices(date(2025, 1, 1), date(2025, 1, 6), 2) == [
+        (date(2025, 1, 1), date(2025, 1, 3)),
+        (date(2025, 1, 3), date(2025, 1, 5)),
+        (date(2025, 1, 5), date(2025, 1, 6)),
+    ]
+
+    # Из таблицы events — только дни, партиции которых ещё не удалены политикой хранения
+    today = date(2025, 4, 1)
+    assert rebuild_range_error(date(2025, 1, 1), date(2025, 3, 1), today, 90, False, False) is None
+    assert "--files" in rebuild_range_error(date(2024, 1, 1), date(2025, 1, 1), today, 90, False, False)
+    assert rebuild_range_error(date(2024, 1, 1), date(2025, 1, 1), today, 90, True, False) is None
+    assert "--include-today" in rebuild_range_error(date(2025, 3, 1), date(2025, 4, 2), today, 90, False, False)
+
+    def order(day: int, user_id: int) -> dict:
+        return {
+            "routing_key": "order.created",
+            "idempotency_key": f"{day}-{user_id}",
+            "occurred_at": datetime(2025, 1, day, 12, tzinfo=timezone.utc),
+            "user_id": user_id,
+            "payload": {"total_amount": 10, "items": [{"book_id": 1, "quantity": 1, "price": 10}]},
+        }
+
+    rows = [order(1, 1), order(1, 2), order(2, 1), order(2, 3)]
+    whole = PartialAggregate()
+    whole.add_rows(rows, precision=10)
+    first, second = PartialAggregate(), PartialAggregate()
+    first.add_rows(rows[:1] + rows[2:3], precision=10)
+    second.add_rows(rows[1:2] + rows[3:], precision=10)
+    merged = first.merge(second)
+
+    assert merged.events == whole.events == 4
+    assert merged.rollups.orders == whole.rollups.orders
+    assert merged.rollups.books == whole.rollups.books
+    assert {day: sketch.count() for day, sketch in merged.buyers.items()} == {
+        date(2025, 1, 1): 2,
+        date(2025, 1, 2): 2,
+    }
+
+    routing_key, body = next(_envelopes(rows[:1], fresh_keys=False))
+    envelope = json.loads(body)
+    assert routing_key == "order.created"
+    assert envelope["idempotency_key"] == "1-1" and envelope["payload"]["total_amount"] == 10
+    assert json.loads(next(_envelopes(rows[:1], fresh_keys=True))[1])["idempotency_key"] != "1-1"
+
+
+def test_event_buffer_keeps_deliveries_for_retry():
+    from analytics_service.message_bus import EventBuffer
+
+    row = {"routing_key": "order.created", "idempotency_key": "k"}
+    buffer = EventBuffer(max_size=10)
+    buffer.add(1, row, ("method-1", "props-1", b"1"))
+    buffer.add(2, None, ("method-2", "props-2", b"2"))
+    assert buffer.deliveries == [("method-1", "props-1", b"1", row)]
+    assert buffer.settled_tags == [2]
+
+    assert buffer.drain() == (2, [row])
+    assert buffer.deliveries == [] and buffer.settled_tags == []
+
+
+def test_consumers_health_endpoint():
+    # Без startup consumer-ы не запущены
+    response = client.get("/health/consumers")
+    assert response.status_code == 200
+    assert response.json() == {"status": "ok", "consumers": []}
+    assert "# TYPE consumer_queue_depth gauge" in client.get("/metrics").text
+
+
+def test_consumer_batches_and_retries_on_memory_transport(monkeypatch):
+    import asyncio
+    import json
+    import threading
+
+    from analytics_service import message_bus
+    from analytics_service.config import get_settings
+    from analytics_service.core.transport import InMemoryBroker, set_memory_broker
+
+    settings = get_settings()
+    broker = InMemoryBroker()
+    set_memory_broker(broker)
+    monkeypatch.setattr(settings, "message_transport", "memory")
+    monkeypatch.setattr(settings, "analytics_batch_size", 3)
+    monkeypatch.setattr(settings, "rabbitmq_retry_delay_ms", 20)
+
+    batches = []
+
+    async def persist(rows):
+        batches.append([row["idempotency_key"] for row in rows])
+        if len(batches) == 1:
+            raise RuntimeError("database is down")
+        return len(rows)
+
+    monkeypatch.setattr(message_bus, "persist_events", persist)
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    publisher = broker.connect().channel()
+    publisher.exchange_declare(exchange=settings.rabbitmq_exchange, exchange_type="topic", durable=True)
+    consumer = message_bus.AnalyticsConsumer(loop)
+    consumer.start()
+    # Первый опрос глубины идёт сразу после объявления очередей consumer-ом
+    while consumer.stats.depth_checked_at is None:
+        threading.Event().wait(0.01)
+
+    for key in ("a", "b", "c"):
+        envelope = {"idempotency_key": key, "timestamp": "2025-01-01T00:00:00+00:00", "payload": {}}
+        publisher.basic_publish(settings.rabbitmq_exchange, "order.created", json.dumps(envelope).encode("utf-8"))
+    try:
+        assert broker.wait_idle(timeout=5)
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+
+    # Неудачная пачка ушла в очередь повторов и вернулась через TTL
+    assert batches == [["a", "b", "c"], ["a", "b", "c"]]
+    assert broker.counters["dead_lettered"] == 6
+    assert consumer.is_alive()
+
+
+
+def test_top_books_snapshot_survives_restart_with_same_owner(monkeypatch):
+    import asyncio
+    import uuid
+    from datetime import datetime, timezone
+
+    from analytics_service import top_books
+    from analytics_service.db import engine
+    from analytics_service.models import TopBooksSnapshot
+
+    # Перезапущенный контейнер получает тот же hostname и PID — тот же owner
+    monkeypatch.setattr(top_books, "SNAPSHOT_OWNER", f"test-{uuid.uuid4().hex}")
+    order = {
+        "routing_key": "order.created",
+        "occurred_at": datetime.now(timezone.utc),
+        "payload": {"items": [{"book_id": 7, "quantity": 3}]},
+    }
+
+    async def scenario() -> tuple:
+        async with engine.begin() as conn:
+            await conn.run_sync(TopBooksSnapshot.__table__.create, checkfirst=True)
+        try:
+            monkeypatch.setattr(top_books, "_top_books", top_books.TopBooks(capacity=10))
+            top_books.get_top_books().record([order])
+            await top_books.save_snapshot()
+
+            monkeypatch.setattr(top_books, "_top_books", top_books.TopBooks(capacity=10))
+            await top_books.load_own_snapshot()
+            restored = top_books.get_top_books().top("1d", 1)
+            # Первый снапшот после перезапуска не затирает историю
+            await top_books.save_snapshot()
+            monkeypatch.setattr(top_books, "_top_books", top_books.TopBooks(capacity=10))
+            await top_books.load_own_snapshot()
+            return restored, top_books.get_top_books().top("1d", 1)
+        finally:
+            async with engine.begin() as conn:
+                await conn.execute(
+                    TopBooksSnapshot.__table__.delete().where(TopBooksSnapshot.owner == top_books.SNAPSHOT_OWNER)
+                )
+            await engine.dispose()
+
+    try:
+        restored, after_save = asyncio.run(scenario())
+    except OSError:
+        pytest.skip("PostgreSQL is not available")
+    assert restored == after_save == (3, [(7, 3, 0)])
+
+
+def test_event_partition_takes_over_rows_from_default():
+    import asyncio
+    from datetime import datetime, timedelta, timezone
+
+    from sqlalchemy import text
+
+    from analytics_service.db import engine
+    from analytics_service.models import Event
+    from analytics_service.partitions import create_partition, partition_name
+
+    day = datetime.now(timezone.utc).date() + timedelta(days=3650)
+    name = partition_name(day)
+
+    async def scenario() -> tuple:
+        async with engine.begin() as conn:
+            await conn.run_sync(Event.__table__.create, checkfirst=True)
+            await conn.execute(text("CREATE TABLE IF NOT EXISTS events_default PARTITION OF events DEFAULT"))
+            await conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+            await conn.execute(
+                text(
+                    "INSERT INTO events (routing_key, idempotency_key, occurred_at, payload) "
+                    "VALUES ('order.created', :key, :occurred_at, '{}')"
+                ),
+                {"key": f"default-{day}", "occurred_at": datetime.combine(day, datetime.min.time(), timezone.utc)},
+            )
+        try:
+            # Без переноса CREATE TABLE ... PARTITION OF упал бы на строке в events_default
+            async with engine.begin() as conn:
+                created = await create_partition(conn, day)
+            async with engine.connect() as conn:
+                in_partition = (await conn.execute(text(f"SELECT count(*) FROM {name}"))).scalar()
+                in_default = (
+                    await conn.execute(
+                        text("SELECT count(*) FROM events_default WHERE idempotency_key = :key"),
+                        {"key": f"default-{day}"},
+                    )
+                ).scalar()
+            return created, in_partition, in_default
+        finally:
+            async with engine.begin() as conn:
+                await conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+                await conn.execute(text("DELETE FROM events_default WHERE idempotency_key = :key"), {"key": f"default-{day}"})
+            await engine.dispose()
+
+    try:
+        created, in_partition, in_default = asyncio.run(scenario())
+    except OSError:
+        pytest.skip("PostgreSQL is not available")
+    assert (created, in_partition, in_default) == (True, 1, 0)
@@ -1,17 +1,23 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from ..bulk_users import provision_users
+from ..config import get_settings
 from ..core.logging import get_logger
-from ..db import get_db
+from ..db import AsyncSessionLocal, get_db
 from ..models import User, UserRole
-from ..schemas import TokenResponse, UserCreate, UserLogin, UserRead
-from ..security import create_access_token, hash_password, verify_password
-from ..dependencies import get_current_user
+from ..message_bus import publish_user_invalidated
+from ..refresh_tokens import issue_refresh_token, revoke_refresh_token, revoke_user_tokens, rotate_refresh_token
+from ..schemas import RefreshRequest, TokenResponse, UserCreate, UserLogin, UserRead, UserUpdate
+from ..security import create_access_token, hash_password, verify_and_update_password
+from ..dependencies import get_current_admin, get_current_user
+from ..user_cache import get_user_cache
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -22,18 +28,34 @@ async def _authenticate_user(email: str, password: str, db: AsyncSession) -> Use
     stmt = select(User).where(User.email == email)
     result = await db.execute(stmt)
     user: User | None = result.scalar_one_or_none()
-    if not user or not verify_password(password, user.password_hash):
+    if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect email or password")
+    verified, new_hash = await verify_and_update_password(password, user.password_hash)
+    if not verified:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect email or password")
+    if new_hash is not None:
+        # Хеш с устаревшими параметрами — прозрачно пересчитываем при успешном входе
+        user.password_hash = new_hash
+        await db.commit()
+        await db.refresh(user)
+        logger.info("password_rehashed", user_id=user.id)
     return user
 
 
+async def _issue_tokens(user: User, db: AsyncSession) -> TokenResponse:
+    refresh_token = issue_refresh_token(db, user.id)
+    await db.commit()
+    access_token = create_access_token(subject=str(user.id), role=user.role, token_version=user.token_version)
+    return TokenResponse(access_token=access_token, refresh_token=refresh_token)
+
+
 @router.post("/register", response_model=UserRead, status_code=status.HTTP_201_CREATED)
 async def register_user(payload: UserCreate, db: AsyncSession = Depends(get_db)) -> UserRead:
     """Зарегистрировать нового пользователя."""
 
     user = User(
         email=payload.email,
-        password_hash=hash_password(payload.password),
+        password_hash=await hash_password(payload.password),
         role=UserRole.USER,
     )
     db.add(user)
@@ -49,12 +71,12 @@ async def register_user(payload: UserCreate, db: AsyncSession = Depends(get_db))
 
 @router.post("/login", response_model=TokenResponse)
 async def login_user(payload: UserLogin, db: AsyncSession = Depends(get_db)) -> TokenResponse:
-    """Выполнить вход пользователя и выдать access-токен."""
+    """Выполнить вход пользователя и выдать access- и refresh-токены."""
 
     user = await _authenticate_user(payload.email, payload.password, db)
-    token = create_access_token(subject=str(user.id), role=user.role)
+    tokens = await _issue_tokens(user, db)
     logger.info("user_logged_in", user_id=user.id, email=user.email)
-    return TokenResponse(access_token=token)
+    return tokens
 
 
 @router.post("/token", response_model=TokenResponse)
@@ -62,9 +84,35 @@ async def token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSessi
     """OAuth2 token endpoint compatible with Swagger Authorize."""
 
     user = await _authenticate_user(form_data.username, form_data.password, db)
-    token = create_access_token(subject=str(user.id), role=user.role)
+    tokens = await _issue_tokens(user, db)
     logger.info("user_logged_in", user_id=user.id, email=user.email)
-    return TokenResponse(access_token=token)
+    return tokens
+
+
+@router.post("/refresh", response_model=TokenResponse)
+async def refresh(payload: RefreshRequest, db: AsyncSession = Depends(get_db)) -> TokenResponse:
+    """Обменять refresh-токен на новую пару токенов (без проверки пароля).
+
+    Предъявленный токен становится недействительным; повторное его
+    использование отзывает все токены этой сессии.
+    """
+
+    user_id, refresh_token = await rotate_refresh_token(db, payload.refresh_token)
+    user = await db.get(User, user_id)
+    if not user or not user.is_active:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found or inactive")
+    await db.commit()
+    access_token = create_access_token(subject=str(user.id), role=user.role, token_version=user.token_version)
+    return TokenResponse(access_token=access_token, refresh_token=refresh_token)
+
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT, response_class=Response)
+async def logout(payload: RefreshRequest, db: AsyncSession = Depends(get_db)) -> Response:
+    """Отозвать refresh-токен вместе со всей его сессией."""
+
+    await revoke_refresh_token(db, payload.refresh_token)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
 @router.get("/me", response_model=UserRead)
@@ -74,3 +122,78 @@ async def read_me(current_user: UserRead = Depends(get_current_user)) -> UserRea
     return current_user
 
 
+@router.post(
+    "/users/bulk",
+    summary="Массовая регистрация пользователей из JSONL (admin)",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"application/x-ndjson": {}}}},
+)
+async def bulk_register_users(request: Request, admin: UserRead = Depends(get_current_admin)) -> StreamingResponse:
+    """Зарегистрировать пользователей из тела запроса в формате JSONL.
+
+    Каждая строка — {"email": ..., "password": ..., "role": "user|admin"}.
+    В ответ построчно (NDJSON) возвращается статус каждой строки: created,
+    duplicate или invalid.
+    """
+
+    settings = get_settings()
+    logger.info("bulk_users_requested", admin_id=admin.id)
+
+    async def results():
+        # Сессия зависимости закрывается до начала стриминга ответа — нужна своя
+        async with AsyncSessionLocal() as session:
+            async for result in provision_users(
+                session,
+                request.stream(),
+                batch_size=settings.bulk_register_batch_size,
+                chunk_size=settings.bulk_hash_chunk_size,
+            ):
+                yield result.model_dump_json(exclude_none=True) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+@router.patch("/users/{user_id}", response_model=UserRead)
+async def update_user(
+    user_id: int,
+    payload: UserUpdate,
+    db: AsyncSession = Depends(get_db),
+    admin: UserRead = Depends(get_current_admin),
+) -> UserRead:
+    """Изменить роль или заблокировать пользователя (только admin).
+
+    Любое изменение увеличивает token_version, поэтому ранее выданные токены
+    пользователя перестают приниматься, а записи кэша на всех репликах
+    сбрасываются событием user.invalidated.
+    """
+
+    user = await db.get(User, user_id)
+    if not user:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+
+    changed = False
+    if payload.role is not None and payload.role != user.role:
+        user.role = payload.role
+        changed = True
+    if payload.is_active is not None and payload.is_active != user.is_active:
+        user.is_active = payload.is_active
+        changed = True
+
+    if changed:
+        user.token_version += 1
+        if not user.is_active:
+            await revoke_user_tokens(db, user.id)
+        await db.commit()
+        await db.refresh(user)
+        get_user_cache().invalidate(user.id)
+        publish_user_invalidated(user.id, user.token_version)
+        logger.info(
+            "user_updated",
+            user_id=user.id,
+            role=user.role.value,
+            is_active=user.is_active,
+            admin_id=admin.id,
+        )
+    return UserRead.model_validate(user)
+
+
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import json
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, List, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .core.logging import get_logger
+from .hashing import get_password_hasher
+from .models import User
+from .schemas import BulkUserResult, BulkUserRow
+from .security import password_too_long
+
+
+logger = get_logger(__name__)
+
+MAX_LINE_BYTES = 64 * 1024
+
+
+async def iter_jsonl_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, bytes]]:
+    """Разбить поток байтов на непустые строки JSONL с их номерами (с 1)."""
+
+    buffer = b""
+    line_no = 0
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_no += 1
+            if line.strip():
+                yield line_no, line
+        if len(buffer) > MAX_LINE_BYTES:
+            raise ValueError(f"Line {line_no + 1} is longer than {MAX_LINE_BYTES} bytes")
+    if buffer.strip():
+        yield line_no + 1, buffer
+
+
+def parse_row(line_no: int, line: bytes) -> BulkUserRow | BulkUserResult:
+    """Провалидировать строку; при ошибке вернуть готовый результат со статусом invalid."""
+
+    try:
+        row = BulkUserRow.model_validate(json.loads(line))
+    except (ValueError, ValidationError) as exc:
+        return BulkUserResult(line=line_no, status="invalid", error=str(exc).splitlines()[0])
+    if password_too_long(row.password):
+        return BulkUserResult(line=line_no, email=row.email, status="invalid", error="Password too long")
+    return row
+
+
+async def _insert_batch(
+    db: AsyncSession,
+    batch: List[Tuple[int, BulkUserRow]],
+    chunk_size: int,
+) -> List[BulkUserResult]:
+    results: Dict[int, BulkUserResult] = {}
+    unique: List[Tuple[int, BulkUserRow]] = []
+    seen: set[str] = set()
+    for line_no, row in batch:
+        if row.email in seen:
+            results[line_no] = BulkUserResult(line=line_no, email=row.email, status="duplicate")
+        else:
+            seen.add(row.email)
+            unique.append((line_no, row))
+
+    if unique:
+        hashes = await get_password_hasher().hash_many([row.password for _, row in unique], chunk_size)
+        now = datetime.now(tz=timezone.utc)
+        stmt = (
+            pg_insert(User)
+            .values(
+                [
+                    {
+                        "email": row.email,
+                        "password_hash": password_hash,
+                        "role": row.role,
+                        "is_active": True,
+                        "token_version": 0,
+                        "created_at": now,
+                    }
+                    for (_, row), password_hash in zip(unique, hashes)
+                ]
+            )
+            .on_conflict_do_nothing(index_elements=[User.email])
+            .returning(User.id, User.email)
+        )
+        inserted = {email: user_id for user_id, email in (await db.execute(stmt)).all()}
+        await db.commit()
+        for line_no, row in unique:
+            user_id = inserted.get(row.email)
+            status = "created" if user_id is not None else "duplicate"
+            results[line_no] = BulkUserResult(line=line_no, email=row.email, status=status, id=user_id)
+
+    return [results[line_no] for line_no, _ in batch]
+
+
+async def provision_users(
+    db: AsyncSession,
+    chunks: AsyncIterator[bytes],
+    batch_size: int,
+    chunk_size: int,
+) -> AsyncIterator[BulkUserResult]:
+    """Массовая регистрация из потока JSONL; результаты отдаются по мере вставки пачек.
+
+    Пароли пачки хешируются параллельно на всех воркерах пула, пользователи
+    вставляются одним INSERT ... ON CONFLICT (email) DO NOTHING RETURNING, так что
+    уже существующие email попадают в результат как duplicate.
+    """
+
+    batch: List[Tuple[int, BulkUserRow]] = []
+    totals: Dict[str, int] = {}
+
+    async def flush() -> List[BulkUserResult]:
+        flushed = await _insert_batch(db, batch, chunk_size)
+        batch.clear()
+        return flushed
+
+    try:
+        async for line_no, line in iter_jsonl_lines(chunks):
+            parsed = parse_row(line_no, line)
+            if isinstance(parsed, BulkUserResult):
+                totals[parsed.status] = totals.get(parsed.status, 0) + 1
+                yield parsed
+                continue
+            batch.append((line_no, parsed))
+            if len(batch) >= batch_size:
+                for result in await flush():
+                    totals[result.status] = totals.get(result.status, 0) + 1
+                    yield result
+        if batch:
+            for result in await flush():
+                totals[result.status] = totals.get(result.status, 0) + 1
+                yield result
+    except ValueError as exc:
+        # Поток оборван или строка слишком длинная: уже обработанные строки остаются в силе
+        yield BulkUserResult(line=0, status="aborted", error=str(exc))
+    finally:
+        logger.info("bulk_users_provisioned", **totals)
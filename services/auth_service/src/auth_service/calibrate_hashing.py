@@ -0,0 +1,132 @@
+"""Подбор стоимости хеширования паролей под целевую задержку на текущей машине.
+
+Пример::
+
+    python -m auth_service.calibrate_hashing --target-ms 250
+
+Для каждой схемы замеряется медианное время хеширования набора параметров,
+выбирается самый стойкий вариант, укладывающийся в --target-ms, и печатаются
+переменные окружения для его включения.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Sequence
+
+from passlib.context import CryptContext
+from passlib.hash import argon2
+
+from .hashing import BCRYPT_SCHEMES
+
+
+BCRYPT_ROUNDS = range(10, 17)
+ARGON2_MEMORY_COSTS_KIB = (19456, 32768, 65536, 131072, 262144)
+ARGON2_TIME_COSTS = (2, 3, 4)
+SAMPLE_PASSWORD = "calibration-password-123"
+DEFAULT_SCHEME = "bcrypt_sha256"
+
+
+@dataclass
+class Candidate:
+    scheme: str
+    params: Dict[str, int]
+    # Условная «стоимость» для сравнения вариантов одной схемы
+    strength: int
+    median_ms: float = 0.0
+
+    def env(self) -> Dict[str, str]:
+        # Текущая схема остаётся в списке, чтобы старые хеши проверялись и обновлялись при входе
+        schemes = [self.scheme] if self.scheme == DEFAULT_SCHEME else [self.scheme, DEFAULT_SCHEME]
+        env = {"PASSWORD_HASH_SCHEMES": json.dumps(schemes)}
+        for key, value in self.params.items():
+            env[key.upper()] = str(value)
+        return env
+
+
+def _candidates(scheme: str) -> List[Candidate]:
+    if scheme in BCRYPT_SCHEMES:
+        return [Candidate(scheme, {"bcrypt_rounds": rounds}, strength=2**rounds) for rounds in BCRYPT_ROUNDS]
+    if scheme == "argon2":
+        return [
+            Candidate(
+                scheme,
+                {"argon2_memory_cost": memory, "argon2_time_cost": time_cost, "argon2_parallelism": 1},
+                strength=memory * time_cost,
+            )
+            for memory in ARGON2_MEMORY_COSTS_KIB
+            for time_cost in ARGON2_TIME_COSTS
+        ]
+    raise ValueError(f"Unsupported scheme: {scheme}")
+
+
+def _context_kwargs(candidate: Candidate) -> Dict[str, Any]:
+    if candidate.scheme in BCRYPT_SCHEMES:
+        return {f"{candidate.scheme}__rounds": candidate.params["bcrypt_rounds"]}
+    return {
+        "argon2__memory_cost": candidate.params["argon2_memory_cost"],
+        "argon2__time_cost": candidate.params["argon2_time_cost"],
+        "argon2__parallelism": candidate.params["argon2_parallelism"],
+    }
+
+
+def measure(candidate: Candidate, samples: int) -> float:
+    """Медианное время одного хеширования в миллисекундах."""
+
+    context = CryptContext(schemes=[candidate.scheme], **_context_kwargs(candidate))
+    context.hash(SAMPLE_PASSWORD)  # прогрев backend-а
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        context.hash(SAMPLE_PASSWORD)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def calibrate(scheme: str, target_ms: float, samples: int) -> tuple[List[Candidate], Candidate | None]:
+    """Замерить варианты схемы по возрастанию стоимости и выбрать лучший в пределах target_ms."""
+
+    measured: List[Candidate] = []
+    best: Candidate | None = None
+    for candidate in sorted(_candidates(scheme), key=lambda c: c.strength):
+        candidate.median_ms = measure(candidate, samples)
+        measured.append(candidate)
+        if candidate.median_ms <= target_ms:
+            if best is None or candidate.strength > best.strength:
+                best = candidate
+        elif scheme in BCRYPT_SCHEMES:
+            # Стоимость bcrypt растёт монотонно — дальше только медленнее
+            break
+    return measured, best
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Калибровка стоимости хеширования паролей")
+    parser.add_argument("--target-ms", type=float, required=True, help="целевое время одного хеширования")
+    parser.add_argument("--schemes", nargs="+", default=["bcrypt_sha256", "argon2"])
+    parser.add_argument("--samples", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    for scheme in args.schemes:
+        if scheme == "argon2" and not argon2.has_backend():
+            print("argon2: пропущено, не установлен argon2-cffi")
+            continue
+        measured, best = calibrate(scheme, args.target_ms, args.samples)
+        print(f"{scheme}:")
+        for candidate in measured:
+            params = ", ".join(f"{key}={value}" for key, value in candidate.params.items())
+            print(f"  {params:<70} {candidate.median_ms:8.1f} ms")
+        if best is None:
+            print(f"  ни один вариант не укладывается в {args.target_ms:.0f} ms")
+            continue
+        print("  рекомендуемые настройки:")
+        for key, value in best.env().items():
+            print(f"    {key}='{value}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -27,7 +27,11 @@ def register_exception_handlers(app: FastAPI) -> None:
             message=str(exc.detail),
             details={"status_code": exc.status_code},
         )
-        return JSONResponse(status_code=exc.status_code, content=jsonable_encoder(payload))
+        return JSONResponse(
+            status_code=exc.status_code,
+            content=jsonable_encoder(payload),
+            headers=getattr(exc, "headers", None),
+        )
 
     @app.exception_handler(RequestValidationError)
     async def validation_exception_handler(request: Request, exc: RequestValidationError) -> JSONResponse:
@@ -11,6 +11,7 @@ from .db import get_db
 from .models import User, UserRole
 from .schemas import UserRead
 from .security import decode_token
+from .user_cache import get_user_cache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 
@@ -22,15 +23,33 @@ async def get_current_user(
     token: Annotated[str, Depends(oauth2_scheme)],
     db: Annotated[AsyncSession, Depends(get_db)],
 ) -> UserRead:
-    """Получить текущего пользователя по JWT-токену."""
+    """Получить текущего пользователя по JWT-токену.
+
+    Активные пользователи кэшируются вместе с версией токенов: запрос с токеном
+    той же версии обслуживается без обращения к БД, устаревший токен сразу
+    отклоняется, а более новый заставляет перечитать пользователя.
+    """
 
     payload = decode_token(token)
+    cache = get_user_cache()
+    cached = cache.get(payload.sub)
+    if cached is not None:
+        if cached.token_version == payload.ver:
+            return cached.user
+        if cached.token_version > payload.ver:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token revoked")
+
     stmt = select(User).where(User.id == payload.sub)
     result = await db.execute(stmt)
     user: User | None = result.scalar_one_or_none()
     if not user or not user.is_active:
+        cache.invalidate(payload.sub)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found or inactive")
-    return UserRead.model_validate(user)
+    if user.token_version != payload.ver:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token revoked")
+    user_read = UserRead.model_validate(user)
+    cache.put(user_read, user.token_version)
+    return user_read
 
 
 async def get_current_admin(user: Annotated[UserRead, Depends(get_current_user)]) -> UserRead:
@@ -0,0 +1,241 @@
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from passlib.context import CryptContext
+
+from .config import Settings, get_settings
+from .core.logging import get_logger
+from .core.metrics import REGISTRY
+
+
+logger = get_logger(__name__)
+
+BCRYPT_SCHEMES = frozenset({"bcrypt", "bcrypt_sha256"})
+
+QUEUE_WAIT = REGISTRY.histogram(
+    "password_hash_queue_wait_seconds",
+    "Время ожидания свободного воркера хеширования",
+)
+HASH_DURATION = REGISTRY.histogram(
+    "password_hash_duration_seconds",
+    "Время вычисления хеша/проверки пароля в воркере",
+)
+PENDING = REGISTRY.gauge("password_hash_pending", "Операции хеширования в очереди и в работе")
+REJECTED_TOTAL = REGISTRY.counter("password_hash_rejected_total", "Операции, отклонённые из-за переполнения очереди")
+
+
+def crypt_context_config(settings: Settings) -> Dict[str, Any]:
+    """Собрать конфигурацию CryptContext из настроек.
+
+    Первая схема в списке используется для новых хешей, остальные только
+    проверяются и помечаются как устаревшие. min_rounds/min-параметры равны
+    целевым, поэтому хеши со старой стоимостью тоже требуют обновления.
+    """
+
+    schemes = list(settings.password_hash_schemes)
+    config: Dict[str, Any] = {"schemes": schemes, "deprecated": "auto"}
+    for scheme in schemes:
+        if scheme in BCRYPT_SCHEMES:
+            config[f"{scheme}__rounds"] = settings.bcrypt_rounds
+            config[f"{scheme}__min_rounds"] = settings.bcrypt_rounds
+        elif scheme == "argon2":
+            config["argon2__memory_cost"] = settings.argon2_memory_cost
+            config["argon2__time_cost"] = settings.argon2_time_cost
+            config["argon2__parallelism"] = settings.argon2_parallelism
+    return config
+
+
+# Контекст процесса-воркера; задаётся initializer-ом пула
+_worker_context: CryptContext | None = None
+
+
+def _init_worker(config: Dict[str, Any]) -> None:
+    global _worker_context
+    _worker_context = CryptContext(**config)
+
+
+def _timed(func: Callable[..., Any], *args: Any) -> Tuple[Any, float, float]:
+    started = time.time()
+    result = func(*args)
+    return result, started, time.time() - started
+
+
+def _hash_in_worker(password: str) -> Tuple[str, float, float]:
+    assert _worker_context is not None
+    return _timed(_worker_context.hash, password)
+
+
+def _hash_all(passwords: Sequence[str]) -> List[str]:
+    assert _worker_context is not None
+    return [_worker_context.hash(password) for password in passwords]
+
+
+def _hash_many_in_worker(passwords: Sequence[str]) -> Tuple[List[str], float, float]:
+    return _timed(_hash_all, passwords)
+
+
+def _verify_and_update_in_worker(password: str, password_hash: str) -> Tuple[Tuple[bool, Optional[str]], float, float]:
+    assert _worker_context is not None
+    return _timed(_worker_context.verify_and_update, password, password_hash)
+
+
+class HashingOverloaded(Exception):
+    """Очередь на хеширование заполнена, запрос нужно повторить позже."""
+
+    def __init__(self, retry_after: int) -> None:
+        super().__init__("Password hashing queue is full")
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    """Выполняет bcrypt в пуле процессов, чтобы не блокировать event loop.
+
+    Число одновременно принятых операций (в очереди и в работе) ограничено
+    max_pending: при переполнении сразу выбрасывается HashingOverloaded, а не
+    растёт очередь, и время логина под всплеском перебора паролей остаётся
+    ограниченным. Если воркер пула погиб (OOM, падение), пул пересоздаётся.
+    """
+
+    def __init__(self, context_config: Dict[str, Any], workers: int, max_pending: int, retry_after: int = 1) -> None:
+        self.context = CryptContext(**context_config)
+        self._context_config = context_config
+        self._workers = workers
+        self._max_pending = max_pending
+        self._retry_after = retry_after
+        self._pending = 0
+        self._executor: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # spawn: в процессе сервиса уже работают потоки (pika, loop)
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self._workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        initializer=_init_worker,
+                        initargs=(self._context_config,),
+                    )
+        return self._executor
+
+    def start(self) -> None:
+        """Заранее поднять воркеры, чтобы первый логин не ждал их запуска."""
+
+        executor = self._get_executor()
+        for _ in range(self._workers):
+            executor.submit(_timed, time.time)
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", _hash_in_worker, password)
+
+    async def hash_many(self, passwords: Sequence[str], chunk_size: int) -> List[str]:
+        """Захешировать пачку паролей на всех воркерах, сохранив порядок.
+
+        Пароли уходят в воркеры порциями по chunk_size, одновременно не больше
+        одной порции на воркер: массовая загрузка не упирается в лимит очереди и
+        не отодвигает логины дальше, чем на одну порцию.
+        """
+
+        semaphore = asyncio.Semaphore(self._workers)
+
+        async def run_chunk(chunk: Sequence[str]) -> List[str]:
+            async with semaphore:
+                return await self._run("hash_many", _hash_many_in_worker, chunk, bounded=False)
+
+        chunks = [passwords[i : i + chunk_size] for i in range(0, len(passwords), chunk_size)]
+        results = await asyncio.gather(*(run_chunk(chunk) for chunk in chunks))
+        return [password_hash for chunk_hashes in results for password_hash in chunk_hashes]
+
+    async def verify_and_update(self, password: str, password_hash: str) -> Tuple[bool, Optional[str]]:
+        """Проверить пароль; при устаревшем хеше вернуть также новый хеш."""
+
+        return await self._run("verify", _verify_and_update_in_worker, password, password_hash)
+
+    async def _run(
+        self,
+        operation: str,
+        func: Callable[..., Tuple[Any, float, float]],
+        *args: Any,
+        bounded: bool = True,
+    ) -> Any:
+        if bounded and self._pending >= self._max_pending:
+            REJECTED_TOTAL.inc()
+            raise HashingOverloaded(self._retry_after)
+
+        self._pending += 1
+        PENDING.set(self._pending)
+        submitted = time.time()
+        try:
+            loop = asyncio.get_running_loop()
+            # Сломанный пул отклоняет все задачи: заменяем его и повторяем один раз
+            for attempt in (1, 2):
+                executor = self._get_executor()
+                try:
+                    result, started, duration = await loop.run_in_executor(executor, func, *args)
+                    break
+                except BrokenProcessPool:
+                    logger.warning("password_hash_pool_broken", operation=operation, attempt=attempt)
+                    self._discard_executor(executor)
+            else:
+                raise HashingOverloaded(self._retry_after)
+        finally:
+            self._pending -= 1
+            PENDING.set(self._pending)
+        QUEUE_WAIT.observe(max(started - submitted, 0.0), operation=operation)
+        HASH_DURATION.observe(duration, operation=operation)
+        return result
+
+    def _discard_executor(self, executor: ProcessPoolExecutor) -> None:
+        with self._lock:
+            # Пул мог уже заменить другой запрос, получивший ту же ошибку
+            if self._executor is executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+_hasher: PasswordHasher | None = None
+_hasher_lock = threading.Lock()
+
+
+def get_password_hasher() -> PasswordHasher:
+    """Получить singleton пула хеширования паролей."""
+
+    global _hasher
+    if _hasher is None:
+        with _hasher_lock:
+            if _hasher is None:
+                settings = get_settings()
+                _hasher = PasswordHasher(
+                    crypt_context_config(settings),
+                    workers=settings.password_hash_workers or os.cpu_count() or 1,
+                    max_pending=settings.password_hash_max_pending,
+                    retry_after=settings.password_hash_retry_after_seconds,
+                )
+    return _hasher
+
+
+def shutdown_password_hasher() -> None:
+    global _hasher
+    with _hasher_lock:
+        if _hasher is not None:
+            _hasher.shutdown()
+            _hasher = None
@@ -1,11 +1,15 @@
 from __future__ import annotations
 
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 
 from .api.routes_auth import router as auth_router
 from .core.errors import register_exception_handlers
 from .core.logging import setup_logging, get_logger
+from .core.metrics import PROMETHEUS_CONTENT_TYPE, REGISTRY
 from .core.middleware import CorrelationIdMiddleware
+from .hashing import get_password_hasher, shutdown_password_hasher
+from .message_bus import ensure_invalidation_consumer_started
 
 
 setup_logging()
@@ -31,17 +35,27 @@ async def healthcheck() -> dict[str, str]:
     return {"status": "ok"}
 
 
+@app.get("/metrics", summary="Метрики в формате Prometheus", tags=["health"], response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    """Текущие значения метрик сервиса в текстовом формате Prometheus."""
+
+    return PlainTextResponse(REGISTRY.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
 @app.on_event("startup")
 async def on_startup() -> None:
-    """Логирование старта приложения."""
+    """Логирование старта приложения, запуск пула хеширования и consumer-а user.invalidated."""
 
     logger.info("auth_service_started")
+    get_password_hasher().start()
+    ensure_invalidation_consumer_started()
 
 
 @app.on_event("shutdown")
 async def on_shutdown() -> None:
-    """Логирование остановки приложения."""
+    """Логирование остановки приложения и остановка пула хеширования."""
 
+    shutdown_password_hasher()
     logger.info("auth_service_stopped")
 
 
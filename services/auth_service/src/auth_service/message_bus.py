@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import json
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict
+
+import pika
+
+from .config import get_settings
+from .core.logging import get_logger
+from .core.transport import connect
+from .user_cache import get_user_cache
+
+
+logger = get_logger(__name__)
+
+USER_INVALIDATED_ROUTING_KEY = "user.invalidated"
+
+
+class RabbitMQClient:
+    """Простой клиент RabbitMQ для публикации событий."""
+
+    def __init__(self) -> None:
+        settings = get_settings()
+        self.exchange = settings.rabbitmq_exchange
+        self._connection = connect(settings.message_transport, settings.rabbitmq_url)
+        self._channel = self._connection.channel()
+        self._channel.exchange_declare(exchange=self.exchange, exchange_type="topic", durable=True)
+
+    def publish_event(self, routing_key: str, payload: Dict[str, Any]) -> None:
+        """Опубликовать событие в exchange bookstore.events."""
+
+        envelope = {
+            "idempotency_key": payload.get("idempotency_key") or str(uuid.uuid4()),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "payload": payload,
+        }
+        body = json.dumps(envelope).encode("utf-8")
+        self._channel.basic_publish(
+            exchange=self.exchange,
+            routing_key=routing_key,
+            body=body,
+            properties=pika.BasicProperties(content_type="application/json", delivery_mode=2),
+        )
+        logger.info("event_published", routing_key=routing_key)
+
+    def close(self) -> None:
+        try:
+            self._connection.close()
+        except Exception:
+            logger.warning("rabbitmq_close_failed")
+
+
+_client: RabbitMQClient | None = None
+_client_lock = threading.Lock()
+
+
+def get_rabbitmq_client() -> RabbitMQClient:
+    """Получить singleton-клиент для RabbitMQ."""
+
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = RabbitMQClient()
+    return _client
+
+
+def publish_user_invalidated(user_id: int, token_version: int) -> None:
+    """Разослать всем репликам auth-service сигнал сбросить пользователя из кэша.
+
+    Ошибка публикации не откатывает изменение: запись в чужих кэшах всё равно
+    истечёт через USER_CACHE_TTL_SECONDS.
+    """
+
+    try:
+        get_rabbitmq_client().publish_event(
+            USER_INVALIDATED_ROUTING_KEY,
+            {"user_id": user_id, "token_version": token_version},
+        )
+    except Exception:
+        logger.warning("user_invalidated_publish_failed", user_id=user_id)
+
+
+class UserInvalidationConsumer(threading.Thread):
+    """Consumer user.invalidated: у каждой реплики своя exclusive-очередь (broadcast)."""
+
+    daemon = True
+
+    def __init__(self) -> None:
+        super().__init__()
+        settings = get_settings()
+        self._transport = settings.message_transport
+        self._url = settings.rabbitmq_url
+        self.exchange = settings.rabbitmq_exchange
+
+    def run(self) -> None:
+        connection = connect(self._transport, self._url)
+        channel = connection.channel()
+        channel.exchange_declare(exchange=self.exchange, exchange_type="topic", durable=True)
+
+        result = channel.queue_declare(queue="", exclusive=True)
+        queue_name = result.method.queue
+
+        channel.queue_bind(exchange=self.exchange, queue=queue_name, routing_key=USER_INVALIDATED_ROUTING_KEY)
+
+        def callback(ch, method, properties, body) -> None:  # type: ignore[no-untyped-def]
+            try:
+                envelope = json.loads(body.decode("utf-8"))
+                user_id = int(envelope["payload"]["user_id"])
+            except Exception:
+                logger.warning("invalid_user_invalidated_payload")
+                return
+            get_user_cache().invalidate(user_id)
+            logger.info("user_cache_invalidated", user_id=user_id)
+
+        # Сообщения без побочных эффектов — подтверждение не нужно
+        channel.basic_consume(queue=queue_name, on_message_callback=callback, auto_ack=True)
+        logger.info("user_invalidation_consumer_started")
+        channel.start_consuming()
+
+
+_consumer_started = False
+_consumer_lock = threading.Lock()
+
+
+def ensure_invalidation_consumer_started() -> None:
+    """Гарантировать запуск consumer-а инвалидации кэша пользователей."""
+
+    global _consumer_started
+    if not _consumer_started:
+        with _consumer_lock:
+            if not _consumer_started:
+                consumer = UserInvalidationConsumer()
+                consumer.start()
+                _consumer_started = True
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import hashlib
+import secrets
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .config import get_settings
+from .core.logging import get_logger
+from .core.metrics import REGISTRY
+from .models import RefreshToken
+
+
+logger = get_logger(__name__)
+
+REFRESH_TOTAL = REGISTRY.counter("refresh_tokens_total", "Обработка refresh-токенов по результату")
+
+
+def hash_refresh_token(token: str) -> str:
+    """sha256 от токена: в БД хранится только хеш (токен случайный, соль не нужна)."""
+
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class RevokedTokenCache:
+    """Негативный кэш отозванных refresh-токенов: повторные попытки не идут в БД."""
+
+    def __init__(self, max_size: int, clock: Callable[[], float] = time.time) -> None:
+        self._max_size = max_size
+        self._clock = clock
+        self._data: OrderedDict[str, float] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, token_hash: str, expires_at: float) -> None:
+        if self._max_size <= 0:
+            return
+        with self._lock:
+            self._data[token_hash] = expires_at
+            self._data.move_to_end(token_hash)
+            while len(self._data) > self._max_size:
+                self._data.popitem(last=False)
+
+    def __contains__(self, token_hash: str) -> bool:
+        with self._lock:
+            expires_at = self._data.get(token_hash)
+            if expires_at is None:
+                return False
+            if expires_at <= self._clock():
+                # Истёкший токен отклонит и БД, держать его в кэше незачем
+                del self._data[token_hash]
+                return False
+            return True
+
+
+_revoked: RevokedTokenCache | None = None
+_revoked_lock = threading.Lock()
+
+
+def get_revoked_token_cache() -> RevokedTokenCache:
+    """Получить singleton негативного кэша refresh-токенов."""
+
+    global _revoked
+    if _revoked is None:
+        with _revoked_lock:
+            if _revoked is None:
+                _revoked = RevokedTokenCache(max_size=get_settings().revoked_token_cache_size)
+    return _revoked
+
+
+def _invalid() -> HTTPException:
+    return HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+
+
+def issue_refresh_token(db: AsyncSession, user_id: int, family_id: str | None = None) -> str:
+    """Создать refresh-токен (в рамках текущей транзакции) и вернуть его открытое значение.
+
+    Все токены, полученные ротацией от одного логина, делят family_id.
+    """
+
+    token = secrets.token_urlsafe(32)
+    now = datetime.now(tz=timezone.utc)
+    db.add(
+        RefreshToken(
+            user_id=user_id,
+            token_hash=hash_refresh_token(token),
+            family_id=family_id or str(uuid.uuid4()),
+            created_at=now,
+            expires_at=now + timedelta(days=get_settings().refresh_token_expire_days),
+        )
+    )
+    return token
+
+
+async def revoke_family(db: AsyncSession, family_id: str) -> None:
+    await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.family_id == family_id, RefreshToken.is_revoked.is_(False))
+        .values(is_revoked=True)
+    )
+
+
+async def revoke_user_tokens(db: AsyncSession, user_id: int) -> None:
+    await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.user_id == user_id, RefreshToken.is_revoked.is_(False))
+        .values(is_revoked=True)
+    )
+
+
+async def rotate_refresh_token(db: AsyncSession, token: str) -> Tuple[int, str]:
+    """Обменять refresh-токен на новый, вернуть (user_id, новый токен).
+
+    Каждый токен одноразовый. Предъявление уже использованного токена считается
+    кражей: отзывается всё семейство, включая последний выданный токен.
+    """
+
+    token_hash = hash_refresh_token(token)
+    revoked = get_revoked_token_cache()
+    if token_hash in revoked:
+        REFRESH_TOTAL.inc(result="revoked_cached")
+        raise _invalid()
+
+    result = await db.execute(select(RefreshToken).where(RefreshToken.token_hash == token_hash))
+    stored: RefreshToken | None = result.scalar_one_or_none()
+    if stored is None:
+        REFRESH_TOTAL.inc(result="unknown")
+        raise _invalid()
+
+    expires_at = stored.expires_at.timestamp()
+    if expires_at <= time.time():
+        REFRESH_TOTAL.inc(result="expired")
+        raise _invalid()
+
+    # Атомарно «забираем» токен: из двух параллельных запросов пройдёт только один
+    claimed = await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.id == stored.id, RefreshToken.is_revoked.is_(False))
+        .values(is_revoked=True)
+        .returning(RefreshToken.id)
+    )
+    if claimed.scalar_one_or_none() is None:
+        await revoke_family(db, stored.family_id)
+        await db.commit()
+        revoked.add(token_hash, expires_at)
+        REFRESH_TOTAL.inc(result="reuse_detected")
+        logger.warning("refresh_token_reuse_detected", user_id=stored.user_id, family_id=stored.family_id)
+        raise _invalid()
+
+    new_token = issue_refresh_token(db, stored.user_id, family_id=stored.family_id)
+    REFRESH_TOTAL.inc(result="rotated")
+    return stored.user_id, new_token
+
+
+async def revoke_refresh_token(db: AsyncSession, token: str) -> None:
+    """Отозвать семейство токена (logout); неизвестный токен игнорируется."""
+
+    token_hash = hash_refresh_token(token)
+    result = await db.execute(select(RefreshToken).where(RefreshToken.token_hash == token_hash))
+    stored: RefreshToken | None = result.scalar_one_or_none()
+    if stored is None:
+        return
+    await revoke_family(db, stored.family_id)
+    await db.commit()
+    get_revoked_token_cache().add(token_hash, stored.expires_at.timestamp())
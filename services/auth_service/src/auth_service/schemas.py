@@ -23,6 +23,22 @@ class UserCreate(BaseModel):
     password: str = Field(..., min_length=6, description="Пароль пользователя")
 
 
+class BulkUserRow(UserCreate):
+    """Строка JSONL для массовой регистрации пользователей."""
+
+    role: UserRole = UserRole.USER
+
+
+class BulkUserResult(BaseModel):
+    """Результат обработки одной строки массовой регистрации."""
+
+    line: int
+    email: Optional[str] = None
+    status: str
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+
 class UserLogin(BaseModel):
     """Payload для логина пользователя."""
 
@@ -43,11 +59,25 @@ class UserRead(BaseModel):
         from_attributes = True
 
 
+class UserUpdate(BaseModel):
+    """Payload администратора для изменения роли или блокировки пользователя."""
+
+    role: Optional[UserRole] = None
+    is_active: Optional[bool] = None
+
+
 class TokenResponse(BaseModel):
-    """Ответ с access-токеном."""
+    """Ответ с access-токеном и refresh-токеном."""
 
     access_token: str
     token_type: str = "bearer"
+    refresh_token: Optional[str] = None
+
+
+class RefreshRequest(BaseModel):
+    """Payload для обмена или отзыва refresh-токена."""
+
+    refresh_token: str = Field(..., min_length=1, max_length=256)
 
 
 class TokenPayload(BaseModel):
@@ -56,5 +86,6 @@ class TokenPayload(BaseModel):
     sub: int
     role: UserRole
     exp: int
+    ver: int = 0
 
 
@@ -1,24 +1,34 @@
 from __future__ import annotations
 
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Optional, Tuple
 
 from fastapi import HTTPException, status
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 
 from .config import get_settings
+from .hashing import BCRYPT_SCHEMES, HashingOverloaded, get_password_hasher
 from .models import UserRole
 from .schemas import TokenPayload
 
 
-pwd_context = CryptContext(schemes=["bcrypt_sha256"], deprecated="auto")
+def _overloaded(exc: HashingOverloaded) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many concurrent authentication requests, retry later",
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 
+def password_too_long(password: str) -> bool:
+    """bcrypt реально ограничен 72 байтами — ловим это до passlib."""
 
-def hash_password(password: str) -> str:
-    # bcrypt реально ограничен 72 байтами — ловим это до passlib
-    if len(password.encode("utf-8")) > 72:
+    return get_password_hasher().context.default_scheme() in BCRYPT_SCHEMES and len(password.encode("utf-8")) > 72
+
+
+async def hash_password(password: str) -> str:
+    hasher = get_password_hasher()
+    if password_too_long(password):
         raise HTTPException(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
             detail={
@@ -29,7 +39,9 @@ def hash_password(password: str) -> str:
         )
 
     try:
-        return pwd_context.hash(password)
+        return await hasher.hash(password)
+    except HashingOverloaded as exc:
+        raise _overloaded(exc) from exc
     except ValueError as exc:
         # на всякий случай, если backend всё равно кинет ValueError
         raise HTTPException(
@@ -42,19 +54,26 @@ def hash_password(password: str) -> str:
         ) from exc
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Проверить соответствие пароля и хеша."""
+async def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Проверить соответствие пароля и хеша.
 
-    return pwd_context.verify(plain_password, hashed_password)
+    Вторым элементом возвращается новый хеш, если сохранённый создан устаревшей
+    схемой или с меньшей стоимостью, чем задано в настройках.
+    """
+
+    try:
+        return await get_password_hasher().verify_and_update(plain_password, hashed_password)
+    except HashingOverloaded as exc:
+        raise _overloaded(exc) from exc
 
 
-def create_access_token(subject: str, role: UserRole) -> str:
-    """Создать JWT access-токен."""
+def create_access_token(subject: str, role: UserRole, token_version: int = 0) -> str:
+    """Создать JWT access-токен с версией токенов пользователя (claim ver)."""
 
     settings = get_settings()
     expire_delta = timedelta(minutes=settings.access_token_expire_minutes)
     expire = datetime.now(tz=timezone.utc) + expire_delta
-    payload = {"sub": subject, "role": role.value, "exp": int(expire.timestamp())}
+    payload = {"sub": subject, "role": role.value, "exp": int(expire.timestamp()), "ver": token_version}
     return jwt.encode(payload, settings.jwt_secret, algorithm=settings.jwt_algorithm)
 
 
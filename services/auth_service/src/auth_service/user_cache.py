@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Tuple
+
+from .config import get_settings
+from .core.metrics import REGISTRY
+from .schemas import UserRead
+
+
+LOOKUPS_TOTAL = REGISTRY.counter("user_cache_lookups_total", "Обращения к кэшу пользователей по результату")
+INVALIDATIONS_TOTAL = REGISTRY.counter("user_cache_invalidations_total", "Инвалидации записей кэша пользователей")
+
+
+@dataclass(frozen=True)
+class CachedUser:
+    user: UserRead
+    token_version: int
+
+
+class UserCache:
+    """TTL/LRU-кэш активных пользователей по id.
+
+    Инвалидация приходит и из обработчиков запросов, и из потока consumer-а
+    RabbitMQ, поэтому операции защищены блокировкой.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float, clock: Callable[[], float] = time.monotonic) -> None:
+        self._max_size = max_size
+        self._ttl = ttl_seconds
+        self._clock = clock
+        self._data: OrderedDict[int, Tuple[float, CachedUser]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> CachedUser | None:
+        with self._lock:
+            entry = self._data.get(user_id)
+            if entry is not None and entry[0] <= self._clock():
+                del self._data[user_id]
+                entry = None
+            if entry is None:
+                LOOKUPS_TOTAL.inc(result="miss")
+                return None
+            self._data.move_to_end(user_id)
+        LOOKUPS_TOTAL.inc(result="hit")
+        return entry[1]
+
+    def put(self, user: UserRead, token_version: int) -> None:
+        if self._max_size <= 0:
+            return
+        with self._lock:
+            self._data[user.id] = (self._clock() + self._ttl, CachedUser(user=user, token_version=token_version))
+            self._data.move_to_end(user.id)
+            while len(self._data) > self._max_size:
+                self._data.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._data.pop(user_id, None)
+        INVALIDATIONS_TOTAL.inc()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+_cache: UserCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_user_cache() -> UserCache:
+    """Получить singleton-кэш пользователей."""
+
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                settings = get_settings()
+                _cache = UserCache(
+                    max_size=settings.user_cache_size,
+                    ttl_seconds=settings.user_cache_ttl_seconds,
+                )
+    return _cache
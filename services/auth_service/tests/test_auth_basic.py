@@ -32,6 +32,14 @@ async def test_register_and_login():
     assert "access_token" in data
     assert data["token_type"] == "bearer"
 
+    response = client.post("/auth/refresh", json={"refresh_token": data["refresh_token"]})
+    assert response.status_code == 200
+    assert response.json()["refresh_token"] != data["refresh_token"]
+
+    # Повторное использование старого refresh-токена отзывает всю сессию
+    response = client.post("/auth/refresh", json={"refresh_token": data["refresh_token"]})
+    assert response.status_code == 401
+
 
 @pytest.mark.asyncio
 async def test_login_invalid_password_returns_json_error():
@@ -86,3 +94,175 @@ async def test_token_endpoint_returns_access_token():
     data = response.json()
     assert "access_token" in data
     assert data["token_type"] == "bearer"
+
+
+def test_password_hasher_roundtrip_and_bounded_queue():
+    import asyncio
+
+    from auth_service.hashing import HashingOverloaded, PasswordHasher
+
+    config = {"schemes": ["bcrypt_sha256"], "bcrypt_sha256__rounds": 4}
+
+    async def scenario() -> None:
+        hasher = PasswordHasher(config, workers=1, max_pending=1, retry_after=3)
+        try:
+            password_hash = await hasher.hash("password123")
+            assert await hasher.verify_and_update("password123", password_hash) == (True, None)
+            assert (await hasher.verify_and_update("wrong-password", password_hash))[0] is False
+
+            hashes = await hasher.hash_many(["a-password", "b-password", "c-password"], chunk_size=2)
+            assert [hasher.context.verify(p, h) for p, h in zip(["a-password", "b-password", "c-password"], hashes)] == [True] * 3
+
+            results = await asyncio.gather(
+                hasher.verify_and_update("password123", password_hash),
+                hasher.verify_and_update("password123", password_hash),
+                return_exceptions=True,
+            )
+            assert results[0] == (True, None)
+            assert isinstance(results[1], HashingOverloaded)
+            assert results[1].retry_after == 3
+            assert hasher.pending == 0
+        finally:
+            hasher.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_password_hasher_replaces_pool_after_worker_dies():
+    import asyncio
+    import os
+    import signal
+
+    from auth_service.hashing import PasswordHasher
+
+    config = {"schemes": ["bcrypt_sha256"], "bcrypt_sha256__rounds": 4}
+
+    async def scenario() -> None:
+        hasher = PasswordHasher(config, workers=1, max_pending=4)
+        try:
+            first = await hasher.hash("password123")
+            # Воркер убит (как при OOM): пул сломан, но следующий хеш всё равно считается
+            for pid in list(hasher._get_executor()._processes):
+                os.kill(pid, signal.SIGKILL)
+            await asyncio.sleep(0.5)
+            second = await hasher.hash("password123")
+            assert hasher.context.verify("password123", second) and second != first
+            assert await hasher.verify_and_update("password123", first) == (True, None)
+            assert hasher.pending == 0
+        finally:
+            hasher.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_outdated_hash_needs_update():
+    from passlib.context import CryptContext
+
+    from auth_service.config import Settings
+    from auth_service.hashing import crypt_context_config
+
+    settings = Settings(database_url="sqlite://", password_hash_schemes=["bcrypt_sha256", "bcrypt"], bcrypt_rounds=5)
+    context = CryptContext(**crypt_context_config(settings))
+    assert context.default_scheme() == "bcrypt_sha256"
+
+    weak_hash = CryptContext(schemes=["bcrypt_sha256"], bcrypt_sha256__rounds=4).hash("password123")
+    legacy_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=5).hash("password123")
+    current_hash = context.hash("password123")
+    assert context.needs_update(weak_hash)
+    assert context.needs_update(legacy_hash)
+    assert not context.needs_update(current_hash)
+
+    verified, new_hash = context.verify_and_update("password123", legacy_hash)
+    assert verified and new_hash is not None and not context.needs_update(new_hash)
+
+
+def test_metrics_endpoint():
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert "password_hash_queue_wait_seconds" in response.text
+
+
+def test_user_cache_expires_evicts_and_invalidates():
+    from datetime import datetime, timezone
+
+    from auth_service.models import UserRole
+    from auth_service.schemas import UserRead
+    from auth_service.user_cache import UserCache
+
+    now = [0.0]
+    cache = UserCache(max_size=2, ttl_seconds=10, clock=lambda: now[0])
+
+    def user(user_id: int) -> UserRead:
+        return UserRead(
+            id=user_id,
+            email=f"user{user_id}@example.com",
+            role=UserRole.USER,
+            is_active=True,
+            created_at=datetime.now(timezone.utc),
+        )
+
+    cache.put(user(1), token_version=0)
+    cache.put(user(2), token_version=3)
+    assert cache.get(1).token_version == 0
+    cache.put(user(3), token_version=0)
+    assert cache.get(2) is None
+    assert cache.get(1) is not None
+
+    cache.invalidate(1)
+    assert cache.get(1) is None
+
+    now[0] = 11
+    assert cache.get(3) is None
+
+
+def test_update_user_requires_admin():
+    response = client.patch("/auth/users/1", json={"is_active": False})
+    assert response.status_code in (401, 403)
+
+
+def test_refresh_requires_token_and_revoked_cache_expires():
+    from auth_service.refresh_tokens import RevokedTokenCache, hash_refresh_token
+
+    response = client.post("/auth/refresh", json={})
+    assert response.status_code == 422
+
+    now = [100.0]
+    revoked = RevokedTokenCache(max_size=10, clock=lambda: now[0])
+    token_hash = hash_refresh_token("token")
+    assert len(token_hash) == 64 and token_hash != hash_refresh_token("other")
+
+    revoked.add(token_hash, expires_at=200.0)
+    assert token_hash in revoked
+    now[0] = 200.0
+    assert token_hash not in revoked
+
+
+def test_bulk_rows_are_split_and_validated():
+    import asyncio
+
+    from auth_service.bulk_users import iter_jsonl_lines, parse_row
+    from auth_service.schemas import BulkUserResult, BulkUserRow
+
+    async def chunks():
+        yield b'{"email": "a@example.com", "password": "password1"}\n{"email": "b@exa'
+        yield b'mple.com", "password": "password2", "role": "admin"}\n\n{"email": "bad"}'
+
+    async def collect():
+        return [line async for line in iter_jsonl_lines(chunks())]
+
+    lines = asyncio.run(collect())
+    assert [line_no for line_no, _ in lines] == [1, 2, 4]
+
+    parsed = [parse_row(line_no, line) for line_no, line in lines]
+    assert isinstance(parsed[0], BulkUserRow) and parsed[0].role.value == "user"
+    assert isinstance(parsed[1], BulkUserRow) and parsed[1].role.value == "admin"
+    assert isinstance(parsed[2], BulkUserResult) and parsed[2].status == "invalid"
+
+
+def test_bulk_register_requires_admin():
+    response = client.post(
+        "/auth/users/bulk",
+        content=b'{"email": "a@example.com", "password": "password1"}\n',
+        headers={"content-type": "application/x-ndjson"},
+    )
+    assert response.status_code in (401, 403)
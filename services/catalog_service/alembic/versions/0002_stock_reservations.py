@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002_stock_reservations"
+down_revision = "0001_init"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "stock_reservations",
+        sa.Column("idempotency_key", sa.String(length=64), primary_key=True),
+        sa.Column("status", sa.String(length=16), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+    )
+    op.create_index("ix_stock_reservations_created_at", "stock_reservations", ["created_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_stock_reservations_created_at", table_name="stock_reservations")
+    op.drop_table("stock_reservations")
@@ -2,14 +2,14 @@ from __future__ import annotations
 
 from typing import Annotated, List, Optional
 
-import httpx
 from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy import Select, func, or_, select
 from sqlalchemy.orm import selectinload
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..config import get_settings
+from ..clients import OPEN_LIBRARY_UPSTREAM, get_http_client
+from ..core.http_client import UpstreamUnavailable
 from ..core.logging import get_logger
 from ..db import get_db
 from ..dependencies import get_current_admin, get_current_user
@@ -220,10 +220,11 @@ async def import_book_by_isbn(
     и создать соответствующую запись в каталоге.
     """
 
-    settings = get_settings()
-    url = f"{settings.external_books_api_base}/isbn/{isbn}.json"
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(url, timeout=10)
+    try:
+        resp = await get_http_client().get(OPEN_LIBRARY_UPSTREAM, f"/isbn/{isbn}.json", follow_redirects=True)
+    except UpstreamUnavailable as exc:
+        logger.warning("external_books_api_unavailable", reason=exc.reason, isbn=isbn)
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail="External books API error")
     if resp.status_code == 404:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found in external API")
     if resp.status_code >= 400:
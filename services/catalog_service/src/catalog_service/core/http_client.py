@@ -0,0 +1,308 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Callable, Dict
+
+import httpx
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from ..schemas import ErrorResponse
+from .logging import get_logger
+from .metrics import REGISTRY
+
+
+logger = get_logger(__name__)
+
+# Абсолютный дедлайн запроса (unix time в миллисекундах), передаётся по цепочке сервисов
+DEADLINE_HEADER = "X-Request-Deadline"
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+_request_deadline: ContextVar[float | None] = ContextVar("request_deadline", default=None)
+
+REQUESTS_TOTAL = REGISTRY.counter("http_client_requests_total", "Исходящие HTTP-запросы по upstream и исходу")
+RETRIES_TOTAL = REGISTRY.counter("http_client_retries_total", "Повторные попытки исходящих запросов")
+SHED_TOTAL = REGISTRY.counter("http_client_shed_total", "Запросы, отброшенные без обращения к upstream")
+CIRCUIT_OPEN = REGISTRY.gauge("http_client_circuit_open", "1, если circuit breaker upstream открыт")
+INFLIGHT = REGISTRY.gauge("http_client_inflight", "Запросы к upstream в процессе выполнения")
+LATENCY = REGISTRY.histogram("http_client_request_seconds", "Длительность попытки запроса к upstream")
+
+
+def current_deadline() -> float | None:
+    """Дедлайн текущего входящего запроса (unix time, секунды)."""
+
+    return _request_deadline.get()
+
+
+def remaining_time() -> float | None:
+    deadline = current_deadline()
+    return None if deadline is None else deadline - time.time()
+
+
+class DeadlineMiddleware(BaseHTTPMiddleware):
+    """Принимает X-Request-Deadline и отклоняет запросы, дедлайн которых уже истёк."""
+
+    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+        raw = request.headers.get(DEADLINE_HEADER)
+        deadline: float | None = None
+        if raw:
+            try:
+                deadline = int(raw) / 1000
+            except ValueError:
+                deadline = None
+        if deadline is not None and deadline <= time.time():
+            payload = ErrorResponse(error_code="DEADLINE_EXCEEDED", message="Request deadline exceeded", details=None)
+            return JSONResponse(status_code=504, content=payload.model_dump())
+        token = _request_deadline.set(deadline)
+        try:
+            return await call_next(request)
+        finally:
+            _request_deadline.reset(token)
+
+
+class UpstreamUnavailable(Exception):
+    """Запрос к upstream не выполнен: открыт circuit, переполнен bulkhead, истёк дедлайн или исчерпаны попытки."""
+
+    def __init__(self, upstream: str, reason: str) -> None:
+        super().__init__(f"{upstream}: {reason}")
+        self.upstream = upstream
+        self.reason = reason
+
+
+class CircuitBreaker:
+    """Circuit breaker: closed -> open после N подряд ошибок -> half-open через reset_timeout."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float, clock: Callable[[], float] = time.monotonic) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN:
+            if self._clock() - self._opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == self.HALF_OPEN:
+            # В half-open пропускаем ровно один пробный запрос
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def cancel_probe(self) -> None:
+        """Освободить пробный слот half-open, если попытка не дошла до upstream."""
+
+        self._probe_in_flight = False
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self._failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self._opened_at = self._clock()
+            self._probe_in_flight = False
+
+
+class RetryBudget:
+    """Ограничивает долю повторов: каждый запрос даёт ratio токена, повтор стоит один токен."""
+
+    def __init__(self, ratio: float, min_tokens: float = 10.0) -> None:
+        self.ratio = ratio
+        self.max_tokens = min_tokens
+        self._tokens = min_tokens
+
+    def deposit(self) -> None:
+        self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+@dataclass
+class UpstreamPolicy:
+    """Параметры устойчивости для одного upstream."""
+
+    timeout: float = 5.0
+    max_retries: int = 2
+    backoff_base: float = 0.05
+    backoff_max: float = 1.0
+    retry_budget_ratio: float = 0.2
+    failure_threshold: int = 5
+    reset_timeout: float = 30.0
+    max_concurrency: int = 20
+    max_queue_wait: float = 0.1
+
+
+class _Upstream:
+    def __init__(self, name: str, base_url: str, policy: UpstreamPolicy) -> None:
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.policy = policy
+        self.breaker = CircuitBreaker(policy.failure_threshold, policy.reset_timeout)
+        self.bulkhead = asyncio.Semaphore(policy.max_concurrency)
+        self.budget = RetryBudget(policy.retry_budget_ratio)
+
+
+class ResilientHttpClient:
+    """Общий HTTP-клиент для межсервисных вызовов.
+
+    Один пул соединений на процесс; для каждого upstream — дедлайн,
+    повторы с jitter только для идемпотентных методов, circuit breaker
+    и bulkhead (лимит одновременных запросов).
+    """
+
+    def __init__(self, max_connections: int = 100, transport: httpx.AsyncBaseTransport | None = None) -> None:
+        self._client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            transport=transport,
+        )
+        self._upstreams: Dict[str, _Upstream] = {}
+
+    def register(self, name: str, base_url: str, policy: UpstreamPolicy) -> None:
+        self._upstreams[name] = _Upstream(name, base_url, policy)
+        CIRCUIT_OPEN.set(0, upstream=name)
+
+    def circuit_state(self, name: str) -> str:
+        return self._upstreams[name].breaker.state
+
+    async def get(self, upstream: str, path: str, **kwargs: Any) -> httpx.Response:
+        return await self.request(upstream, "GET", path, **kwargs)
+
+    async def request(self, upstream: str, method: str, path: str, **kwargs: Any) -> httpx.Response:
+        """Выполнить запрос; ответы 5xx после исчерпания попыток возвращаются как есть.
+
+        Так же возвращается последний 5xx, если повтор не дал бюджет повторов:
+        UpstreamUnavailable — только когда ответа от upstream не было вовсе.
+        """
+
+        up = self._upstreams[upstream]
+        policy = up.policy
+        method = method.upper()
+        attempts = 1 + (policy.max_retries if method in IDEMPOTENT_METHODS else 0)
+        up.budget.deposit()
+
+        last_error: Exception | None = None
+        last_response: httpx.Response | None = None
+        for attempt in range(attempts):
+            if attempt:
+                if not up.budget.withdraw():
+                    break
+                RETRIES_TOTAL.inc(upstream=upstream)
+                await self._backoff(policy, attempt)
+
+            timeout = self._attempt_timeout(upstream, policy)
+            try:
+                response = await self._attempt(up, method, path, timeout, kwargs)
+            except httpx.TransportError as exc:
+                last_error = exc
+                REQUESTS_TOTAL.inc(upstream=upstream, outcome="error")
+                logger.warning("upstream_request_failed", upstream=upstream, attempt=attempt, error=str(exc))
+                continue
+
+            if response.status_code >= 500:
+                REQUESTS_TOTAL.inc(upstream=upstream, outcome="server_error")
+                last_response = response
+                continue
+            REQUESTS_TOTAL.inc(upstream=upstream, outcome="ok")
+            return response
+
+        if last_response is not None:
+            return last_response
+        raise UpstreamUnavailable(upstream, "error") from last_error
+
+    def _attempt_timeout(self, upstream: str, policy: UpstreamPolicy) -> float:
+        remaining = remaining_time()
+        if remaining is None:
+            return policy.timeout
+        if remaining <= 0:
+            SHED_TOTAL.inc(upstream=upstream, reason="deadline_exceeded")
+            raise UpstreamUnavailable(upstream, "deadline_exceeded")
+        return min(policy.timeout, remaining)
+
+    async def _attempt(
+        self,
+        up: _Upstream,
+        method: str,
+        path: str,
+        timeout: float,
+        kwargs: Dict[str, Any],
+    ) -> httpx.Response:
+        if not up.breaker.allow():
+            SHED_TOTAL.inc(upstream=up.name, reason="circuit_open")
+            raise UpstreamUnavailable(up.name, "circuit_open")
+
+        try:
+            await asyncio.wait_for(up.bulkhead.acquire(), timeout=up.policy.max_queue_wait)
+        except asyncio.TimeoutError:
+            up.breaker.cancel_probe()
+            SHED_TOTAL.inc(upstream=up.name, reason="bulkhead_full")
+            raise UpstreamUnavailable(up.name, "bulkhead_full") from None
+
+        request_kwargs = {key: value for key, value in kwargs.items() if key != "headers"}
+        headers = dict(kwargs.get("headers") or {})
+        headers[DEADLINE_HEADER] = str(int((time.time() + timeout) * 1000))
+        INFLIGHT.inc(upstream=up.name)
+        started = time.perf_counter()
+        try:
+            response = await self._client.request(
+                method,
+                f"{up.base_url}{path}",
+                headers=headers,
+                timeout=timeout,
+                **request_kwargs,
+            )
+        except httpx.TransportError:
+            self._record(up, success=False)
+            raise
+        except BaseException:
+            up.breaker.cancel_probe()
+            raise
+        finally:
+            up.bulkhead.release()
+            INFLIGHT.dec(upstream=up.name)
+            LATENCY.observe(time.perf_counter() - started, upstream=up.name)
+
+        self._record(up, success=response.status_code < 500)
+        return response
+
+    @staticmethod
+    def _record(up: _Upstream, success: bool) -> None:
+        if success:
+            up.breaker.record_success()
+        else:
+            up.breaker.record_failure()
+        CIRCUIT_OPEN.set(1 if up.breaker.state == CircuitBreaker.OPEN else 0, upstream=up.name)
+
+    @staticmethod
+    async def _backoff(policy: UpstreamPolicy, attempt: int) -> None:
+        # Full jitter, но не дольше оставшегося дедлайна
+        delay = random.uniform(0, min(policy.backoff_max, policy.backoff_base * 2**attempt))
+        remaining = remaining_time()
+        if remaining is not None:
+            delay = min(delay, max(remaining, 0))
+        await asyncio.sleep(delay)
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
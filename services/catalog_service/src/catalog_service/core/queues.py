@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Dict, Tuple
+
+import pika
+
+from .logging import get_logger
+
+
+logger = get_logger(__name__)
+
+PARKED_ROUTING_KEY_HEADER = "x-parked-routing-key"
+PARKED_REASON_HEADER = "x-parked-reason"
+
+
+@dataclass(frozen=True)
+class WorkQueue:
+    """Именованная durable-очередь, общая для всех реплик сервиса (competing consumers).
+
+    Каждое сообщение получает одна реплика. Отклонённое без requeue сообщение
+    через exchange <name>.dlx уходит в <name>.retry, выдерживается там
+    retry_delay_ms и через <name>.requeue возвращается в исходную очередь с
+    прежним routing key. Когда попытки исчерпаны, consumer перекладывает
+    сообщение в <name>.parking, где оно ждёт разбора вручную.
+    """
+
+    name: str
+    routing_keys: Tuple[str, ...]
+    max_retries: int = 5
+    retry_delay_ms: int = 5000
+
+    @property
+    def dead_letter_exchange(self) -> str:
+        return f"{self.name}.dlx"
+
+    @property
+    def requeue_exchange(self) -> str:
+        return f"{self.name}.requeue"
+
+    @property
+    def retry_queue(self) -> str:
+        return f"{self.name}.retry"
+
+    @property
+    def parking_queue(self) -> str:
+        return f"{self.name}.parking"
+
+    def declare(self, channel: Any, exchange: str) -> None:
+        """Объявить очередь, контур повторов и отстойник, привязать очередь к exchange.
+
+        Объявление идемпотентно, но аргументы существующей очереди RabbitMQ не
+        меняет: после смены retry_delay_ms очередь <name>.retry нужно удалить.
+        """
+
+        # fanout-exchange сохраняют исходный routing key сообщения
+        channel.exchange_declare(exchange=self.dead_letter_exchange, exchange_type="fanout", durable=True)
+        channel.exchange_declare(exchange=self.requeue_exchange, exchange_type="fanout", durable=True)
+        channel.queue_declare(
+            queue=self.name,
+            durable=True,
+            arguments={"x-dead-letter-exchange": self.dead_letter_exchange},
+        )
+        channel.queue_declare(
+            queue=self.retry_queue,
+            durable=True,
+            arguments={"x-message-ttl": self.retry_delay_ms, "x-dead-letter-exchange": self.requeue_exchange},
+        )
+        channel.queue_declare(queue=self.parking_queue, durable=True)
+        channel.queue_bind(exchange=self.dead_letter_exchange, queue=self.retry_queue)
+        channel.queue_bind(exchange=self.requeue_exchange, queue=self.name)
+        for routing_key in self.routing_keys:
+            channel.queue_bind(exchange=exchange, queue=self.name, routing_key=routing_key)
+
+    def depth(self, channel: Any) -> Dict[str, Tuple[int, int]]:
+        """Сообщения и подписчики рабочей очереди, очереди повторов и отстойника (passive queue_declare)."""
+
+        depths = {}
+        for name in (self.name, self.retry_queue, self.parking_queue):
+            method = channel.queue_declare(queue=name, passive=True).method
+            depths[name] = (method.message_count, method.consumer_count)
+        return depths
+
+    def attempts(self, properties: Any) -> int:
+        """Сколько раз сообщение уже отклонялось из этой очереди (по заголовку x-death)."""
+
+        headers: Dict[str, Any] = getattr(properties, "headers", None) or {}
+        for death in headers.get("x-death") or []:
+            if death.get("queue") == self.name and death.get("reason") == "rejected":
+                return int(death.get("count", 0))
+        return 0
+
+    def park(self, channel: Any, routing_key: str, properties: Any, body: bytes, reason: str) -> None:
+        """Переложить сообщение в отстойник; подтверждение исходного — на вызывающем."""
+
+        headers = dict(getattr(properties, "headers", None) or {})
+        headers[PARKED_ROUTING_KEY_HEADER] = routing_key
+        headers[PARKED_REASON_HEADER] = reason
+        channel.basic_publish(
+            exchange="",
+            routing_key=self.parking_queue,
+            body=body,
+            properties=pika.BasicProperties(
+                content_type=getattr(properties, "content_type", None),
+                delivery_mode=2,
+                headers=headers,
+            ),
+        )
+        logger.warning("message_parked", queue=self.name, routing_key=routing_key, reason=reason)
+
+    def retry_or_park(self, channel: Any, method: Any, properties: Any, body: bytes, reason: str) -> bool:
+        """Отправить сообщение на отложенный повтор; True — попытки исчерпаны и оно в отстойнике."""
+
+        if self.attempts(properties) < self.max_retries:
+            channel.basic_reject(delivery_tag=method.delivery_tag, requeue=False)
+            return False
+        self.park(channel, method.routing_key, properties, body, reason)
+        channel.basic_ack(delivery_tag=method.delivery_tag)
+        return True
@@ -1,11 +1,19 @@
 from __future__ import annotations
 
-from fastapi import FastAPI
+import asyncio
+
+from fastapi import FastAPI, status
+from fastapi.responses import JSONResponse, PlainTextResponse
 
 from .api.routes_books import router as books_router
+from .clients import close_http_client
+from .core.consumer_stats import consumers_report
 from .core.errors import register_exception_handlers
+from .core.http_client import DeadlineMiddleware
 from .core.logging import get_logger, setup_logging
+from .core.metrics import PROMETHEUS_CONTENT_TYPE, REGISTRY
 from .core.middleware import CorrelationIdMiddleware
+from .config import get_settings
 from .message_bus import ensure_stock_consumer_started
 
 
@@ -18,6 +26,7 @@ app = FastAPI(
     version="1.0.0",
 )
 
+app.add_middleware(DeadlineMiddleware)
 app.add_middleware(CorrelationIdMiddleware)
 
 register_exception_handlers(app)
@@ -32,18 +41,42 @@ async def healthcheck() -> dict[str, str]:
     return {"status": "ok"}
 
 
+@app.get("/metrics", summary="Метрики в формате Prometheus", tags=["health"], response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    """Текущие значения метрик сервиса в текстовом формате Prometheus."""
+
+    return PlainTextResponse(REGISTRY.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@app.get("/health/consumers", summary="Состояние consumer-ов RabbitMQ", tags=["health"])
+async def consumers_health() -> JSONResponse:
+    """Глубина очередей и пропускная способность consumer-ов; 503, если какой-то из них остановился."""
+
+    healthy, consumers = consumers_report(get_settings().consumer_stall_seconds)
+    return JSONResponse(
+        {"status": "ok" if healthy else "stalled", "consumers": consumers},
+        status_code=status.HTTP_200_OK if healthy else status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
+
+
 @app.on_event("startup")
 async def on_startup() -> None:
-    """Логирование старта приложения и запуск consumer-а stock.reserve.request."""
+    """Логирование старта приложения и запуск consumer-а stock.reserve.request.
+
+    При CONSUMERS_ENABLED=false очередь разбирают отдельные процессы
+    `python -m catalog_service.worker`.
+    """
 
     logger.info("catalog_service_started")
-    ensure_stock_consumer_started()
+    if get_settings().consumers_enabled:
+        ensure_stock_consumer_started(asyncio.get_running_loop())
 
 
 @app.on_event("shutdown")
 async def on_shutdown() -> None:
-    """Логирование остановки приложения."""
+    """Логирование остановки приложения и закрытие HTTP-клиента."""
 
+    await close_http_client()
     logger.info("catalog_service_stopped")
 
 
@@ -1,18 +1,24 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
 import json
 import threading
+import time
 import uuid
-from datetime import datetime, timezone
-from typing import Any, Dict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Sequence, Tuple
 
 import pika
-from sqlalchemy import select
+from sqlalchemy import delete, select
 
 from .config import get_settings
+from .core.consumer_stats import get_consumer_stats, poll_queue_depth
 from .core.logging import get_logger
+from .core.queues import WorkQueue
+from .core.transport import connect
 from .db import AsyncSessionLocal
-from .models import Stock
+from .models import Stock, StockReservation
 
 
 logger = get_logger(__name__)
@@ -23,9 +29,8 @@ class RabbitMQClient:
 
     def __init__(self) -> None:
         settings = get_settings()
-        params = pika.URLParameters(settings.rabbitmq_url)
         self.exchange = settings.rabbitmq_exchange
-        self._connection = pika.BlockingConnection(params)
+        self._connection = connect(settings.message_transport, settings.rabbitmq_url)
         self._channel = self._connection.channel()
         self._channel.exchange_declare(exchange=self.exchange, exchange_type="topic", durable=True)
 
@@ -68,91 +73,184 @@ def get_rabbitmq_client() -> RabbitMQClient:
     return _client
 
 
+RESERVE_SUCCEEDED = "succeeded"
+RESERVE_FAILED = "failed"
+
+RESERVATION_KEY_MAX_LENGTH = 64
+
+
+def reservation_key(idempotency_key: Any, body: bytes) -> str:
+    """Ключ запроса резервирования: idempotency_key конверта, без него (или слишком длинный) — sha256 тела."""
+
+    if isinstance(idempotency_key, str) and 0 < len(idempotency_key) <= RESERVATION_KEY_MAX_LENGTH:
+        return idempotency_key
+    return hashlib.sha256(body).hexdigest()
+
+
+def requested_quantities(items: Sequence[Any]) -> Optional[Dict[Any, int]]:
+    """Количество экземпляров по книгам запроса; None — в запросе некорректная позиция."""
+
+    requested: Dict[Any, int] = {}
+    for item in items:
+        if not isinstance(item, dict):
+            return None
+        book_id = item.get("book_id")
+        try:
+            quantity = int(item.get("quantity", 0))
+        except (TypeError, ValueError):
+            return None
+        if not book_id or quantity <= 0:
+            return None
+        requested[book_id] = requested.get(book_id, 0) + quantity
+    return requested
+
+
+async def reserve_stock(key: str, items: Sequence[Any]) -> Tuple[str, bool]:
+    """Списать склад по запросу key не более одного раза; (результат, True — запрос уже обработан).
+
+    Запросы разбирают несколько consumer-ов, поэтому строки склада блокируются
+    до коммита в порядке book_id. Уже под блокировкой проверяется, не обработан
+    ли запрос: повтор ждёт на тех же строках и видит зафиксированный результат,
+    который записывается в одной транзакции со списанием.
+    """
+
+    requested = requested_quantities(items)
+    async with AsyncSessionLocal() as session:
+        stocks: Dict[Any, Stock] = {}
+        for book_id in sorted(requested or {}):
+            res = await session.execute(select(Stock).where(Stock.book_id == book_id).with_for_update())
+            stock = res.scalar_one_or_none()
+            if stock is not None:
+                stocks[book_id] = stock
+
+        processed = await session.get(StockReservation, key)
+        if processed is not None:
+            return processed.status, True
+
+        ok = requested is not None and all(
+            book_id in stocks and stocks[book_id].quantity >= quantity for book_id, quantity in requested.items()
+        )
+        if ok:
+            for book_id, quantity in requested.items():
+                stocks[book_id].quantity -= quantity
+        status = RESERVE_SUCCEEDED if ok else RESERVE_FAILED
+        session.add(StockReservation(idempotency_key=key, status=status, created_at=datetime.now(timezone.utc)))
+        await session.commit()
+    return status, False
+
+
+def publish_reserve_result(status: str, key: str, payload: Dict[str, Any]) -> None:
+    """Опубликовать результат резервирования; повтор публикует тот же ключ идемпотентности."""
+
+    client = get_rabbitmq_client()
+    if status == RESERVE_SUCCEEDED:
+        client.publish_event("stock.reserve.succeeded", {"idempotency_key": key, "original": payload})
+    else:
+        client.publish_event(
+            "stock.reserve.failed",
+            {"idempotency_key": key, "reason": "not_enough_stock", "original": payload},
+        )
+
+
+async def purge_stock_reservations(retention_days: int) -> None:
+    """Удалить ключи обработанных запросов старше retention_days."""
+
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    try:
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(delete(StockReservation).where(StockReservation.created_at < cutoff))
+            await session.commit()
+    except Exception:
+        logger.warning("stock_reservations_purge_failed")
+        return
+    if result.rowcount:
+        logger.info("stock_reservations_purged", deleted=result.rowcount)
+
+
 class StockReserveConsumer(threading.Thread):
-    """Consumer для обработки stock.reserve.request и генерации succeeded/failed."""
+    """Consumer для обработки stock.reserve.request и генерации succeeded/failed.
+
+    Реплики сервиса разбирают одну общую durable-очередь, поэтому каждый
+    запрос резервирует склад один раз, а запросы, пришедшие во время
+    перезапуска, дожидаются в очереди. Повтор запроса после сбоя (ошибка
+    публикации результата, таймаут) склад второй раз не списывает — см.
+    reserve_stock. Обработка выполняется на переданном event loop:
+    HTTP-приложения или процесса-воркера.
+    """
 
     daemon = True
 
-    def __init__(self) -> None:
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
         super().__init__()
         settings = get_settings()
-        self._connection_params = pika.URLParameters(settings.rabbitmq_url)
+        self._transport = settings.message_transport
+        self._url = settings.rabbitmq_url
         self.exchange = settings.rabbitmq_exchange
+        self._loop = loop
+        self._prefetch = max(settings.rabbitmq_prefetch_count, 1)
+        self.queue = WorkQueue(
+            name=settings.stock_reserve_queue,
+            routing_keys=("stock.reserve.request",),
+            max_retries=settings.rabbitmq_max_retries,
+            retry_delay_ms=settings.rabbitmq_retry_delay_ms,
+        )
+        self._depth_poll_seconds = settings.consumer_depth_poll_seconds
+        self._retention_days = settings.stock_reservation_retention_days
+        self._purge_interval = settings.stock_reservation_purge_interval_seconds
+        self.stats = get_consumer_stats(self.queue.name)
+        self.stats.threads.append(self)
 
     def run(self) -> None:
-        connection = pika.BlockingConnection(self._connection_params)
+        connection = connect(self._transport, self._url)
         channel = connection.channel()
         channel.exchange_declare(exchange=self.exchange, exchange_type="topic", durable=True)
+        channel.basic_qos(prefetch_count=self._prefetch)
+        self.queue.declare(channel, self.exchange)
+        poll_queue_depth(connection, channel, self.queue, self.stats, self._depth_poll_seconds)
 
-        result = channel.queue_declare(queue="", exclusive=True)
-        queue_name = result.method.queue
+        def purge() -> None:
+            asyncio.run_coroutine_threadsafe(purge_stock_reservations(self._retention_days), self._loop)
+            connection.call_later(self._purge_interval, purge)
 
-        channel.queue_bind(exchange=self.exchange, queue=queue_name, routing_key="stock.reserve.request")
+        connection.call_later(self._purge_interval, purge)
 
         def callback(ch, method, properties, body) -> None:  # type: ignore[no-untyped-def]
-            import asyncio
-
+            self.stats.received(redelivered=method.redelivered or self.queue.attempts(properties) > 0)
             try:
                 envelope = json.loads(body.decode("utf-8"))
-                idempotency_key = envelope.get("idempotency_key")
                 payload: Dict[str, Any] = envelope.get("payload", {})
+                key = reservation_key(envelope.get("idempotency_key"), body)
             except Exception:
                 logger.warning("invalid_stock_reserve_payload")
+                self.queue.park(ch, method.routing_key, properties, body, "invalid_payload")
                 ch.basic_ack(delivery_tag=method.delivery_tag)
+                self.stats.settled("parked")
                 return
 
             async def handle_reserve() -> None:
-                async with AsyncSessionLocal() as session:
-                    items = payload.get("items", [])
-                    # Проверяем наличие stock по всем книгам
-                    ok = True
-                    stocks: Dict[int, Stock] = {}
-                    for item in items:
-                        book_id = item.get("book_id")
-                        qty = int(item.get("quantity", 0))
-                        if not book_id or qty <= 0:
-                            ok = False
-                            break
-                        res = await session.execute(select(Stock).where(Stock.book_id == book_id))
-                        stock: Stock | None = res.scalar_one_or_none()
-                        if not stock or stock.quantity < qty:
-                            ok = False
-                            break
-                        stocks[book_id] = stock
-
-                    client = get_rabbitmq_client()
-                    if not ok:
-                        client.publish_event(
-                            "stock.reserve.failed",
-                            {
-                                "idempotency_key": idempotency_key,
-                                "reason": "not_enough_stock",
-                                "original": payload,
-                            },
-                        )
-                        return
-
-                    # Резервируем: уменьшаем количество
-                    for item in items:
-                        book_id = item["book_id"]
-                        qty = int(item["quantity"])
-                        stocks[book_id].quantity -= qty
-
-                    await session.commit()
-
-                    client.publish_event(
-                        "stock.reserve.succeeded",
-                        {
-                            "idempotency_key": idempotency_key,
-                            "original": payload,
-                        },
-                    )
-
-            asyncio.run(handle_reserve())
+                status, repeated = await reserve_stock(key, payload.get("items", []))
+                if repeated:
+                    logger.info("stock_reserve_repeated", idempotency_key=key, status=status)
+                publish_reserve_result(status, key, payload)
+
+            started = time.perf_counter()
+            future = asyncio.run_coroutine_threadsafe(handle_reserve(), self._loop)
+            try:
+                future.result(timeout=10)
+            except Exception:
+                # Иначе после таймаута обработка продолжилась бы параллельно с повтором
+                future.cancel()
+                logger.exception("stock_reserve_failed", idempotency_key=key)
+                parked = self.queue.retry_or_park(ch, method, properties, body, "handler_failed")
+                self.stats.settled("parked" if parked else "retried")
+                return
+            finally:
+                self.stats.observe_handler(time.perf_counter() - started)
             ch.basic_ack(delivery_tag=method.delivery_tag)
+            self.stats.settled("acked")
 
-        channel.basic_consume(queue=queue_name, on_message_callback=callback, auto_ack=False)
-        logger.info("stock_reserve_consumer_started")
+        channel.basic_consume(queue=self.queue.name, on_message_callback=callback, auto_ack=False)
+        logger.info("stock_reserve_consumer_started", queue=self.queue.name, prefetch=self._prefetch)
         channel.start_consuming()
 
 
@@ -160,14 +258,14 @@ _consumer_started = False
 _consumer_lock = threading.Lock()
 
 
-def ensure_stock_consumer_started() -> None:
+def ensure_stock_consumer_started(loop: asyncio.AbstractEventLoop) -> None:
     """Гарантировать запуск consumer-а резервирования склада."""
 
     global _consumer_started
     if not _consumer_started:
         with _consumer_lock:
             if not _consumer_started:
-                consumer = StockReserveConsumer()
+                consumer = StockReserveConsumer(loop)
                 consumer.start()
                 _consumer_started = True
 
@@ -75,3 +75,17 @@ class Stock(Base):
     book: Mapped[Book] = relationship(back_populates="stock")
 
 
+class StockReservation(Base):
+    """Processed stock.reserve.request and its outcome (succeeded/failed).
+
+    Written in the same transaction as the stock decrement, so a repeated
+    request re-publishes the stored outcome instead of reserving again.
+    """
+
+    __tablename__ = "stock_reservations"
+
+    idempotency_key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    status: Mapped[str] = mapped_column(String(16), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, index=True)
+
+
@@ -1,5 +1,10 @@
 from __future__ import annotations
 
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Callable, Tuple
+
 from fastapi import HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jose import JWTError, jwt
@@ -10,13 +15,63 @@ from .config import get_settings
 bearer_scheme = HTTPBearer(auto_error=False)
 
 
-def decode_jwt_token(token: str) -> dict:
-    """Декодировать JWT-токен, полученный от auth-service."""
+class VerifiedTokenCache:
+    """LRU уже проверенных JWT: sha256(token) -> claims до момента exp.
+
+    Повторный запрос с тем же токеном не проверяет подпись заново. Токены без
+    exp не кэшируются. Сам токен в памяти не хранится, только его хеш.
+    """
+
+    def __init__(self, max_size: int, clock: Callable[[], float] = time.time) -> None:
+        self._max_size = max_size
+        self._clock = clock
+        self._data: OrderedDict[bytes, Tuple[float, dict]] = OrderedDict()
+
+    @staticmethod
+    def key(token: str) -> bytes:
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def get(self, key: bytes) -> dict | None:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= self._clock():
+            self._data.pop(key, None)
+            return None
+        self._data.move_to_end(key)
+        return entry[1]
+
+    def put(self, key: bytes, claims: dict) -> None:
+        exp = claims.get("exp")
+        if self._max_size <= 0 or not isinstance(exp, (int, float)):
+            return
+        self._data[key] = (float(exp), claims)
+        self._data.move_to_end(key)
+        while len(self._data) > self._max_size:
+            self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+_token_cache: VerifiedTokenCache | None = None
+
+
+def get_token_cache() -> VerifiedTokenCache:
+    """Получить singleton-кэш проверенных JWT."""
+
+    global _token_cache
+    if _token_cache is None:
+        _token_cache = VerifiedTokenCache(max_size=get_settings().jwt_cache_size)
+    return _token_cache
+
+
+def verify_jwt_token(token: str) -> dict:
+    """Проверить подпись и срок JWT без кэша."""
 
     settings = get_settings()
     try:
-        payload = jwt.decode(token, settings.jwt_secret, algorithms=[settings.jwt_algorithm])
-        return payload
+        return jwt.decode(token, settings.jwt_secret, algorithms=[settings.jwt_algorithm])
     except JWTError as exc:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -24,4 +79,17 @@ def decode_jwt_token(token: str) -> dict:
         ) from exc
 
 
+def decode_jwt_token(token: str) -> dict:
+    """Декодировать JWT-токен, полученный от auth-service (с кэшем проверенных токенов)."""
+
+    cache = get_token_cache()
+    key = cache.key(token)
+    claims = cache.get(key)
+    if claims is None:
+        claims = verify_jwt_token(token)
+        cache.put(key, claims)
+    # Копия, чтобы вызывающий код не мог изменить закэшированные claims
+    return dict(claims)
+
+
 
@@ -28,3 +28,249 @@ def test_create_and_get_book(monkeypatch):
     assert response.status_code in (201, 401, 403)
 
 
+
+
+def test_verified_token_cache_reuses_claims_until_exp():
+    from datetime import datetime, timedelta, timezone
+
+    import pytest
+    from fastapi import HTTPException
+    from jose import jwt
+
+    from catalog_service.config import get_settings
+    from catalog_service.security import decode_jwt_token, get_token_cache
+
+    settings = get_settings()
+    exp = int((datetime.now(tz=timezone.utc) + timedelta(minutes=5)).timestamp())
+    token = jwt.encode({"sub": "1", "role": "admin", "exp": exp}, settings.jwt_secret, algorithm=settings.jwt_algorithm)
+
+    claims = decode_jwt_token(token)
+    claims["role"] = "user"
+    assert decode_jwt_token(token)["role"] == "admin"
+    assert get_token_cache().get(get_token_cache().key(token)) is not None
+
+    with pytest.raises(HTTPException):
+        decode_jwt_token(token + "x")
+
+
+def test_work_queue_retries_with_delay_then_parks():
+    from types import SimpleNamespace
+
+    from catalog_service.core.queues import PARKED_REASON_HEADER, WorkQueue
+
+    class FakeChannel:
+        def __init__(self) -> None:
+            self.calls = []
+
+        def __getattr__(self, name):
+            return lambda **kwargs: self.calls.append((name, kwargs))
+
+    queue = WorkQueue(name="catalog.test", routing_keys=("stock.reserve.request",), max_retries=2, retry_delay_ms=100)
+    channel = FakeChannel()
+    queue.declare(channel, "bookstore.events")
+    declared = {kwargs["queue"]: kwargs.get("arguments") for name, kwargs in channel.calls if name == "queue_declare"}
+    assert declared["catalog.test"] == {"x-dead-letter-exchange": "catalog.test.dlx"}
+    assert declared["catalog.test.retry"] == {"x-message-ttl": 100, "x-dead-letter-exchange": "catalog.test.requeue"}
+    assert ("queue_bind", {"exchange": "catalog.test.requeue", "queue": "catalog.test"}) in channel.calls
+
+    method = SimpleNamespace(delivery_tag=7, routing_key="stock.reserve.request")
+    fresh = SimpleNamespace(headers=None, content_type="application/json")
+    assert queue.attempts(fresh) == 0
+    channel = FakeChannel()
+    assert queue.retry_or_park(channel, method, fresh, b"{}", "handler_failed") is False
+    assert channel.calls == [("basic_reject", {"delivery_tag": 7, "requeue": False})]
+
+    death = {"queue": "catalog.test", "reason": "rejected", "count": 2}
+    exhausted = SimpleNamespace(headers={"x-death": [death]}, content_type="application/json")
+    channel = FakeChannel()
+    assert queue.retry_or_park(channel, method, exhausted, b"{}", "handler_failed") is True
+    (publish, published), ack = channel.calls
+    assert publish == "basic_publish" and published["routing_key"] == "catalog.test.parking"
+    assert published["properties"].headers[PARKED_REASON_HEADER] == "handler_failed"
+    assert ack == ("basic_ack", {"delivery_tag": 7})
+
+
+def test_consumer_stats_report_throughput_and_stall():
+    import threading
+
+    from catalog_service.core.consumer_stats import ConsumerStats, consumers_report, get_consumer_stats
+
+    stats = ConsumerStats("catalog.stats-test")
+    stats.set_depth({"catalog.stats-test": (5, 1), "catalog.stats-test.parking": (0, 0)})
+    stats.received()
+    stats.received(redelivered=True)
+    assert stats.inflight == 2
+    stats.settled("acked")
+    stats.settled("retried")
+    snapshot = stats.snapshot(stall_seconds=60)
+    assert (snapshot["depth"], snapshot["inflight"], snapshot["stalled"]) == (5, 0, None)
+    assert snapshot["messages_per_second"] == round(2 / 60, 3)
+
+    # Очередь не пуста, а прогресса нет дольше порога
+    stats.last_progress -= 120
+    assert stats.stalled_reason(stall_seconds=60) == "no_progress"
+    stats.depth_checked_at -= 120
+    assert stats.stalled_reason(stall_seconds=60) == "broker_unreachable"
+
+    stopped = threading.Thread(target=lambda: None)
+    stopped.start()
+    stopped.join()
+    stats.threads.append(stopped)
+    assert stats.stalled_reason(stall_seconds=60) == "thread_stopped"
+
+    assert get_consumer_stats("catalog.stats-test") is get_consumer_stats("catalog.stats-test")
+    healthy, report = consumers_report(stall_seconds=60)
+    assert healthy and report[0]["queue"] == "catalog.stats-test"
+
+
+def test_worker_exits_when_consumer_thread_stops():
+    import asyncio
+    import threading
+
+    from catalog_service.core.worker import serve_consumers
+
+    loops = []
+
+    def factory(loop: asyncio.AbstractEventLoop) -> threading.Thread:
+        loops.append(loop)
+        return threading.Thread(target=lambda: None)
+
+    # Поток consumer-а завершился — воркер выходит с ошибкой, чтобы его перезапустили
+    assert asyncio.run(serve_consumers(factory, concurrency=2, check_interval_seconds=0.01)) == 1
+    assert len(loops) == 2
+
+
+def test_memory_transport_routing_prefetch_and_redelivery():
+    import pytest
+    from pika.exceptions import ChannelClosedByBroker
+
+    from catalog_service.core.queues import WorkQueue
+    from catalog_service.core.transport import InMemoryBroker, topic_matches
+
+    assert topic_matches("stock.#", "stock.reserve.failed") and topic_matches("*.created", "order.created")
+    assert not topic_matches("stock.*", "stock.reserve.failed")
+
+    broker = InMemoryBroker()
+    connection = broker.connect()
+    channel = connection.channel()
+    channel.exchange_declare(exchange="events", exchange_type="topic")
+    queue = WorkQueue(name="reserve", routing_keys=("stock.reserve.*",), max_retries=1, retry_delay_ms=10)
+    queue.declare(channel, "events")
+    channel.basic_qos(prefetch_count=2)
+    received = []
+    channel.basic_consume("reserve", lambda ch, method, properties, body: received.append((method, properties, body)))
+    for body in (b"1", b"2", b"3"):
+        channel.basic_publish("events", "stock.reserve.request", body)
+    channel.basic_publish("events", "order.created", b"unrouted")
+    connection.process_data_events()
+    # Третье сообщение ждёт, пока освободится место в prefetch
+    assert [body for _, _, body in received] == [b"1", b"2"]
+    channel.basic_ack(received[0][0].delivery_tag)
+    connection.process_data_events()
+    assert received[2][2] == b"3"
+
+    # Отклонённое сообщение возвращается из очереди повторов, со второго раза — в отстойник
+    method, properties, body = received[1]
+    assert not queue.retry_or_park(channel, method, properties, body, "failed")
+    for _ in range(100):
+        if len(received) == 4:
+            break
+        connection.process_data_events(0.05)
+    method, properties, body = received[3]
+    assert body == b"2" and queue.attempts(properties) == 1
+    assert queue.retry_or_park(channel, method, properties, body, "failed")
+    assert queue.depth(channel)["reserve.parking"] == (1, 0)
+
+    # Неподтверждённое сообщение закрытого соединения доставляется снова
+    connection.close()
+    other = broker.connect()
+    redelivered = []
+    other_channel = other.channel()
+    other_channel.basic_consume("reserve", lambda ch, method, properties, body: redelivered.append((method, body)))
+    other.process_data_events()
+    assert [(method.redelivered, body) for method, body in redelivered] == [(True, b"3")]
+    other_channel.basic_ack(redelivered[0][0].delivery_tag)
+    assert broker.pending() == 0
+    # Повторное подтверждение, как и в RabbitMQ, закрывает канал
+    with pytest.raises(ChannelClosedByBroker):
+        other_channel.basic_ack(redelivered[0][0].delivery_tag)
+    assert other_channel.is_closed
+
+
+
+def test_stock_reserve_retry_after_failed_publish_reserves_once(monkeypatch):
+    import asyncio
+    import json
+    import threading
+
+    import pytest
+    from sqlalchemy import select
+
+    from catalog_service import message_bus
+    from catalog_service.config import get_settings
+    from catalog_service.core import transport
+    from catalog_service.db import AsyncSessionLocal, Base, engine
+    from catalog_service.models import Book, Stock
+
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+    def run(coro):
+        return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout=30)
+
+    async def seed() -> int:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with AsyncSessionLocal() as session:
+            book = Book(title="reserve-retry", price=10)
+            session.add(book)
+            await session.flush()
+            session.add(Stock(book_id=book.id, quantity=5))
+            await session.commit()
+            return book.id
+
+    try:
+        book_id = run(seed())
+    except OSError:
+        pytest.skip("PostgreSQL is not available")
+
+    settings = get_settings()
+    monkeypatch.setattr(settings, "message_transport", "memory")
+    monkeypatch.setattr(settings, "rabbitmq_retry_delay_ms", 10)
+    monkeypatch.setattr(settings, "stock_reserve_queue", "catalog.reserve-retry-test")
+    monkeypatch.setattr(transport, "_broker", transport.InMemoryBroker())
+    monkeypatch.setattr(message_bus, "_client", None)
+
+    # Склад уже списан и закоммичен, а публикация результата падает один раз
+    publish_event = message_bus.RabbitMQClient.publish_event
+    failures = []
+
+    def flaky_publish(self, routing_key, payload):
+        if not failures:
+            failures.append(routing_key)
+            raise ConnectionError("broker went away")
+        publish_event(self, routing_key, payload)
+
+    monkeypatch.setattr(message_bus.RabbitMQClient, "publish_event", flaky_publish)
+
+    broker = transport.get_memory_broker()
+    channel = broker.connect().channel()
+    channel.exchange_declare(exchange=settings.rabbitmq_exchange, exchange_type="topic")
+    channel.queue_declare("reserve-results")
+    channel.queue_bind("reserve-results", settings.rabbitmq_exchange, "stock.reserve.succeeded")
+    consumer = message_bus.StockReserveConsumer(loop)
+    consumer.start()
+    while consumer.stats.depth_checked_at is None:
+        threading.Event().wait(0.01)
+
+    envelope = {"idempotency_key": f"reserve-retry-{book_id}", "payload": {"items": [{"book_id": book_id, "quantity": 2}]}}
+    channel.basic_publish(settings.rabbitmq_exchange, "stock.reserve.request", json.dumps(envelope).encode("utf-8"))
+    assert broker.wait_idle(10)
+
+    async def quantity() -> int:
+        async with AsyncSessionLocal() as session:
+            return await session.scalar(select(Stock.quantity).where(Stock.book_id == book_id))
+
+    assert failures == ["stock.reserve.succeeded"]
+    assert run(quantity()) == 3
+    assert channel.queue_declare("reserve-results", passive=True).method.message_count == 1
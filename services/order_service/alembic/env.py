@@ -3,10 +3,11 @@ from __future__ import annotations
 from logging.config import fileConfig
 
 from alembic import context
-from sqlalchemy import engine_from_config, pool
+from sqlalchemy import text
 
 from order_service.config import get_settings
 from order_service.models import Base
+from order_service.sharding import create_sync_engine, shard_specs
 
 config = context.config
 
@@ -32,31 +33,29 @@ def run_migrations_offline() -> None:
 
 
 def run_migrations_online() -> None:
-    """Run migrations in 'online' mode."""
+    """Run migrations in 'online' mode on every order shard."""
 
-    configuration = config.get_section(config.config_ini_section) or {}
-    configuration["sqlalchemy.url"] = get_settings().database_url
+    for spec in shard_specs(get_settings()):
+        connectable = create_sync_engine(spec)
 
-    connectable = engine_from_config(
-        configuration,
-        prefix="sqlalchemy.",
-        poolclass=pool.NullPool,
-    )
+        with connectable.connect() as connection:
+            if spec.schema:
+                connection.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{spec.schema}"'))
+                connection.commit()
+
+            context.configure(
+                connection=connection,
+                target_metadata=target_metadata,
+                compare_type=True,
+            )
 
-    with connectable.connect() as connection:
-        context.configure(
-            connection=connection,
-            target_metadata=target_metadata,
-            compare_type=True,
-        )
+            with context.begin_transaction():
+                context.run_migrations()
 
-        with context.begin_transaction():
-            context.run_migrations()
+        connectable.dispose()
 
 
 if context.is_offline_mode():
     run_migrations_offline()
 else:
     run_migrations_online()
-
-
@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002_order_idempotency_keys"
+down_revision = "0001_init"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "order_idempotency_keys",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("user_id", sa.Integer, nullable=False),
+        sa.Column("key", sa.String(length=128), nullable=False),
+        sa.Column("order_id", sa.Integer, nullable=False),
+        sa.Column("response", sa.JSON, nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+        sa.UniqueConstraint("user_id", "key", name="uq_order_idempotency_keys_user_key"),
+    )
+    op.create_index("ix_order_idempotency_keys_expires_at", "order_idempotency_keys", ["expires_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_order_idempotency_keys_expires_at", table_name="order_idempotency_keys")
+    op.drop_table("order_idempotency_keys")
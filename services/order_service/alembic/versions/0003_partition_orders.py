@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+from alembic import op
+
+
+revision = "0003_partition_orders"
+down_revision = "0002_order_idempotency_keys"
+branch_labels = None
+depends_on = None
+
+
+# Помесячные партиции создаются от первого заказа до текущего месяца + запас;
+# дальнейшие партиции досоздаёт order_service.partitions при старте сервиса.
+CREATE_MONTH_PARTITIONS = """
+DO $$
+DECLARE
+    first_month date := date_trunc('month', coalesce((SELECT min(created_at) FROM orders_legacy), now()))::date;
+    last_month date := (date_trunc('month', now()) + interval '3 months')::date;
+    m date := first_month;
+BEGIN
+    WHILE m <= last_month LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF orders FOR VALUES FROM (%L) TO (%L)',
+            'orders_p' || to_char(m, 'YYYY_MM'), m, (m + interval '1 month')::date
+        );
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF order_items FOR VALUES FROM (%L) TO (%L)',
+            'order_items_p' || to_char(m, 'YYYY_MM'), m, (m + interval '1 month')::date
+        );
+        m := (m + interval '1 month')::date;
+    END LOOP;
+END $$;
+"""
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE order_items RENAME TO order_items_legacy")
+    op.execute("ALTER TABLE orders RENAME TO orders_legacy")
+    op.execute("ALTER TABLE orders_legacy RENAME CONSTRAINT orders_pkey TO orders_legacy_pkey")
+    op.execute("ALTER TABLE order_items_legacy RENAME CONSTRAINT order_items_pkey TO order_items_legacy_pkey")
+    op.execute("ALTER INDEX ix_orders_user_id RENAME TO ix_orders_legacy_user_id")
+    # Последовательности id переживают удаление старых таблиц
+    op.execute("ALTER SEQUENCE orders_id_seq OWNED BY NONE")
+    op.execute("ALTER SEQUENCE order_items_id_seq OWNED BY NONE")
+
+    op.execute(
+        """
+        CREATE TABLE orders (
+            id integer NOT NULL DEFAULT nextval('orders_id_seq'),
+            user_id integer NOT NULL,
+            status varchar(32) NOT NULL DEFAULT 'created',
+            total_amount numeric(10, 2) NOT NULL DEFAULT 0,
+            created_at timestamptz NOT NULL,
+            CONSTRAINT orders_pkey PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+        """
+    )
+    op.execute("CREATE INDEX ix_orders_user_id_created_at ON orders (user_id, created_at DESC)")
+    op.execute("CREATE TABLE orders_default PARTITION OF orders DEFAULT")
+
+    op.execute(
+        """
+        CREATE TABLE order_items (
+            id integer NOT NULL DEFAULT nextval('order_items_id_seq'),
+            order_id integer NOT NULL,
+            order_created_at timestamptz NOT NULL,
+            book_id integer NOT NULL,
+            quantity integer NOT NULL DEFAULT 1,
+            price numeric(10, 2) NOT NULL DEFAULT 0,
+            CONSTRAINT order_items_pkey PRIMARY KEY (id, order_created_at),
+            CONSTRAINT fk_order_items_order FOREIGN KEY (order_id, order_created_at)
+                REFERENCES orders (id, created_at)
+        ) PARTITION BY RANGE (order_created_at)
+        """
+    )
+    op.execute("CREATE INDEX ix_order_items_order_id ON order_items (order_id, order_created_at)")
+    op.execute("CREATE TABLE order_items_default PARTITION OF order_items DEFAULT")
+
+    op.execute(CREATE_MONTH_PARTITIONS)
+
+    op.execute(
+        """
+        INSERT INTO orders (id, user_id, status, total_amount, created_at)
+        SELECT id, user_id, status, total_amount, created_at FROM orders_legacy
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO order_items (id, order_id, order_created_at, book_id, quantity, price)
+        SELECT i.id, i.order_id, o.created_at, i.book_id, i.quantity, i.price
+        FROM order_items_legacy i JOIN orders_legacy o ON o.id = i.order_id
+        """
+    )
+
+    op.execute("DROP TABLE order_items_legacy")
+    op.execute("DROP TABLE orders_legacy")
+    op.execute("ALTER SEQUENCE orders_id_seq OWNED BY orders.id")
+    op.execute("ALTER SEQUENCE order_items_id_seq OWNED BY order_items.id")
+
+
+def downgrade() -> None:
+    op.execute("ALTER SEQUENCE orders_id_seq OWNED BY NONE")
+    op.execute("ALTER SEQUENCE order_items_id_seq OWNED BY NONE")
+    op.execute("ALTER TABLE order_items RENAME TO order_items_partitioned")
+    op.execute("ALTER TABLE orders RENAME TO orders_partitioned")
+    op.execute("ALTER TABLE orders_partitioned RENAME CONSTRAINT orders_pkey TO orders_partitioned_pkey")
+    op.execute("ALTER TABLE order_items_partitioned RENAME CONSTRAINT order_items_pkey TO order_items_partitioned_pkey")
+
+    op.execute(
+        """
+        CREATE TABLE orders (
+            id integer NOT NULL DEFAULT nextval('orders_id_seq') PRIMARY KEY,
+            user_id integer NOT NULL,
+            status varchar(32) NOT NULL DEFAULT 'created',
+            total_amount numeric(10, 2) NOT NULL DEFAULT 0,
+            created_at timestamptz NOT NULL
+        )
+        """
+    )
+    op.execute("CREATE INDEX ix_orders_user_id ON orders (user_id)")
+    op.execute(
+        """
+        CREATE TABLE order_items (
+            id integer NOT NULL DEFAULT nextval('order_items_id_seq') PRIMARY KEY,
+            order_id integer NOT NULL REFERENCES orders (id),
+            book_id integer NOT NULL,
+            quantity integer NOT NULL DEFAULT 1,
+            price numeric(10, 2) NOT NULL DEFAULT 0
+        )
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO orders (id, user_id, status, total_amount, created_at)
+        SELECT id, user_id, status, total_amount, created_at FROM orders_partitioned
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO order_items (id, order_id, book_id, quantity, price)
+        SELECT id, order_id, book_id, quantity, price FROM order_items_partitioned
+        """
+    )
+    op.execute("DROP TABLE order_items_partitioned")
+    op.execute("DROP TABLE orders_partitioned")
+    op.execute("ALTER SEQUENCE orders_id_seq OWNED BY orders.id")
+    op.execute("ALTER SEQUENCE order_items_id_seq OWNED BY order_items.id")
@@ -0,0 +1 @@
+"""Order service package."""
@@ -1,19 +1,26 @@
 from __future__ import annotations
 
-from typing import Annotated, List
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Annotated, Dict, List, Optional, Sequence, Tuple
 
-import httpx
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from ..clients import CATALOG_UPSTREAM, get_http_client
 from ..config import get_settings
+from ..core.http_client import UpstreamUnavailable
 from ..core.logging import get_logger
 from ..db import get_db
-from ..dependencies import get_current_user
+from ..dependencies import get_current_user, user_id_from_claims
+from ..idempotency import get_idempotency_coordinator
 from ..message_bus import get_rabbitmq_client
-from ..models import Cart, CartItem, Order, OrderItem
-from ..schemas import OrderList, OrderRead, OrderItemRead
+from ..models import FINAL_ORDER_STATUSES, Cart, CartItem, Order, OrderIdempotencyKey, OrderItem, OrderStatus
+from ..pubsub import OrderStatusBroker, OrderStatusSubscription, get_order_status_broker
+from ..schemas import OrderList, OrderRead, OrderItemRead, OrderStatusEvent
 
 router = APIRouter(prefix="/orders", tags=["orders"])
 
@@ -21,18 +28,21 @@ logger = get_logger(__name__)
 
 
 async def _get_user_id_from_token(user: dict) -> int:
-    user_id = user.get("user_id")
-    if user_id:
-        return int(user_id)
-    sub = user.get("sub")
-    if sub and str(sub).isdigit():
-        return int(sub)
-    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid user in token")
+    return user_id_from_claims(user)
 
 
 async def _load_order(session: AsyncSession, order: Order) -> OrderRead:
-    result = await session.execute(select(OrderItem).where(OrderItem.order_id == order.id))
-    order_items = result.scalars().all()
+    # Условие по order_created_at оставляет в плане только партицию заказа
+    result = await session.execute(
+        select(OrderItem).where(
+            OrderItem.order_id == order.id,
+            OrderItem.order_created_at == order.created_at,
+        )
+    )
+    return _serialize_order(order, result.scalars().all())
+
+
+def _serialize_order(order: Order, order_items: Sequence[OrderItem]) -> OrderRead:
     items = [OrderItemRead(book_id=i.book_id, quantity=i.quantity, price=float(i.price)) for i in order_items]
     return OrderRead(
         id=order.id,
@@ -43,6 +53,10 @@ async def _load_order(session: AsyncSession, order: Order) -> OrderRead:
     )
 
 
+def _format_sse(event: OrderStatusEvent) -> str:
+    return f"event: status\ndata: {event.model_dump_json()}\n\n"
+
+
 @router.post(
     "",
     response_model=OrderRead,
@@ -50,16 +64,65 @@ async def _load_order(session: AsyncSession, order: Order) -> OrderRead:
     summary="Создать новый заказ из корзины",
 )
 async def create_order(
+    response: Response,
     db: AsyncSession = Depends(get_db),
     user: Annotated[dict, Depends(get_current_user)] = None,  # noqa: ARG001
+    idempotency_key: Annotated[
+        Optional[str],
+        Header(alias="Idempotency-Key", min_length=1, max_length=128),
+    ] = None,
 ) -> OrderRead:
     """
     Создать заказ из текущей корзины пользователя, сохранить его в БД
     и опубликовать событие OrderCreated в RabbitMQ.
+
+    С заголовком Idempotency-Key повторный запрос возвращает исходный ответ,
+    не обращаясь к catalog-service и корзине.
     """
 
-    settings = get_settings()
     user_id = await _get_user_id_from_token(user)
+    if idempotency_key is None:
+        return await _create_order(db, user_id)
+
+    async def load_stored() -> dict | None:
+        return await _load_idempotent_response(db, user_id, idempotency_key)
+
+    async def produce() -> tuple[dict, bool]:
+        try:
+            order = await _create_order(db, user_id, idempotency_key=idempotency_key)
+        except IntegrityError:
+            # Тот же ключ параллельно сохранила другая реплика — заказ откатился
+            await db.rollback()
+            stored = await _load_idempotent_response(db, user_id, idempotency_key)
+            if stored is None:
+                raise
+            return stored, True
+        return order.model_dump(mode="json"), False
+
+    data, replayed = await get_idempotency_coordinator().run((user_id, idempotency_key), load_stored, produce)
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+        logger.info("order_create_replayed", user_id=user_id, order_id=data.get("id"))
+    return OrderRead.model_validate(data)
+
+
+async def _load_idempotent_response(db: AsyncSession, user_id: int, key: str) -> dict | None:
+    result = await db.execute(
+        select(OrderIdempotencyKey).where(OrderIdempotencyKey.user_id == user_id, OrderIdempotencyKey.key == key)
+    )
+    record = result.scalar_one_or_none()
+    if record is None:
+        return None
+    if record.expires_at > datetime.now(timezone.utc):
+        return record.response
+    # Истёкший ключ можно использовать заново
+    await db.delete(record)
+    await db.flush()
+    return None
+
+
+async def _create_order(db: AsyncSession, user_id: int, idempotency_key: str | None = None) -> OrderRead:
+    settings = get_settings()
 
     result = await db.execute(select(Cart).where(Cart.user_id == user_id))
     cart = result.scalar_one_or_none()
@@ -74,36 +137,54 @@ async def create_order(
     # Получаем цены из catalog-service
     total_amount = 0.0
     order_items: List[OrderItem] = []
-    async with httpx.AsyncClient() as client:
-        for item in cart_items:
-            resp = await client.get(
-                f"http://catalog-service:8000/books/{item.book_id}",
-                timeout=5,
-            )
-            if resp.status_code != 200:
-                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Book not found in catalog")
-            book_data = resp.json()
-            price = float(book_data["price"])
-            total_amount += price * item.quantity
-            order_items.append(
-                OrderItem(
-                    book_id=item.book_id,
-                    quantity=item.quantity,
-                    price=price,
-                )
+    http_client = get_http_client()
+    for item in cart_items:
+        try:
+            resp = await http_client.get(CATALOG_UPSTREAM, f"/books/{item.book_id}")
+        except UpstreamUnavailable as exc:
+            logger.warning("catalog_unavailable", reason=exc.reason, book_id=item.book_id)
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Catalog service unavailable")
+        if resp.status_code >= 500:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Catalog service unavailable")
+        if resp.status_code != 200:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Book not found in catalog")
+        book_data = resp.json()
+        price = float(book_data["price"])
+        total_amount += price * item.quantity
+        order_items.append(
+            OrderItem(
+                book_id=item.book_id,
+                quantity=item.quantity,
+                price=price,
             )
+        )
 
-    order = Order(user_id=user_id, total_amount=total_amount, status="created")
+    order = Order(user_id=user_id, total_amount=total_amount, status=OrderStatus.CREATED.value)
     db.add(order)
     await db.flush()
 
     for oi in order_items:
         oi.order_id = order.id
+        oi.order_created_at = order.created_at
         db.add(oi)
 
     # Очистить корзину
     for item in cart_items:
         await db.delete(item)
+
+    order_read = _serialize_order(order, order_items)
+
+    if idempotency_key is not None:
+        # Ответ сохраняется в той же транзакции, что и заказ
+        db.add(
+            OrderIdempotencyKey(
+                user_id=user_id,
+                key=idempotency_key,
+                order_id=order.id,
+                response=order_read.model_dump(mode="json"),
+                expires_at=datetime.now(timezone.utc) + timedelta(seconds=settings.idempotency_ttl_seconds),
+            )
+        )
 
     await db.commit()
 
@@ -113,7 +194,8 @@ async def create_order(
         "order_id": order.id,
         "user_id": user_id,
         "total_amount": float(order.total_amount),
-        "items": [{"book_id": i.book_id, "quantity": i.quantity} for i in order_items],
+        "created_at": order.created_at.isoformat(),
+        "items": [{"book_id": i.book_id, "quantity": i.quantity, "price": float(i.price)} for i in order_items],
     }
     client.publish_event("order.created", payload)
 
@@ -121,7 +203,7 @@ async def create_order(
     client.publish_event("stock.reserve.request", payload)
 
     logger.info("order_created", order_id=order.id, user_id=user_id)
-    return await _load_order(db, order)
+    return order_read
 
 
 @router.get(
@@ -138,7 +220,21 @@ async def list_orders(
     user_id = await _get_user_id_from_token(user)
     result = await db.execute(select(Order).where(Order.user_id == user_id).order_by(Order.created_at.desc()))
     orders = result.scalars().all()
-    items = [await _load_order(db, o) for o in orders]
+    if not orders:
+        return OrderList(items=[])
+
+    # Позиции всех заказов одним запросом; диапазон дат ограничивает партиции
+    result = await db.execute(
+        select(OrderItem).where(
+            OrderItem.order_id.in_([o.id for o in orders]),
+            OrderItem.order_created_at >= orders[-1].created_at,
+            OrderItem.order_created_at <= orders[0].created_at,
+        )
+    )
+    items_by_order: Dict[Tuple[int, datetime], List[OrderItem]] = defaultdict(list)
+    for item in result.scalars().all():
+        items_by_order[(item.order_id, item.order_created_at)].append(item)
+    items = [_serialize_order(o, items_by_order[(o.id, o.created_at)]) for o in orders]
     return OrderList(items=items)
 
 
@@ -162,3 +258,66 @@ async def get_order(
     return await _load_order(db, order)
 
 
+@router.get(
+    "/{order_id}/events",
+    response_class=StreamingResponse,
+    summary="Поток изменений статуса заказа (SSE)",
+)
+async def stream_order_events(
+    order_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    user: Annotated[dict, Depends(get_current_user)] = None,  # noqa: ARG001
+) -> StreamingResponse:
+    """
+    Отдать текущий статус заказа и далее пушить его изменения через
+    Server-Sent Events, пока заказ не перейдёт в финальный статус.
+    """
+
+    settings = get_settings()
+    user_id = await _get_user_id_from_token(user)
+    broker = get_order_status_broker()
+    # Подписываемся до чтения статуса, чтобы не потерять обновление между ними
+    subscription = broker.subscribe(order_id)
+
+    result = await db.execute(select(Order.status).where(Order.id == order_id, Order.user_id == user_id))
+    current_status = result.scalar_one_or_none()
+    if current_status is None:
+        broker.unsubscribe(subscription)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found")
+
+    return StreamingResponse(
+        _order_event_stream(
+            request,
+            broker,
+            subscription,
+            OrderStatusEvent(order_id=order_id, status=current_status),
+            keepalive=settings.order_events_keepalive_seconds,
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _order_event_stream(
+    request: Request,
+    broker: OrderStatusBroker,
+    subscription: OrderStatusSubscription,
+    initial: OrderStatusEvent,
+    keepalive: float,
+):
+    try:
+        yield _format_sse(initial)
+        if initial.status in FINAL_ORDER_STATUSES:
+            return
+        while not await request.is_disconnected():
+            event = await subscription.get(timeout=keepalive)
+            if event is None:
+                # Комментарий SSE держит соединение живым без обращений к БД
+                yield ": keepalive\n\n"
+                continue
+            yield _format_sse(event)
+            if event.status in FINAL_ORDER_STATUSES:
+                return
+    finally:
+        broker.unsubscribe(subscription)
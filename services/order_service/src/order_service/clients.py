@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+from .config import Settings, get_settings
+from .core.http_client import ResilientHttpClient, UpstreamPolicy
+
+
+CATALOG_UPSTREAM = "catalog"
+
+_client: ResilientHttpClient | None = None
+
+
+def upstream_policy(settings: Settings, timeout: float | None = None) -> UpstreamPolicy:
+    return UpstreamPolicy(
+        timeout=timeout if timeout is not None else settings.http_client_timeout_seconds,
+        max_retries=settings.http_client_max_retries,
+        backoff_base=settings.http_client_backoff_base_seconds,
+        backoff_max=settings.http_client_backoff_max_seconds,
+        retry_budget_ratio=settings.http_client_retry_budget_ratio,
+        failure_threshold=settings.circuit_breaker_failure_threshold,
+        reset_timeout=settings.circuit_breaker_reset_seconds,
+        max_concurrency=settings.bulkhead_max_concurrency,
+        max_queue_wait=settings.bulkhead_max_wait_seconds,
+    )
+
+
+def get_http_client() -> ResilientHttpClient:
+    """Получить общий HTTP-клиент для обращений к другим сервисам."""
+
+    global _client
+    if _client is None:
+        settings = get_settings()
+        _client = ResilientHttpClient(max_connections=settings.http_client_max_connections)
+        _client.register(CATALOG_UPSTREAM, settings.catalog_service_url, upstream_policy(settings))
+    return _client
+
+
+async def close_http_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
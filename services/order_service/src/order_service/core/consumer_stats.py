@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from .logging import get_logger
+from .metrics import REGISTRY
+from .queues import WorkQueue
+
+
+logger = get_logger(__name__)
+
+MESSAGES_TOTAL = REGISTRY.counter(
+    "consumer_messages_total",
+    "Сообщения, обработанные consumer-ом, по очереди и исходу: acked, retried, parked",
+)
+REDELIVERED_TOTAL = REGISTRY.counter(
+    "consumer_redelivered_total",
+    "Повторные доставки: redelivered от брокера или возврат из очереди повторов",
+)
+HANDLER_SECONDS = REGISTRY.histogram(
+    "consumer_handler_seconds",
+    "Время обработки сообщения (у пачечного consumer-а — пачки)",
+)
+INFLIGHT = REGISTRY.gauge("consumer_inflight", "Полученные consumer-ом, но ещё не подтверждённые сообщения")
+THROUGHPUT = REGISTRY.gauge("consumer_messages_per_second", "Обработанные сообщения в секунду за последнюю минуту")
+QUEUE_DEPTH = REGISTRY.gauge("consumer_queue_depth", "Сообщения, ожидающие доставки, по данным брокера")
+QUEUE_CONSUMERS = REGISTRY.gauge("consumer_queue_consumers", "Подписчики очереди по данным брокера")
+LAST_PROGRESS = REGISTRY.gauge(
+    "consumer_last_progress_timestamp_seconds",
+    "Unix-время последнего подтверждённого или отклонённого сообщения",
+)
+
+
+class ConsumerStats:
+    """Пропускная способность и отставание одного consumer-а.
+
+    Счётчики обновляют потоки consumer-ов очереди (их может быть несколько в
+    процессе), глубину очереди — они же по таймеру (passive queue_declare), а
+    читает состояние /health/consumers.
+    """
+
+    def __init__(self, queue: str, rate_window_seconds: float = 60.0) -> None:
+        self.queue = queue
+        self.rate_window_seconds = rate_window_seconds
+        self.threads: List[threading.Thread] = []
+        self.started_at = time.monotonic()
+        self.last_progress: Optional[float] = None
+        self.depth_checked_at: Optional[float] = None
+        self.depth: Optional[int] = None
+        self.consumers: Optional[int] = None
+        self.inflight = 0
+        self._settled: Deque[Tuple[float, int]] = deque()
+        self._lock = threading.Lock()
+
+    def received(self, redelivered: bool = False) -> None:
+        with self._lock:
+            self.inflight += 1
+        INFLIGHT.inc(queue=self.queue)
+        if redelivered:
+            REDELIVERED_TOTAL.inc(queue=self.queue)
+
+    def settled(self, result: str, count: int = 1) -> None:
+        """Сообщения подтверждены или отклонены с результатом result."""
+
+        now = time.monotonic()
+        with self._lock:
+            self.inflight -= count
+            self.last_progress = now
+            self._settled.append((now, count))
+            self._trim(now)
+        INFLIGHT.dec(count, queue=self.queue)
+        MESSAGES_TOTAL.inc(count, queue=self.queue, result=result)
+        LAST_PROGRESS.set(time.time(), queue=self.queue)
+
+    def observe_handler(self, seconds: float) -> None:
+        HANDLER_SECONDS.observe(seconds, queue=self.queue)
+
+    def set_depth(self, depths: Dict[str, Tuple[int, int]]) -> None:
+        with self._lock:
+            self.depth, self.consumers = depths[self.queue]
+            self.depth_checked_at = time.monotonic()
+        for name, (messages, consumers) in depths.items():
+            QUEUE_DEPTH.set(messages, queue=name)
+            QUEUE_CONSUMERS.set(consumers, queue=name)
+        THROUGHPUT.set(self.rate(), queue=self.queue)
+
+    def _trim(self, now: float) -> None:
+        while self._settled and self._settled[0][0] < now - self.rate_window_seconds:
+            self._settled.popleft()
+
+    def rate(self) -> float:
+        """Сообщений в секунду за последние rate_window_seconds."""
+
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            total = sum(count for _, count in self._settled)
+        return total / self.rate_window_seconds
+
+    def stalled_reason(self, stall_seconds: float) -> Optional[str]:
+        """Почему consumer считается остановившимся; None — работает."""
+
+        now = time.monotonic()
+        if any(not thread.is_alive() for thread in self.threads):
+            return "thread_stopped"
+        with self._lock:
+            checked_at = self.depth_checked_at
+            backlog = (self.depth or 0) + self.inflight
+            last_progress = self.last_progress if self.last_progress is not None else self.started_at
+        # Глубину опрашивает тот же поток: давний опрос — поток завис или нет связи с брокером
+        if now - (checked_at if checked_at is not None else self.started_at) > stall_seconds:
+            return "broker_unreachable"
+        if backlog > 0 and now - last_progress > stall_seconds:
+            return "no_progress"
+        return None
+
+    def snapshot(self, stall_seconds: float) -> Dict[str, Any]:
+        with self._lock:
+            state = {
+                "queue": self.queue,
+                "depth": self.depth,
+                "consumers": self.consumers,
+                "inflight": self.inflight,
+                "seconds_since_progress": (
+                    round(time.monotonic() - self.last_progress, 1) if self.last_progress is not None else None
+                ),
+            }
+        state["messages_per_second"] = round(self.rate(), 3)
+        state["stalled"] = self.stalled_reason(stall_seconds)
+        return state
+
+
+_stats: Dict[str, ConsumerStats] = {}
+_stats_lock = threading.Lock()
+
+
+def get_consumer_stats(queue: str) -> ConsumerStats:
+    """Статистика consumer-а очереди (одна на процесс)."""
+
+    with _stats_lock:
+        stats = _stats.get(queue)
+        if stats is None:
+            stats = _stats[queue] = ConsumerStats(queue)
+        return stats
+
+
+def consumers_report(stall_seconds: float) -> Tuple[bool, List[Dict[str, Any]]]:
+    """Состояние всех consumer-ов процесса; False — хотя бы один остановился."""
+
+    with _stats_lock:
+        stats = list(_stats.values())
+    report = [consumer.snapshot(stall_seconds) for consumer in stats]
+    return all(state["stalled"] is None for state in report), report
+
+
+def poll_queue_depth(
+    connection: Any,
+    channel: Any,
+    queue: WorkQueue,
+    stats: ConsumerStats,
+    interval_seconds: float,
+) -> None:
+    """Опрашивать глубину очередей по таймеру соединения — в потоке consumer-а, как того требует pika."""
+
+    def poll() -> None:
+        try:
+            stats.set_depth(queue.depth(channel))
+        except Exception:
+            logger.warning("queue_depth_poll_failed", queue=queue.name)
+        connection.call_later(interval_seconds, poll)
+
+    poll()
+
@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+import logging
+import sys
+
+import structlog
+
+
+def setup_logging() -> None:
+    """Configure structlog and standard logging for the service."""
+
+    timestamper = structlog.processors.TimeStamper(fmt="iso")
+
+    logging.basicConfig(
+        format="%(message)s",
+        stream=sys.stdout,
+        level=logging.INFO,
+    )
+
+    structlog.configure(
+        processors=[
+            structlog.contextvars.merge_contextvars,
+            timestamper,
+            structlog.processors.add_log_level,
+            structlog.processors.EventRenamer("message"),
+            structlog.processors.dict_tracebacks,
+            structlog.processors.JSONRenderer(),
+        ],
+        logger_factory=structlog.stdlib.LoggerFactory(),
+        wrapper_class=structlog.stdlib.BoundLogger,
+        cache_logger_on_first_use=True,
+    )
+
+
+def get_logger(name: str | None = None) -> structlog.stdlib.BoundLogger:
+    """Return structlog-based logger."""
+
+    return structlog.get_logger(name)
+
+
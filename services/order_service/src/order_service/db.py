@@ -0,0 +1,30 @@
+from collections.abc import AsyncGenerator
+from typing import Annotated
+
+from fastapi import Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import DeclarativeBase
+
+from .config import get_settings
+from .dependencies import get_current_user_id
+from .sharding import ShardRouter, shard_specs
+
+
+class Base(DeclarativeBase):
+    """Base class for SQLAlchemy models."""
+
+
+shard_router = ShardRouter(shard_specs(get_settings()), buckets=get_settings().order_shard_buckets)
+
+
+def session_for_user(user_id: int) -> AsyncSession:
+    """Open a session on the shard that owns the user's data."""
+
+    return shard_router.session_for(user_id)
+
+
+async def get_db(user_id: Annotated[int, Depends(get_current_user_id)]) -> AsyncGenerator[AsyncSession, None]:
+    """FastAPI dependency that yields an async DB session on the current user's shard."""
+
+    async with session_for_user(user_id) as session:
+        yield session
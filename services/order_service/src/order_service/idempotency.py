@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from .config import get_settings
+
+
+class TTLCache:
+    """Небольшой LRU-кэш с ограничением по размеру и времени жизни записей."""
+
+    def __init__(self, max_size: int, ttl_seconds: float) -> None:
+        self._max_size = max_size
+        self._ttl = ttl_seconds
+        self._data: OrderedDict[Hashable, Tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Hashable) -> Any | None:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._data[key] = (time.monotonic() + self._ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self._max_size:
+            self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+IdempotencyKey = Tuple[int, str]
+
+
+class IdempotencyCoordinator:
+    """Выполняет операцию не более одного раза на ключ идемпотентности.
+
+    Перед хранилищем в БД стоит in-process кэш готовых ответов, а параллельные
+    запросы с тем же ключом ждут уже выполняющуюся попытку вместо гонки с ней.
+    """
+
+    def __init__(self, cache: TTLCache) -> None:
+        self._cache = cache
+        self._inflight: Dict[IdempotencyKey, asyncio.Future[dict]] = {}
+
+    async def run(
+        self,
+        key: IdempotencyKey,
+        load_stored: Callable[[], Awaitable[dict | None]],
+        produce: Callable[[], Awaitable[Tuple[dict, bool]]],
+    ) -> Tuple[dict, bool]:
+        """Вернуть (ответ, replayed), выполнив produce только для нового ключа.
+
+        produce возвращает ответ и признак того, что он был взят из чужой
+        (конкурентной) попытки, например на другой реплике.
+        """
+
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached, True
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight), True
+
+        future: asyncio.Future[dict] = asyncio.get_running_loop().create_future()
+        # Исключение забирается здесь, чтобы не было предупреждения, если ожидающих нет
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        try:
+            stored = await load_stored()
+            if stored is not None:
+                response, replayed = stored, True
+            else:
+                response, replayed = await produce()
+            self._cache.set(key, response)
+            future.set_result(response)
+            return response, replayed
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+
+_coordinator: IdempotencyCoordinator | None = None
+
+
+def get_idempotency_coordinator() -> IdempotencyCoordinator:
+    """Получить singleton-координатор идемпотентных запросов."""
+
+    global _coordinator
+    if _coordinator is None:
+        settings = get_settings()
+        _coordinator = IdempotencyCoordinator(
+            TTLCache(max_size=settings.idempotency_cache_size, ttl_seconds=settings.idempotency_ttl_seconds)
+        )
+    return _coordinator
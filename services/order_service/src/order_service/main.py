@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import asyncio
+
+from fastapi import FastAPI, status
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from .api.routes_cart import router as cart_router
+from .api.routes_orders import router as orders_router
+from .clients import close_http_client
+from .core.consumer_stats import consumers_report
+from .core.errors import register_exception_handlers
+from .core.http_client import DeadlineMiddleware
+from .core.logging import get_logger, setup_logging
+from .core.metrics import PROMETHEUS_CONTENT_TYPE, REGISTRY
+from .core.middleware import CorrelationIdMiddleware
+from .config import get_settings
+from .db import shard_router
+from .message_bus import ensure_status_consumer_started, ensure_status_fanout_started
+from .partitions import ensure_future_partitions
+
+
+setup_logging()
+logger = get_logger(__name__)
+
+app = FastAPI(
+    title="Order Service",
+    description="Сервис корзины и заказов для онлайн-магазина книг.",
+    version="1.0.0",
+)
+
+app.add_middleware(DeadlineMiddleware)
+app.add_middleware(CorrelationIdMiddleware)
+
+register_exception_handlers(app)
+
+app.include_router(cart_router)
+app.include_router(orders_router)
+
+
+@app.get("/health", summary="Healthcheck сервиса", tags=["health"])
+async def healthcheck() -> dict[str, str]:
+    """Простой healthcheck-эндпоинт без авторизации."""
+
+    return {"status": "ok"}
+
+
+@app.get("/metrics", summary="Метрики в формате Prometheus", tags=["health"], response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    """Текущие значения метрик сервиса в текстовом формате Prometheus."""
+
+    return PlainTextResponse(REGISTRY.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@app.get("/health/consumers", summary="Состояние consumer-ов RabbitMQ", tags=["health"])
+async def consumers_health() -> JSONResponse:
+    """Глубина очередей и пропускная способность consumer-ов; 503, если какой-то из них остановился."""
+
+    healthy, consumers = consumers_report(get_settings().consumer_stall_seconds)
+    return JSONResponse(
+        {"status": "ok" if healthy else "stalled", "consumers": consumers},
+        status_code=status.HTTP_200_OK if healthy else status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
+
+
+@app.on_event("startup")
+async def on_startup() -> None:
+    """Логирование старта приложения, создание партиций и запуск consumer-а stock.reserve.*."""
+
+    logger.info("order_service_started")
+    for engine in shard_router.engines:
+        async with engine.begin() as conn:
+            await ensure_future_partitions(conn)
+    loop = asyncio.get_running_loop()
+    # SSE-подписчики подключены к HTTP-процессам — рассылка статусов нужна всегда,
+    # а очередь результатов резервирования при CONSUMERS_ENABLED=false разбирает order_service.worker
+    ensure_status_fanout_started(loop)
+    if get_settings().consumers_enabled:
+        ensure_status_consumer_started(loop)
+
+
+@app.on_event("shutdown")
+async def on_shutdown() -> None:
+    """Логирование остановки приложения и закрытие HTTP-клиента."""
+
+    await close_http_client()
+    logger.info("order_service_stopped")
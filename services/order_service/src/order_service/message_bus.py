@@ -0,0 +1,327 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict
+
+import pika
+from sqlalchemy import update
+
+from .config import get_settings
+from .core.consumer_stats import get_consumer_stats, poll_queue_depth
+from .core.logging import get_logger
+from .core.queues import WorkQueue
+from .core.transport import connect
+from .db import session_for_user
+from .models import Order, OrderStatus
+from .pubsub import get_order_status_broker
+from .schemas import OrderStatusEvent
+
+
+logger = get_logger(__name__)
+
+
+class RabbitMQClient:
+    """Простой клиент RabbitMQ для публикации событий."""
+
+    def __init__(self) -> None:
+        settings = get_settings()
+        self.exchange = settings.rabbitmq_exchange
+        self._connection = connect(settings.message_transport, settings.rabbitmq_url)
+        self._channel = self._connection.channel()
+        self._channel.exchange_declare(exchange=self.exchange, exchange_type="topic", durable=True)
+
+    def publish_event(self, routing_key: str, payload: Dict[str, Any]) -> None:
+        """Опубликовать событие в exchange bookstore.events."""
+
+        envelope = {
+            "idempotency_key": payload.get("idempotency_key") or str(uuid.uuid4()),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "payload": payload,
+        }
+        body = json.dumps(envelope).encode("utf-8")
+        self._channel.basic_publish(
+            exchange=self.exchange,
+            routing_key=routing_key,
+            body=body,
+            properties=pika.BasicProperties(content_type="application/json", delivery_mode=2),
+        )
+        logger.info("event_published", routing_key=routing_key)
+
+    def close(self) -> None:
+        try:
+            self._connection.close()
+        except Exception:
+            logger.warning("rabbitmq_close_failed")
+
+
+_client: RabbitMQClient | None = None
+_client_lock = threading.Lock()
+
+
+def get_rabbitmq_client() -> RabbitMQClient:
+    """Получить singleton-клиент для RabbitMQ."""
+
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = RabbitMQClient()
+    return _client
+
+
+ORDER_STATUS_CHANGED_ROUTING_KEY = "order.status.changed"
+
+RESERVE_STATUS_BY_ROUTING_KEY = {
+    "stock.reserve.succeeded": OrderStatus.RESERVED.value,
+    "stock.reserve.failed": OrderStatus.RESERVATION_FAILED.value,
+}
+
+
+def _order_field(payload: Dict[str, Any], name: str) -> Any:
+    value = payload.get(name)
+    if value is None and isinstance(payload.get("original"), dict):
+        value = payload["original"].get(name)
+    return value
+
+
+def extract_order_id(payload: Dict[str, Any]) -> int | None:
+    """Достать order_id из payload stock.reserve.* (напрямую или из original)."""
+
+    order_id = _order_field(payload, "order_id")
+    try:
+        return int(order_id) if order_id is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def extract_user_id(payload: Dict[str, Any]) -> int | None:
+    """Достать user_id владельца заказа (по нему выбирается шард БД)."""
+
+    user_id = _order_field(payload, "user_id")
+    try:
+        return int(user_id) if user_id is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def extract_order_created_at(payload: Dict[str, Any]) -> datetime | None:
+    """Достать дату создания заказа, если издатель её передал."""
+
+    created_at = _order_field(payload, "created_at")
+    if not isinstance(created_at, str):
+        return None
+    try:
+        return datetime.fromisoformat(created_at.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+async def apply_order_status(
+    order_id: int,
+    user_id: int,
+    new_status: str,
+    created_at: datetime | None = None,
+) -> bool:
+    """Обновить статус заказа и сообщить об изменении всем репликам.
+
+    Обновляется только заказ в статусе created, поэтому повторная доставка
+    события не меняет уже финальный статус. Дата заказа, если известна,
+    ограничивает UPDATE одной партицией. SSE-подписчики заказа могут быть
+    подключены к любой реплике, поэтому изменение рассылается через
+    order.status.changed.
+    """
+
+    conditions = [Order.id == order_id, Order.user_id == user_id, Order.status == OrderStatus.CREATED.value]
+    if created_at is not None:
+        conditions.append(Order.created_at == created_at)
+
+    async with session_for_user(user_id) as session:
+        result = await session.execute(
+            update(Order).where(*conditions).values(status=new_status).returning(Order.id)
+        )
+        updated = result.scalar_one_or_none() is not None
+        await session.commit()
+
+    if updated:
+        logger.info("order_status_updated", order_id=order_id, status=new_status)
+        publish_order_status_changed(order_id, user_id, new_status)
+    return updated
+
+
+def publish_order_status_changed(order_id: int, user_id: int, status: str) -> None:
+    """Разослать изменение статуса репликам для SSE-подписчиков.
+
+    Ошибка публикации не откатывает обновление: клиент увидит новый статус
+    при следующем запросе заказа.
+    """
+
+    try:
+        get_rabbitmq_client().publish_event(
+            ORDER_STATUS_CHANGED_ROUTING_KEY,
+            {
+                "idempotency_key": f"order-status:{order_id}:{status}",
+                "order_id": order_id,
+                "user_id": user_id,
+                "status": status,
+            },
+        )
+    except Exception:
+        logger.warning("order_status_changed_publish_failed", order_id=order_id)
+
+
+def deliver_order_status(order_id: int, status: str) -> None:
+    """Передать изменение статуса SSE-подписчикам этой реплики (в event loop приложения)."""
+
+    delivered = get_order_status_broker().publish(OrderStatusEvent(order_id=order_id, status=status))
+    logger.info("order_status_delivered", order_id=order_id, status=status, subscribers=delivered)
+
+
+class OrderStatusConsumer(threading.Thread):
+    """Consumer stock.reserve.succeeded/failed, обновляющий статус заказов.
+
+    Реплики разбирают одну общую durable-очередь: каждое событие применяется
+    одной репликой, неудачные обновления повторяются с задержкой.
+    """
+
+    daemon = True
+
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        super().__init__()
+        settings = get_settings()
+        self._transport = settings.message_transport
+        self._url = settings.rabbitmq_url
+        self.exchange = settings.rabbitmq_exchange
+        self._loop = loop
+        self._prefetch = max(settings.rabbitmq_prefetch_count, 1)
+        self.queue = WorkQueue(
+            name=settings.order_status_queue,
+            routing_keys=tuple(RESERVE_STATUS_BY_ROUTING_KEY),
+            max_retries=settings.rabbitmq_max_retries,
+            retry_delay_ms=settings.rabbitmq_retry_delay_ms,
+        )
+        self._depth_poll_seconds = settings.consumer_depth_poll_seconds
+        self.stats = get_consumer_stats(self.queue.name)
+        self.stats.threads.append(self)
+
+    def run(self) -> None:
+        connection = connect(self._transport, self._url)
+        channel = connection.channel()
+        channel.exchange_declare(exchange=self.exchange, exchange_type="topic", durable=True)
+        channel.basic_qos(prefetch_count=self._prefetch)
+        self.queue.declare(channel, self.exchange)
+        poll_queue_depth(connection, channel, self.queue, self.stats, self._depth_poll_seconds)
+
+        def callback(ch, method, properties, body) -> None:  # type: ignore[no-untyped-def]
+            self.stats.received(redelivered=method.redelivered or self.queue.attempts(properties) > 0)
+            try:
+                envelope = json.loads(body.decode("utf-8"))
+                payload: Dict[str, Any] = envelope.get("payload", {})
+            except Exception:
+                logger.warning("invalid_stock_reserve_result_payload")
+                self.queue.park(ch, method.routing_key, properties, body, "invalid_payload")
+                ch.basic_ack(delivery_tag=method.delivery_tag)
+                self.stats.settled("parked")
+                return
+
+            order_id = extract_order_id(payload)
+            user_id = extract_user_id(payload)
+            if order_id is None or user_id is None:
+                logger.warning("stock_reserve_result_without_order", routing_key=method.routing_key)
+                self.queue.park(ch, method.routing_key, properties, body, "missing_order")
+                ch.basic_ack(delivery_tag=method.delivery_tag)
+                self.stats.settled("parked")
+                return
+
+            new_status = RESERVE_STATUS_BY_ROUTING_KEY[method.routing_key]
+            created_at = extract_order_created_at(payload)
+            started = time.perf_counter()
+            future = asyncio.run_coroutine_threadsafe(
+                apply_order_status(order_id, user_id, new_status, created_at),
+                self._loop,
+            )
+            try:
+                future.result(timeout=10)
+            except Exception:
+                logger.exception("order_status_update_failed", order_id=order_id)
+                parked = self.queue.retry_or_park(ch, method, properties, body, "update_failed")
+                self.stats.settled("parked" if parked else "retried")
+                return
+            finally:
+                self.stats.observe_handler(time.perf_counter() - started)
+
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+            self.stats.settled("acked")
+
+        channel.basic_consume(queue=self.queue.name, on_message_callback=callback, auto_ack=False)
+        logger.info("order_status_consumer_started", queue=self.queue.name, prefetch=self._prefetch)
+        channel.start_consuming()
+
+
+class OrderStatusFanoutConsumer(threading.Thread):
+    """Consumer order.status.changed: у каждой реплики своя exclusive-очередь (broadcast)."""
+
+    daemon = True
+
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        super().__init__()
+        settings = get_settings()
+        self._transport = settings.message_transport
+        self._url = settings.rabbitmq_url
+        self.exchange = settings.rabbitmq_exchange
+        self._loop = loop
+
+    def run(self) -> None:
+        connection = connect(self._transport, self._url)
+        channel = connection.channel()
+        channel.exchange_declare(exchange=self.exchange, exchange_type="topic", durable=True)
+
+        result = channel.queue_declare(queue="", exclusive=True)
+        queue_name = result.method.queue
+
+        channel.queue_bind(exchange=self.exchange, queue=queue_name, routing_key=ORDER_STATUS_CHANGED_ROUTING_KEY)
+
+        def callback(ch, method, properties, body) -> None:  # type: ignore[no-untyped-def]
+            try:
+                payload = json.loads(body.decode("utf-8"))["payload"]
+                order_id, status = int(payload["order_id"]), str(payload["status"])
+            except Exception:
+                logger.warning("invalid_order_status_changed_payload")
+                return
+            self._loop.call_soon_threadsafe(deliver_order_status, order_id, status)
+
+        # Подписчики получают только последний статус — подтверждение не нужно
+        channel.basic_consume(queue=queue_name, on_message_callback=callback, auto_ack=True)
+        logger.info("order_status_fanout_consumer_started")
+        channel.start_consuming()
+
+
+_consumer_started = False
+_fanout_started = False
+_consumer_lock = threading.Lock()
+
+
+def ensure_status_consumer_started(loop: asyncio.AbstractEventLoop) -> None:
+    """Гарантировать запуск consumer-а результатов резервирования."""
+
+    global _consumer_started
+    if not _consumer_started:
+        with _consumer_lock:
+            if not _consumer_started:
+                OrderStatusConsumer(loop).start()
+                _consumer_started = True
+
+
+def ensure_status_fanout_started(loop: asyncio.AbstractEventLoop) -> None:
+    """Гарантировать запуск рассылки статусов SSE-подписчикам (нужна каждому HTTP-процессу)."""
+
+    global _fanout_started
+    if not _fanout_started:
+        with _consumer_lock:
+            if not _fanout_started:
+                OrderStatusFanoutConsumer(loop).start()
+                _fanout_started = True
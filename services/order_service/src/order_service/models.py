@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+from datetime import datetime
+from enum import Enum
+
+from sqlalchemy import (
+    JSON,
+    DateTime,
+    ForeignKey,
+    ForeignKeyConstraint,
+    Index,
+    Integer,
+    Numeric,
+    String,
+    UniqueConstraint,
+)
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .db import Base
+
+
+class OrderStatus(str, Enum):
+    """Статусы заказа."""
+
+    CREATED = "created"
+    RESERVED = "reserved"
+    RESERVATION_FAILED = "reservation_failed"
+
+
+# После этих статусов заказ больше не меняется
+FINAL_ORDER_STATUSES = frozenset({OrderStatus.RESERVED.value, OrderStatus.RESERVATION_FAILED.value})
+
+
+class Cart(Base):
+    """Корзина пользователя."""
+
+    __tablename__ = "carts"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(Integer, index=True, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
+
+
+class CartItem(Base):
+    """Позиция в корзине."""
+
+    __tablename__ = "cart_items"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    cart_id: Mapped[int] = mapped_column(ForeignKey("carts.id"), nullable=False)
+    book_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    quantity: Mapped[int] = mapped_column(Integer, default=1, nullable=False)
+
+
+class Order(Base):
+    """Заказ пользователя (таблица помесячно партиционирована по created_at)."""
+
+    __tablename__ = "orders"
+    __table_args__ = (
+        Index("ix_orders_user_id_created_at", "user_id", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    user_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    status: Mapped[str] = mapped_column(String(32), default=OrderStatus.CREATED.value, nullable=False)
+    total_amount: Mapped[float] = mapped_column(Numeric(10, 2), default=0, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True, default=datetime.utcnow)
+
+
+class OrderItem(Base):
+    """Позиция заказа с зафиксированной ценой.
+
+    order_created_at дублирует дату заказа, чтобы позиции лежали в той же
+    помесячной партиции и запросы по заказу использовали partition pruning.
+    """
+
+    __tablename__ = "order_items"
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["order_id", "order_created_at"],
+            ["orders.id", "orders.created_at"],
+            name="fk_order_items_order",
+        ),
+        Index("ix_order_items_order_id", "order_id", "order_created_at"),
+        {"postgresql_partition_by": "RANGE (order_created_at)"},
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    order_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    order_created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    book_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    quantity: Mapped[int] = mapped_column(Integer, default=1, nullable=False)
+    price: Mapped[float] = mapped_column(Numeric(10, 2), default=0, nullable=False)
+
+
+class OrderIdempotencyKey(Base):
+    """Сохранённый ответ POST /orders для заголовка Idempotency-Key."""
+
+    __tablename__ = "order_idempotency_keys"
+    __table_args__ = (UniqueConstraint("user_id", "key", name="uq_order_idempotency_keys_user_key"),)
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    key: Mapped[str] = mapped_column(String(128), nullable=False)
+    order_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    response: Mapped[dict] = mapped_column(JSON, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), index=True, nullable=False)
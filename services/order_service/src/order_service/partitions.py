@@ -0,0 +1,194 @@
+"""Управление помесячными партициями orders/order_items.
+
+Запуск как задача по расписанию:
+
+    python -m order_service.partitions ensure
+    python -m order_service.partitions archive --older-than-months 12
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import re
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import List, Sequence, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from .config import get_settings
+from .core.logging import get_logger, setup_logging
+from .sharding import create_sync_engine, shard_specs
+
+
+logger = get_logger(__name__)
+
+# Таблица и колонка-ключ партиционирования. Порядок важен для архивации:
+# сначала отсоединяются позиции, которые ссылаются на заказы.
+PARTITIONED_TABLES: Tuple[Tuple[str, str], ...] = (
+    ("order_items", "order_created_at"),
+    ("orders", "created_at"),
+)
+
+_ADVISORY_LOCK_SQL = text("SELECT pg_advisory_xact_lock(hashtext('order_service.partitions'))")
+
+_PARTITIONS_SQL = text(
+    """
+    SELECT child.relname
+    FROM pg_inherits
+    JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+    JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+    WHERE parent.relname = :table
+    """
+)
+
+
+def month_start(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(value: date, months: int) -> date:
+    index = value.year * 12 + value.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y_%m}"
+
+
+def parse_partition_month(table: str, name: str) -> date | None:
+    match = re.fullmatch(rf"{re.escape(table)}_p(\d{{4}})_(\d{{2}})", name)
+    if not match:
+        return None
+    return date(int(match.group(1)), int(match.group(2)), 1)
+
+
+def create_partition_sql(table: str, month: date) -> str:
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(table, month)} PARTITION OF {table} "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    )
+
+
+def future_partitions_ddl(today: date, months_ahead: int) -> List[str]:
+    """DDL партиций на текущий и months_ahead следующих месяцев."""
+
+    current = month_start(today)
+    statements = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        # Партиция orders создаётся раньше партиции order_items
+        for table, _ in reversed(PARTITIONED_TABLES):
+            statements.append(create_partition_sql(table, month))
+    return statements
+
+
+async def ensure_future_partitions(conn: AsyncConnection, months_ahead: int | None = None) -> None:
+    """Досоздать недостающие партиции (вызывается при старте сервиса)."""
+
+    if months_ahead is None:
+        months_ahead = get_settings().order_partitions_months_ahead
+    await conn.execute(_ADVISORY_LOCK_SQL)
+    for statement in future_partitions_ddl(datetime.now(timezone.utc).date(), months_ahead):
+        await conn.execute(text(statement))
+    logger.info("order_partitions_ensured", months_ahead=months_ahead)
+
+
+def _list_partitions(conn: Connection, table: str) -> List[Tuple[date, str]]:
+    rows = conn.execute(_PARTITIONS_SQL, {"table": table}).scalars().all()
+    partitions = []
+    for name in rows:
+        month = parse_partition_month(table, name)
+        if month is not None:
+            partitions.append((month, name))
+    return sorted(partitions)
+
+
+def _export_partition(conn: Connection, name: str, path: Path) -> None:
+    """Выгрузить партицию в csv.gz через COPY в транзакции conn."""
+
+    with gzip.open(path, "wb") as fh:
+        cursor = conn.connection.cursor()
+        try:
+            cursor.copy_expert(f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)", fh)
+        finally:
+            cursor.close()
+
+
+def archive_old_partitions(
+    engine: Engine,
+    older_than_months: int,
+    archive_dir: Path,
+    today: date | None = None,
+) -> List[Path]:
+    """Выгрузить партиции старше older_than_months в csv.gz, затем отсоединить и удалить их.
+
+    Выгрузка, DETACH и DROP партиции идут одной транзакцией: если выгрузка не
+    удалась (нет места, ошибка ввода-вывода), партиция остаётся присоединённой
+    и следующий запуск архивирует её снова.
+    """
+
+    cutoff = add_months(month_start(today or datetime.now(timezone.utc).date()), -older_than_months)
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    exported: List[Path] = []
+
+    with engine.connect() as conn:
+        by_table = {table: _list_partitions(conn, table) for table, _ in PARTITIONED_TABLES}
+
+    months = sorted({month for partitions in by_table.values() for month, _ in partitions if month < cutoff})
+    for month in months:
+        for table, _ in PARTITIONED_TABLES:
+            name = partition_name(table, month)
+            if (month, name) not in by_table[table]:
+                continue
+            path = archive_dir / f"{name}.csv.gz"
+            part = path.with_name(f"{path.name}.part")
+            with engine.begin() as conn:
+                conn.execute(_ADVISORY_LOCK_SQL)
+                # Строки, изменённые после выгрузки, не должны пропасть вместе с партицией
+                conn.execute(text(f"LOCK TABLE {name} IN SHARE MODE"))
+                _export_partition(conn, name, part)
+                conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+                conn.execute(text(f"DROP TABLE {name}"))
+            part.replace(path)
+            exported.append(path)
+            logger.info("order_partition_archived", partition=name, path=str(path))
+    return exported
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Партиции orders/order_items")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    ensure = sub.add_parser("ensure", help="создать партиции на будущие месяцы")
+    ensure.add_argument("--months-ahead", type=int, default=settings.order_partitions_months_ahead)
+
+    archive = sub.add_parser("archive", help="выгрузить и удалить старые партиции")
+    archive.add_argument("--older-than-months", type=int, default=settings.order_archive_after_months)
+    archive.add_argument("--archive-dir", type=Path, default=Path(settings.order_archive_dir))
+
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    for spec in shard_specs(settings):
+        engine = create_sync_engine(spec)
+        if args.command == "ensure":
+            with engine.begin() as conn:
+                conn.execute(_ADVISORY_LOCK_SQL)
+                for statement in future_partitions_ddl(datetime.now(timezone.utc).date(), args.months_ahead):
+                    conn.execute(text(statement))
+            logger.info("order_partitions_ensured", shard=spec.index, months_ahead=args.months_ahead)
+        else:
+            # Файлы разных шардов не должны перезаписывать друг друга
+            archive_dir = args.archive_dir
+            if len(settings.order_shard_urls) > 1:
+                archive_dir = archive_dir / f"shard_{spec.index}"
+            archive_old_partitions(engine, args.older_than_months, archive_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import asyncio
+import weakref
+from typing import Dict
+
+from .config import get_settings
+from .core.logging import get_logger
+from .schemas import OrderStatusEvent
+
+
+logger = get_logger(__name__)
+
+
+class OrderStatusSubscription:
+    """Подписка одного SSE-клиента на изменения статуса заказа.
+
+    Буфер ограничен: при переполнении выбрасывается самое старое событие,
+    так как клиенту важен только последний статус заказа.
+    """
+
+    def __init__(self, order_id: int, maxsize: int) -> None:
+        self.order_id = order_id
+        self.dropped = 0
+        self._queue: asyncio.Queue[OrderStatusEvent] = asyncio.Queue(maxsize=maxsize)
+
+    def put(self, event: OrderStatusEvent) -> None:
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(event)
+
+    async def get(self, timeout: float) -> OrderStatusEvent | None:
+        """Дождаться события; вернуть None, если за timeout ничего не пришло."""
+
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class OrderStatusBroker:
+    """In-process pub/sub статусов заказов для SSE-подписчиков.
+
+    Все методы вызываются из event loop приложения. Подписки хранятся
+    в WeakSet, поэтому брошенный до старта поток не удерживает буфер.
+    """
+
+    def __init__(self, queue_size: int) -> None:
+        self._queue_size = queue_size
+        self._subscribers: Dict[int, weakref.WeakSet[OrderStatusSubscription]] = {}
+
+    def subscribe(self, order_id: int) -> OrderStatusSubscription:
+        subscription = OrderStatusSubscription(order_id, maxsize=self._queue_size)
+        self._subscribers.setdefault(order_id, weakref.WeakSet()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: OrderStatusSubscription) -> None:
+        subscribers = self._subscribers.get(subscription.order_id)
+        if subscribers is None:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            self._subscribers.pop(subscription.order_id, None)
+
+    def publish(self, event: OrderStatusEvent) -> int:
+        """Разослать событие всем подписчикам заказа, вернуть их количество."""
+
+        subscribers = self._subscribers.get(event.order_id)
+        if not subscribers:
+            self._subscribers.pop(event.order_id, None)
+            return 0
+        delivered = 0
+        for subscription in list(subscribers):
+            subscription.put(event)
+            delivered += 1
+        return delivered
+
+    def subscriber_count(self, order_id: int | None = None) -> int:
+        if order_id is not None:
+            return len(self._subscribers.get(order_id, ()))
+        return sum(len(s) for s in self._subscribers.values())
+
+
+_broker: OrderStatusBroker | None = None
+
+
+def get_order_status_broker() -> OrderStatusBroker:
+    """Получить singleton-брокер статусов заказов."""
+
+    global _broker
+    if _broker is None:
+        _broker = OrderStatusBroker(queue_size=get_settings().order_events_queue_size)
+    return _broker
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any, Dict, List
+
+from pydantic import BaseModel, Field
+
+
+class ErrorResponse(BaseModel):
+    """Единый формат ошибок для order-service."""
+
+    error_code: str
+    message: str
+    details: Dict[str, Any] | None = None
+
+
+class CartItemCreate(BaseModel):
+    """Payload для добавления книги в корзину."""
+
+    book_id: int = Field(..., ge=1, description="Идентификатор книги")
+    qty: int = Field(1, ge=1, description="Количество экземпляров")
+
+
+class CartItemRead(BaseModel):
+    """Позиция корзины."""
+
+    book_id: int
+    quantity: int
+
+
+class CartRead(BaseModel):
+    """Содержимое корзины."""
+
+    items: List[CartItemRead]
+
+
+class OrderItemRead(BaseModel):
+    """Позиция заказа."""
+
+    book_id: int
+    quantity: int
+    price: float
+
+
+class OrderRead(BaseModel):
+    """DTO заказа для ответов API."""
+
+    id: int
+    status: str
+    total_amount: float
+    created_at: datetime
+    items: List[OrderItemRead]
+
+
+class OrderList(BaseModel):
+    """Список заказов пользователя."""
+
+    items: List[OrderRead]
+
+
+class OrderStatusEvent(BaseModel):
+    """Изменение статуса заказа, отправляемое клиенту через SSE."""
+
+    order_id: int
+    status: str
@@ -0,0 +1,218 @@
+"""Шардирование данных order-service по user_id.
+
+Пользователь попадает в один из bucket-ов (crc32(user_id) % order_shard_buckets),
+bucket — в шард (bucket % количество шардов). Все таблицы сервиса ключуются
+user_id, поэтому корзина и заказы пользователя всегда лежат в одном шарде.
+
+Обслуживание:
+
+    python -m order_service.sharding init-sequences
+    python -m order_service.sharding reshard --from-shards 2
+"""
+
+from __future__ import annotations
+
+import argparse
+import zlib
+from dataclasses import dataclass
+from typing import Dict, List, Sequence
+
+from sqlalchemy import Table, create_engine, delete, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+
+from .config import Settings, get_settings
+from .core.logging import get_logger, setup_logging
+
+
+logger = get_logger(__name__)
+
+# Таблицы с собственными последовательностями id. Каждый шард выдаёт id
+# с шагом order_shard_id_stride и своим смещением, поэтому id уникальны
+# во всём кластере и при переносе пользователя между шардами не меняются.
+SEQUENCED_TABLES = ("carts", "cart_items", "orders", "order_items", "order_idempotency_keys")
+
+
+@dataclass(frozen=True)
+class ShardSpec:
+    """Адрес шарда: URL базы и, опционально, схема внутри неё."""
+
+    index: int
+    url: str
+    schema: str | None = None
+
+
+def shard_specs(settings: Settings) -> List[ShardSpec]:
+    urls = settings.order_shard_urls or [settings.database_url]
+    schemas = settings.order_shard_schemas
+    if schemas and len(schemas) != len(urls):
+        raise ValueError("ORDER_SHARD_SCHEMAS must have the same length as ORDER_SHARD_URLS")
+    return [ShardSpec(index=i, url=url, schema=schemas[i] if schemas else None) for i, url in enumerate(urls)]
+
+
+def bucket_for(user_id: int, buckets: int) -> int:
+    return zlib.crc32(str(user_id).encode("ascii")) % buckets
+
+
+def shard_index_for(user_id: int, shard_count: int, buckets: int) -> int:
+    return bucket_for(user_id, buckets) % shard_count
+
+
+class ShardRouter:
+    """Выдаёт AsyncSession шарда, которому принадлежит пользователь."""
+
+    def __init__(self, specs: Sequence[ShardSpec], buckets: int) -> None:
+        if not specs:
+            raise ValueError("At least one shard is required")
+        self.specs = list(specs)
+        self.buckets = buckets
+        self.engines: List[AsyncEngine] = [_create_async_engine(spec) for spec in self.specs]
+        self._sessionmakers = [
+            async_sessionmaker(bind=engine, expire_on_commit=False, class_=AsyncSession) for engine in self.engines
+        ]
+
+    @property
+    def shard_count(self) -> int:
+        return len(self.specs)
+
+    def shard_for(self, user_id: int) -> int:
+        return shard_index_for(user_id, self.shard_count, self.buckets)
+
+    def session_for(self, user_id: int) -> AsyncSession:
+        return self._sessionmakers[self.shard_for(user_id)]()
+
+    def session_for_shard(self, index: int) -> AsyncSession:
+        return self._sessionmakers[index]()
+
+
+def _create_async_engine(spec: ShardSpec) -> AsyncEngine:
+    connect_args = {"server_settings": {"search_path": spec.schema}} if spec.schema else {}
+    return create_async_engine(
+        spec.url.replace("psycopg2", "asyncpg"),
+        future=True,
+        echo=False,
+        connect_args=connect_args,
+    )
+
+
+def create_sync_engine(spec: ShardSpec) -> Engine:
+    """Синхронный engine шарда для миграций и утилит обслуживания."""
+
+    connect_args = {"options": f"-csearch_path={spec.schema}"} if spec.schema else {}
+    return create_engine(spec.url.replace("asyncpg", "psycopg2"), future=True, connect_args=connect_args)
+
+
+def init_sequences(conn: Connection, shard_index: int, stride: int) -> Dict[str, int]:
+    """Перевести последовательности id шарда на шаг stride со смещением shard_index."""
+
+    if not 0 <= shard_index < stride:
+        raise ValueError("ORDER_SHARD_ID_STRIDE must be greater than the shard index")
+    restarted: Dict[str, int] = {}
+    for table in SEQUENCED_TABLES:
+        max_id = conn.execute(text(f"SELECT coalesce(max(id), 0) FROM {table}")).scalar_one()
+        start = (max_id // stride + 1) * stride + shard_index + 1
+        sequence = conn.execute(text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": table}).scalar_one()
+        conn.execute(text(f"ALTER SEQUENCE {sequence} INCREMENT BY {stride} RESTART WITH {start}"))
+        restarted[table] = start
+    return restarted
+
+
+def _users_on_shard(conn: Connection, tables: Dict[str, Table]) -> List[int]:
+    user_ids = set()
+    for name in ("carts", "orders", "order_idempotency_keys"):
+        user_ids.update(conn.execute(select(tables[name].c.user_id).distinct()).scalars().all())
+    return sorted(user_ids)
+
+
+def _copy_rows(source: Connection, target: Connection, table: Table, where) -> int:  # type: ignore[no-untyped-def]
+    rows = [dict(row) for row in source.execute(select(table).where(where)).mappings().all()]
+    if rows:
+        target.execute(insert(table).values(rows).on_conflict_do_nothing())
+    return len(rows)
+
+
+def move_user(source: Engine, target: Engine, tables: Dict[str, Table], user_id: int) -> int:
+    """Перенести все данные пользователя из source в target.
+
+    Строки копируются с исходными id (они уникальны во всём кластере),
+    поэтому повторный запуск после сбоя безопасен: дубликаты пропускаются.
+    """
+
+    carts, cart_items = tables["carts"], tables["cart_items"]
+    orders, order_items = tables["orders"], tables["order_items"]
+    keys = tables["order_idempotency_keys"]
+
+    cart_ids = select(carts.c.id).where(carts.c.user_id == user_id)
+    order_ids = select(orders.c.id).where(orders.c.user_id == user_id)
+
+    moved = 0
+    with source.connect() as src, target.begin() as dst:
+        moved += _copy_rows(src, dst, carts, carts.c.user_id == user_id)
+        moved += _copy_rows(src, dst, cart_items, cart_items.c.cart_id.in_(cart_ids))
+        moved += _copy_rows(src, dst, orders, orders.c.user_id == user_id)
+        moved += _copy_rows(src, dst, order_items, order_items.c.order_id.in_(order_ids))
+        moved += _copy_rows(src, dst, keys, keys.c.user_id == user_id)
+
+    with source.begin() as src:
+        src.execute(delete(keys).where(keys.c.user_id == user_id))
+        src.execute(delete(order_items).where(order_items.c.order_id.in_(order_ids)))
+        src.execute(delete(orders).where(orders.c.user_id == user_id))
+        src.execute(delete(cart_items).where(cart_items.c.cart_id.in_(cart_ids)))
+        src.execute(delete(carts).where(carts.c.user_id == user_id))
+    return moved
+
+
+def reshard(settings: Settings, from_shards: int, dry_run: bool = False) -> Dict[int, int]:
+    """Перенести пользователей со старой топологии (первые from_shards шардов) на текущую."""
+
+    from .models import Base
+
+    specs = shard_specs(settings)
+    if not 0 < from_shards <= len(specs):
+        raise ValueError("--from-shards must be between 1 and the number of configured shards")
+
+    tables = Base.metadata.tables
+    engines = [create_sync_engine(spec) for spec in specs]
+    moved_users: Dict[int, int] = {}
+    for source_index in range(from_shards):
+        with engines[source_index].connect() as conn:
+            user_ids = _users_on_shard(conn, tables)
+        for user_id in user_ids:
+            target_index = shard_index_for(user_id, len(specs), settings.order_shard_buckets)
+            if target_index == source_index:
+                continue
+            moved_users[target_index] = moved_users.get(target_index, 0) + 1
+            if dry_run:
+                continue
+            rows = move_user(engines[source_index], engines[target_index], tables, user_id)
+            logger.info("order_user_resharded", user_id=user_id, source=source_index, target=target_index, rows=rows)
+    return moved_users
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Шарды order-service")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("init-sequences", help="настроить шаг и смещение последовательностей id на шардах")
+
+    reshard_parser = sub.add_parser("reshard", help="перенести пользователей после добавления шардов")
+    reshard_parser.add_argument("--from-shards", type=int, required=True, help="количество шардов до изменения")
+    reshard_parser.add_argument("--dry-run", action="store_true")
+
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    if args.command == "init-sequences":
+        for spec in shard_specs(settings):
+            with create_sync_engine(spec).begin() as conn:
+                restarted = init_sequences(conn, spec.index, settings.order_shard_id_stride)
+            logger.info("order_shard_sequences_initialized", shard=spec.index, sequences=restarted)
+    else:
+        moved = reshard(settings, args.from_shards, dry_run=args.dry_run)
+        logger.info("order_reshard_finished", dry_run=args.dry_run, moved_users_by_target=moved)
+
+
+if __name__ == "__main__":
+    main()
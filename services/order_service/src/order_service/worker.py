@@ -0,0 +1,56 @@
+"""Процесс-воркер статусов заказов: consumer результатов резервирования без HTTP.
+
+HTTP-процессы запускаются с CONSUMERS_ENABLED=false, а очередь разбирают воркеры,
+которые масштабируются отдельно от API. Изменения статусов доходят до
+SSE-подписчиков HTTP-процессов через order.status.changed:
+
+    python -m order_service.worker --processes 2 --concurrency 4
+
+Метрики и /health/consumers процесса N — на порту WORKER_METRICS_PORT + N.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import functools
+from typing import Optional, Sequence
+
+from .config import get_settings
+from .core.logging import setup_logging
+from .core.worker import run_worker_processes, serve_consumers, start_metrics_server
+from .db import shard_router
+from .message_bus import OrderStatusConsumer
+
+
+async def _serve(concurrency: int) -> int:
+    try:
+        return await serve_consumers(OrderStatusConsumer, concurrency)
+    finally:
+        for engine in shard_router.engines:
+            await engine.dispose()
+
+
+def run(concurrency: int, metrics_port: int, index: int) -> int:
+    """Точка входа одного процесса-воркера."""
+
+    setup_logging()
+    settings = get_settings()
+    if metrics_port:
+        start_metrics_server(metrics_port + index, settings.consumer_stall_seconds)
+    return asyncio.run(_serve(concurrency))
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Воркер consumer-ов order-service")
+    parser.add_argument("--processes", type=int, default=settings.worker_processes)
+    parser.add_argument("--concurrency", type=int, default=settings.worker_concurrency, help="consumer-ов на процесс")
+    parser.add_argument("--metrics-port", type=int, default=settings.worker_metrics_port, help="0 — без /metrics")
+    args = parser.parse_args(argv)
+    target = functools.partial(run, args.concurrency, args.metrics_port)
+    raise SystemExit(run_worker_processes(target, args.processes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from order_service.main import app
+from order_service.pubsub import OrderStatusBroker
+from order_service.schemas import OrderStatusEvent
+
+
+client = TestClient(app)
+
+
+def test_orders_require_auth():
+    response = client.get("/orders")
+    assert response.status_code in (401, 403)
+
+
+def test_order_events_require_auth():
+    response = client.get("/orders/1/events")
+    assert response.status_code in (401, 403)
+
+
+def test_status_broker_keeps_latest_events_when_buffer_is_full():
+    async def scenario() -> None:
+        broker = OrderStatusBroker(queue_size=2)
+        subscription = broker.subscribe(10)
+        for status in ("created", "reserved", "reservation_failed"):
+            assert broker.publish(OrderStatusEvent(order_id=10, status=status)) == 1
+
+        assert subscription.dropped == 1
+        assert (await subscription.get(timeout=0.1)).status == "reserved"
+        assert (await subscription.get(timeout=0.1)).status == "reservation_failed"
+        assert await subscription.get(timeout=0.01) is None
+
+        broker.unsubscribe(subscription)
+        assert broker.subscriber_count() == 0
+        assert broker.publish(OrderStatusEvent(order_id=10, status="reserved")) == 0
+
+    asyncio.run(scenario())
+
+
+def test_idempotency_coordinator_runs_concurrent_duplicates_once():
+    from order_service.idempotency import IdempotencyCoordinator, TTLCache
+
+    calls = []
+
+    async def scenario() -> None:
+        coordinator = IdempotencyCoordinator(TTLCache(max_size=10, ttl_seconds=60))
+
+        async def load_stored():
+            return None
+
+        async def produce():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"id": 1, "status": "created"}, False
+
+        results = await asyncio.gather(
+            *(coordinator.run((1, "key-1"), load_stored, produce) for _ in range(5))
+        )
+        assert [replayed for _, replayed in results].count(False) == 1
+        assert all(data["id"] == 1 for data, _ in results)
+
+        data, replayed = await coordinator.run((1, "key-1"), load_stored, produce)
+        assert replayed and data["id"] == 1
+
+    asyncio.run(scenario())
+    assert len(calls) == 1
+
+
+def test_future_partitions_ddl_covers_months_ahead_across_year_boundary():
+    from datetime import date
+
+    from order_service.partitions import future_partitions_ddl, parse_partition_month
+
+    statements = future_partitions_ddl(date(2025, 11, 20), months_ahead=2)
+    assert statements[0].startswith("CREATE TABLE IF NOT EXISTS orders_p2025_11 PARTITION OF orders")
+    assert "FROM ('2026-01-01') TO ('2026-02-01')" in statements[-1]
+    assert statements[-1].startswith("CREATE TABLE IF NOT EXISTS order_items_p2026_01")
+    assert parse_partition_month("orders", "orders_p2026_01") == date(2026, 1, 1)
+    assert parse_partition_month("orders", "order_items_p2026_01") is None
+
+
+def test_archive_keeps_partition_attached_when_export_fails(monkeypatch, tmp_path):
+    from contextlib import contextmanager
+    from datetime import date
+
+    import pytest
+
+    from order_service import partitions
+
+    statements = []
+
+    class FakeEngine:
+        @contextmanager
+        def begin(self):
+            transaction = []
+            try:
+                yield type("Conn", (), {"execute": lambda conn, statement: transaction.append(str(statement))})()
+            except Exception:
+                statements.append(("rollback", transaction))
+                raise
+            statements.append(("commit", transaction))
+
+        connect = begin
+
+    monkeypatch.setattr(
+        partitions,
+        "_list_partitions",
+        lambda conn, table: [(date(2024, 1, 1), partitions.partition_name(table, date(2024, 1, 1)))],
+    )
+
+    def export_fails(conn, name, path):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(partitions, "_export_partition", export_fails)
+    with pytest.raises(OSError):
+        partitions.archive_old_partitions(FakeEngine(), 12, tmp_path, today=date(2025, 6, 1))
+    # Выгрузка упала до DETACH, транзакция откатилась — партиция осталась в таблице
+    (outcome, executed), = [entry for entry in statements if entry[1]]
+    assert outcome == "rollback" and not any("DETACH" in statement for statement in executed)
+
+    statements.clear()
+    monkeypatch.setattr(partitions, "_export_partition", lambda conn, name, path: path.write_bytes(b"csv"))
+    exported = partitions.archive_old_partitions(FakeEngine(), 12, tmp_path, today=date(2025, 6, 1))
+    assert [path.name for path in exported] == ["order_items_p2024_01.csv.gz", "orders_p2024_01.csv.gz"]
+    committed = [executed for outcome, executed in statements if outcome == "commit" and executed]
+    assert [executed[-2:] for executed in committed] == [
+        ["ALTER TABLE order_items DETACH PARTITION order_items_p2024_01", "DROP TABLE order_items_p2024_01"],
+        ["ALTER TABLE orders DETACH PARTITION orders_p2024_01", "DROP TABLE orders_p2024_01"],
+    ]
+
+
+def test_shard_routing_is_stable_and_uses_all_shards():
+    from order_service.sharding import shard_index_for
+
+    shards = [shard_index_for(user_id, shard_count=4, buckets=4096) for user_id in range(1, 1001)]
+    assert shards == [shard_index_for(user_id, shard_count=4, buckets=4096) for user_id in range(1, 1001)]
+    assert set(shards) == {0, 1, 2, 3}
+    assert all(shard_index_for(user_id, shard_count=1, buckets=4096) == 0 for user_id in range(1, 100))
+
+
+def test_http_client_opens_circuit_after_repeated_failures():
+    import httpx
+
+    from order_service.core.http_client import ResilientHttpClient, UpstreamPolicy, UpstreamUnavailable
+
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(503)
+
+    async def scenario() -> None:
+        http_client = ResilientHttpClient(transport=httpx.MockTransport(handler))
+        http_client.register(
+            "catalog",
+            "http://catalog",
+            UpstreamPolicy(max_retries=1, backoff_base=0, backoff_max=0, failure_threshold=2, reset_timeout=60),
+        )
+        response = await http_client.get("catalog", "/books/1")
+        assert response.status_code == 503
+        assert http_client.circuit_state("catalog") == "open"
+        try:
+            await http_client.get("catalog", "/books/1")
+        except UpstreamUnavailable as exc:
+            assert exc.reason == "circuit_open"
+        else:
+            raise AssertionError("circuit breaker did not reject the request")
+        await http_client.aclose()
+
+    asyncio.run(scenario())
+    assert len(calls) == 2
+    assert "X-Request-Deadline" in calls[0].headers
+
+
+def test_http_client_returns_server_error_when_retry_budget_is_spent():
+    import httpx
+
+    from order_service.core.http_client import ResilientHttpClient, RetryBudget, UpstreamPolicy, UpstreamUnavailable
+
+    responses = [httpx.Response(503), httpx.ConnectError("connection refused")]
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    async def scenario() -> None:
+        http_client = ResilientHttpClient(transport=httpx.MockTransport(handler))
+        http_client.register("catalog", "http://catalog", UpstreamPolicy(max_retries=2, backoff_base=0, backoff_max=0))
+        # Бюджет повторов исчерпан: клиент получает тот же 503, что и без повторов
+        http_client._upstreams["catalog"].budget = RetryBudget(ratio=0, min_tokens=0)
+        assert (await http_client.get("catalog", "/books/1")).status_code == 503
+
+        # Ответа не было вовсе — только тогда upstream недоступен
+        try:
+            await http_client.get("catalog", "/books/1")
+        except UpstreamUnavailable as exc:
+            assert exc.reason == "error" and isinstance(exc.__cause__, httpx.ConnectError)
+        else:
+            raise AssertionError("transport error was not reported")
+        await http_client.aclose()
+
+    asyncio.run(scenario())
+    assert responses == []
+
+
+def test_expired_deadline_is_rejected():
+    response = client.get("/health", headers={"X-Request-Deadline": "1000"})
+    assert response.status_code == 504
+    assert response.json()["error_code"] == "DEADLINE_EXCEEDED"
+
+
+def test_metrics_endpoint():
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+
+
+def test_verified_token_cache_drops_expired_and_least_recent_entries():
+    from order_service.security import VerifiedTokenCache
+
+    now = [100.0]
+    cache = VerifiedTokenCache(max_size=2, clock=lambda: now[0])
+    first, second, third = (cache.key(token) for token in ("a", "b", "c"))
+
+    cache.put(first, {"sub": "1", "exp": 200})
+    cache.put(second, {"sub": "2", "exp": 150})
+    cache.put(cache.key("no-exp"), {"sub": "3"})
+    assert len(cache) == 2
+
+    assert cache.get(first)["sub"] == "1"
+    cache.put(third, {"sub": "3", "exp": 200})
+    assert cache.get(second) is None
+
+    now[0] = 200.0
+    assert cache.get(first) is None
+
+
+def test_status_changes_are_delivered_to_local_subscribers():
+    from order_service.message_bus import deliver_order_status
+    from order_service.pubsub import get_order_status_broker
+
+    async def scenario() -> None:
+        broker = get_order_status_broker()
+        subscription = broker.subscribe(42)
+        deliver_order_status(42, "reserved")
+        assert (await subscription.get(timeout=0.1)).status == "reserved"
+        broker.unsubscribe(subscription)
+
+    asyncio.run(scenario())